@@ -11,10 +11,13 @@ type Props = {
 const AIEvent = ({ channelID }: Props) => {
     const [aiEvent, setAIEvent] = useState("")
     const [showAIEvent, setShowAIEvent] = useState(false)
+    // Whether the event is the partial response of the bot (streamed) or a status update
+    const [isStreaming, setIsStreaming] = useState(false)
 
     useFrappeEventListener("ai_event", (data) => {
         if (data.channel_id === channelID) {
             setAIEvent(data.text)
+            setIsStreaming(!!data.is_streaming)
             setShowAIEvent(true)
         }
     })
@@ -22,6 +25,7 @@ const AIEvent = ({ channelID }: Props) => {
     useFrappeEventListener("ai_event_clear", (data) => {
         if (data.channel_id === channelID) {
             setAIEvent("")
+            setIsStreaming(false)
         }
     })
 
@@ -40,7 +44,7 @@ const AIEvent = ({ channelID }: Props) => {
         )}>
             <div className="flex items-center gap-2 py-2 px-2 bg-white dark:bg-gray-2">
                 <Loader />
-                <Text size='2'>{aiEvent}</Text>
+                <Text size='2' className={clsx(isStreaming && 'whitespace-pre-wrap max-h-64 overflow-y-auto')}>{aiEvent}</Text>
             </div>
         </div>
     )
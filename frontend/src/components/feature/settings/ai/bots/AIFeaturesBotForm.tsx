@@ -237,6 +237,45 @@ const AIFeaturesBotForm = (props: Props) => {
                 </HelperText>
             </Stack>
 
+            <Stack maxWidth={'560px'}>
+                <Text as="label" size="2">
+                    <HStack align='center'>
+                        <Controller
+                            control={control}
+                            name='stream_response'
+                            render={({ field }) => (
+                                <Checkbox
+                                    checked={field.value ? true : false}
+                                    onCheckedChange={(v) => field.onChange(v ? 1 : 0)}
+                                />
+                            )} />
+                        <span>Stream Response</span>
+                    </HStack>
+                </Text>
+                <HelperText>
+                    If enabled, the response of the bot is shown as it is being generated instead of waiting for the full response.
+                </HelperText>
+            </Stack>
+
+            <Stack maxWidth={'480px'}>
+                <Box>
+                    <Label htmlFor='history_token_budget'>Conversation History Budget <Text as='span' color='gray' weight='regular'>(Tokens, Default: 4000)</Text></Label>
+                    <TextField.Root
+                        id='history_token_budget'
+                        type='number'
+                        min={0}
+                        {...register('history_token_budget', { valueAsNumber: true })}
+                        placeholder='4000'
+                        aria-invalid={errors.history_token_budget ? 'true' : 'false'}
+                    />
+                </Box>
+                {errors.history_token_budget && <ErrorText>{errors.history_token_budget?.message}</ErrorText>}
+                <HelperText>
+                    Maximum number of tokens of the previous messages in a thread that are sent to the model with every message.
+                    Older messages are summarized.
+                </HelperText>
+            </Stack>
+
             <HStack gap='8' align='start'>
                 <Stack maxWidth={'560px'}>
                     <HStack justify='between' align='center'>
@@ -149,6 +149,19 @@ export const useFetchUnreadMessageCount = () => {
         updateLastMessageInChannelList(event.channel_id, event.last_message_timestamp)
     })
 
+    useFrappeEventListener('raven:channels_marked_as_read', (event) => {
+        // All messages in these channels were marked as read (possibly from another device/tab)
+        updateCount(d => {
+            if (d) {
+                return {
+                    message: d.message.map(c => event.channel_ids.includes(c.name) ? { ...c, unread_count: 0 } : c)
+                }
+            } else {
+                return d
+            }
+        }, { revalidate: false })
+    })
+
     const updateUnreadCountToZero = (channel_id?: string) => {
 
         updateCount(d => {
@@ -34,6 +34,10 @@ export interface RavenBot{
 	temperature?: number
 	/**	Debug Mode : Check - If enabled, stack traces of errors will be sent as messages by the bot 	*/
 	debug_mode?: 0 | 1
+	/**	Stream Response : Check - Show the response of the bot as it is being generated instead of waiting for the full response	*/
+	stream_response?: 0 | 1
+	/**	Conversation History Budget (Tokens) : Int - Maximum number of tokens of the previous messages of the conversation sent to the model. Older messages are summarized.	*/
+	history_token_budget?: number
 	/**	Reasoning Effort : Select - Only applicable for OpenAI o-series models	*/
 	reasoning_effort?: "low" | "medium" | "high"
 	/**	Top P : Float - An alternative to sampling with temperature, called nucleus sampling, where the model considers the results of the tokens with top_p probability mass. So 0.1 means only the tokens comprising the top 10% probability mass are considered.
@@ -49,4 +49,8 @@ export interface RavenChannel{
 	openai_thread_id?: string
 	/**	Thread Bot : Link - Raven Bot	*/
 	thread_bot?: string
+	/**	Conversation Summary : Long Text - Summary of the older messages of the AI thread which do not fit in the conversation history sent to the bot	*/
+	ai_thread_summary?: string
+	/**	Summary Until : Datetime - Messages sent till this time are included in the conversation summary	*/
+	ai_thread_summary_until?: string
 }
\ No newline at end of file
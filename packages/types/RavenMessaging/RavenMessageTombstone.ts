@@ -0,0 +1,17 @@
+
+export interface RavenMessageTombstone{
+	creation: string
+	name: string
+	modified: string
+	owner: string
+	modified_by: string
+	docstatus: 0 | 1 | 2
+	parent?: string
+	parentfield?: string
+	parenttype?: string
+	idx?: number
+	/**	Message ID : Data	*/
+	message_id: string
+	/**	Channel ID : Link - Raven Channel	*/
+	channel_id: string
+}
@@ -6,6 +6,25 @@ export interface GetMessagesResponse {
         messages: Message[],
         has_old_messages: boolean
         has_new_messages: boolean
+        /** Opaque cursor to fetch messages older than this page */
+        older_cursor?: string | null
+        /** Opaque cursor to fetch messages newer than this page */
+        newer_cursor?: string | null
+    }
+}
+
+/** Response from the get_channel_changes endpoint in chat_stream */
+export interface GetChannelChangesResponse {
+    message: {
+        /** Messages created/edited/reacted to since the last sync - ordered by modified */
+        messages: Message[],
+        /** IDs of messages deleted since the last sync */
+        deleted_messages: string[],
+        has_more: boolean,
+        /** Cursor to pass to the next call */
+        cursor: string | null,
+        /** Changes could not be computed - the channel should be refetched */
+        full_refresh_required: boolean
     }
 }
 
@@ -3,6 +3,9 @@ Improved agents integration with better import handling based on Desktop Raven a
 """
 
 import asyncio
+import re
+import threading
+import time
 import traceback
 
 import frappe
@@ -18,8 +21,16 @@ from agents import (
 	set_default_openai_client,
 )
 from frappe import _
-from openai import AsyncOpenAI
 
+from .circuit_breaker import (
+	CLOSED,
+	OPEN,
+	acquire_probe,
+	get_circuit_state,
+	is_provider_error,
+	record_failure,
+	record_success,
+)
 from .functions import (
 	cancel_document,
 	create_document,
@@ -29,6 +40,17 @@ from .functions import (
 	submit_document,
 	update_document,
 )
+from .openai_client import get_async_openai_client
+from .retrieval import create_file_search_tool
+
+# Long-lived event loop of each worker thread - see `get_event_loop`
+_thread_local = threading.local()
+
+# Tools and agents built for a bot, per (site, bot name) - see `RavenAgentManager._setup_tools`
+_bot_cache = {}
+
+# Minimum interval (in seconds) between two updates of a streamed response sent to the client
+STREAM_PUBLISH_INTERVAL = 0.3
 
 
 class RavenAgentManager:
@@ -36,67 +58,45 @@ class RavenAgentManager:
 
 	def __init__(self, bot_doc, file_handler=None):
 		self.bot_doc = bot_doc
-		self.settings = frappe.get_single("Raven Settings")
+		self.settings = frappe.get_cached_doc("Raven Settings")
 		self.file_handler = file_handler
 		self._setup_client()
 		self._setup_tools()
 
 	def _setup_client(self):
 		"""Configure OpenAI client based on provider"""
-		if self.bot_doc.model_provider == "Local LLM" and self.settings.enable_local_llm:
-			# Client for local LLM
-			if not self.settings.local_llm_api_url:
-				frappe.throw(_("Local LLM API URL is not configured in Raven Settings"))
-
-			client = AsyncOpenAI(
-				api_key="not-needed",  # LM Studio doesn't require API key
-				base_url=self.settings.local_llm_api_url,
-			)
-		elif self.bot_doc.model_provider == "Azure AI" and self.settings.enable_azure_ai:
-			# Client for Azure AI using old AzureOpenAI approach
-			azure_api_key = self.settings.get_password("azure_api_key")
-			azure_endpoint = (self.settings.azure_endpoint or "").strip()
-			azure_deployment_name = (self.settings.azure_deployment_name or "").strip()
-			
-			# Debug logging to compare with test settings
-			frappe.logger().info(f"Agent Azure Config - Endpoint: {azure_endpoint}, Deployment: {azure_deployment_name}, API Key: {'Set' if azure_api_key else 'Not Set'}")
-
-			if not azure_api_key:
-				frappe.throw(_("Azure API key is not configured in Raven Settings"))
-			if not azure_endpoint:
-				frappe.throw(_("Azure endpoint is not configured in Raven Settings"))
-			if not azure_deployment_name:
-				frappe.throw(_("Azure deployment name is not configured in Raven Settings"))
-
-			# Use the AsyncAzureOpenAI client for async operations
-			from openai import AsyncAzureOpenAI
-			
-			# Get the configured API version
-			azure_api_version = (self.settings.azure_api_version or "2024-02-15-preview").strip()
-			
-			client = AsyncAzureOpenAI(
-				api_key=azure_api_key,
-				api_version=azure_api_version,
-				azure_endpoint=azure_endpoint,
-			)
-		else:
-			# Standard OpenAI client
-			api_key = self.settings.get_password("openai_api_key")
-			if not api_key:
-				frappe.throw(_("OpenAI API key is not configured in Raven Settings"))
-
-			client = AsyncOpenAI(
-				api_key=api_key,
-				organization=self.settings.openai_organisation_id,
-				project=self.settings.openai_project_id if self.settings.openai_project_id else None,
-			)
+		# Clients are pooled per worker so that connections are reused across messages
+		client = get_async_openai_client(self.bot_doc.model_provider)
 
 		# Set default client for SDK
 		set_default_openai_client(client)
 		self.client = client
 
+	async def _check_api_availability(self) -> bool:
+		"""
+		Check the circuit breaker of the provider before running the agent.
+
+		The provider is only probed when the circuit is half open - failures of real calls are recorded by the caller.
+		"""
+		provider = self.bot_doc.model_provider
+		state = get_circuit_state(provider)
+
+		if state == CLOSED:
+			return True
+
+		# Circuit is open, or another worker is already probing the provider
+		if state == OPEN or not acquire_probe(provider):
+			return False
+
+		if await self._test_api_connection():
+			record_success(provider)
+			return True
+
+		record_failure(provider)
+		return False
+
 	async def _test_api_connection(self):
-		"""Test API connection before creating agent"""
+		"""Probe the API connection when the circuit breaker is half open"""
 		try:
 			# For Azure AI, use deployment name as model parameter
 			if self.bot_doc.model_provider == "Azure AI":
@@ -123,15 +123,48 @@ class RavenAgentManager:
 			return False
 
 	def _setup_tools(self):
+		"""
+		Set up the tools of the bot.
+
+		Building the tools reads every Raven AI Function and imports its function, hence they are cached in the process
+		per bot and rebuilt only if the bot, its functions or Raven Settings were modified.
+		"""
+		cache_key = (frappe.local.site, self.bot_doc.name)
+		revision = get_bot_revision(self.bot_doc, self.settings)
+
+		self._cache_entry = _bot_cache.get(cache_key)
+
+		if not self._cache_entry or self._cache_entry["revision"] != revision:
+			self._cache_entry = {"revision": revision, "tools": self._build_tools(), "agent": None}
+			_bot_cache[cache_key] = self._cache_entry
+
+		self.tools = list(self._cache_entry["tools"])
+
+		# Conversation files are specific to this request, hence this tool is never cached
+		self._has_request_tools = False
+		if self.file_handler and self.file_handler.conversation_files:
+			conversation_file_tool = self.file_handler.create_file_analysis_tool()
+			if conversation_file_tool:
+				self.tools.append(conversation_file_tool)
+				self._has_request_tools = True
+
+		# All files uploaded in the thread can be searched with the local index - not just the latest ones
+		if self.file_handler and frappe.db.exists(
+			"Raven Message", {"channel_id": self.file_handler.channel_id, "message_type": "File"}
+		):
+			self.tools.append(create_file_search_tool("thread", self.file_handler.channel_id))
+			self._has_request_tools = True
+
+	def _build_tools(self) -> list:
 		"""Create SDK Tools from existing functions"""
-		self.tools = []
+		tools = []
 
 		try:
 			from raven.ai.sdk_tools import create_raven_tools
 
 			raven_tools = create_raven_tools(self.bot_doc)
 			if raven_tools:
-				self.tools.extend(raven_tools)
+				tools.extend(raven_tools)
 		except Exception as e:
 			frappe.log_error(
 				f"Error loading Raven AI Functions: {str(e)}\n{traceback.format_exc()}",
@@ -139,6 +172,7 @@ class RavenAgentManager:
 			)
 
 		# Add file search tool if enabled for OpenAI or Azure AI
+		file_search_tool = None
 		if (
 			hasattr(self.bot_doc, "enable_file_search")
 			and self.bot_doc.enable_file_search
@@ -150,13 +184,17 @@ class RavenAgentManager:
 				# We'll create a custom tool that can access uploaded files
 				file_search_tool = self._create_file_search_tool()
 				if file_search_tool:
-					self.tools.append(file_search_tool)
+					tools.append(file_search_tool)
 			except Exception as e:
 				frappe.log_error(
 					f"Error creating file search tool: {str(e)}\n{traceback.format_exc()}",
 					"File Search Tool Error",
 				)
 
+		# Bots without a vector store (for eg. Local LLMs) search their files with the local index
+		if self.bot_doc.get("enable_file_search") and self.bot_doc.file_sources and not file_search_tool:
+			tools.append(create_file_search_tool("bot", self.bot_doc.name))
+
 		# Add Code Interpreter tool if enabled
 		if hasattr(self.bot_doc, "enable_code_interpreter") and self.bot_doc.enable_code_interpreter:
 			try:
@@ -165,16 +203,13 @@ class RavenAgentManager:
 					tool_config={"type": "code_interpreter", "container": {"type": "auto"}}
 				)
 
-				self.tools.append(code_interpreter_tool)
+				tools.append(code_interpreter_tool)
 			except Exception as e:
 				frappe.log_error(
 					f"Error adding Code Interpreter: {str(e)}\n{traceback.format_exc()}", "Code Interpreter Error"
 				)
 
-		if self.file_handler and self.file_handler.conversation_files:
-			conversation_file_tool = self.file_handler.create_file_analysis_tool()
-			if conversation_file_tool:
-				self.tools.append(conversation_file_tool)
+		return tools
 
 	def _create_crud_tools(self) -> list[Tool]:
 		"""Wrap CRUD functions as OpenAI Agents Tools"""
@@ -374,6 +409,12 @@ class RavenAgentManager:
 		if not self.bot_doc.model:
 			frappe.throw(_("Bot model is not configured"))
 
+		# The agent can be reused across requests if it does not depend on the user or the conversation
+		is_cacheable = not self.bot_doc.dynamic_instructions and not self._has_request_tools
+
+		if is_cacheable and self._cache_entry["agent"]:
+			return self._cache_entry["agent"]
+
 		# Dynamic instructions if needed
 		instructions = self.bot_doc.instruction
 		if self.bot_doc.dynamic_instructions:
@@ -444,20 +485,60 @@ CRITICAL INSTRUCTIONS FOR TOOL USE:
 		if not hasattr(agent, "tools") or agent.tools is None:
 			agent.tools = []
 
+		if is_cacheable:
+			self._cache_entry["agent"] = agent
+
 		return agent
 
 
+def get_bot_revision(bot_doc, settings) -> tuple:
+	"""
+	Revision of the tools and agent of a bot - changes whenever the bot, one of its functions or Raven Settings are modified
+	"""
+	function_names = [f.function for f in bot_doc.bot_functions]
+
+	functions = []
+	if function_names:
+		functions = frappe.get_all(
+			"Raven AI Function",
+			filters={"name": ["in", function_names]},
+			fields=["name", "modified"],
+			order_by="name asc",
+		)
+
+	return (
+		str(bot_doc.modified),
+		str(settings.modified),
+		tuple((f.name, str(f.modified)) for f in functions),
+	)
+
+
+def clear_bot_cache(bot_name: str = None):
+	"""
+	Evict the cached tools and agent of a bot (or all bots) of the current site from this process.
+	Other processes rebuild them on their next request since the revision of the bot changes.
+	"""
+	for site, name in list(_bot_cache):
+		if site == frappe.local.site and (not bot_name or name == bot_name):
+			_bot_cache.pop((site, name), None)
+
+
 # Async handler function that can be called from sync context
 async def handle_ai_request_async(
-	bot, message: str, channel_id: str, conversation_history: list = None, file_handler=None
+	bot,
+	message: str,
+	channel_id: str,
+	conversation_history: list = None,
+	file_handler=None,
+	conversation_summary: str = None,
 ):
 	"""Handle AI request asynchronously"""
 	try:
 
 		manager = RavenAgentManager(bot, file_handler=file_handler)
 
-		# Test API connection first
-		if not await manager._test_api_connection():
+		# Fail fast if the provider is known to be unavailable
+		if not await manager._check_api_availability():
 			return {
 				"response": "I'm having trouble connecting to the AI service. Please check the configuration and try again.",
 				"success": False,
@@ -495,19 +576,8 @@ async def handle_ai_request_async(
 		if has_files_in_conversation:
 			full_input = message
 		else:
-			full_input = message
-			if conversation_history:
-				# Only include the last few messages to avoid confusion
-				recent_history = (
-					conversation_history[-3:] if len(conversation_history) > 3 else conversation_history
-				)
-				context_messages = []
-				for msg in recent_history:
-					role = "Assistant" if msg["role"] == "assistant" else "User"
-					# Truncate long messages
-					content = msg["content"][:200] + "..." if len(msg["content"]) > 200 else msg["content"]
-					context_messages.append(f"{role}: {content}")
-				full_input = "\n\n".join(context_messages) + f"\n\nUser: {message}"
+			# The history is already limited to the token budget of the bot - older messages are part of the summary
+			full_input = get_input_messages(message, conversation_history, conversation_summary)
 
 		# Context for the agent
 		context = {
@@ -521,7 +591,10 @@ async def handle_ai_request_async(
 		try:
 			# Use Runner.run as a static method (not an instance)
 			# Set max_turns to prevent infinite loops
-			result = await Runner.run(agent, full_input, max_turns=5)
+			if bot.stream_response:
+				result = await run_agent_streamed(agent, full_input, channel_id, bot)
+			else:
+				result = await Runner.run(agent, full_input, max_turns=5)
 
 		except TypeError as te:
 			if "NoneType" in str(te) and "not iterable" in str(te):
@@ -556,18 +629,11 @@ async def handle_ai_request_async(
 
 					# Build messages array with proper conversation history
 					messages = [{"role": "system", "content": enhanced_instructions}]
-
-					# Add conversation history as separate messages
-					if conversation_history:
-						for msg in conversation_history:
-							messages.append({"role": msg["role"], "content": msg["content"]})
-
-					# Add current user message
-					messages.append({"role": "user", "content": message})
+					messages.extend(get_input_messages(message, conversation_history, conversation_summary))
 
 					# Create the API call with or without tools
 					# For Azure AI, use deployment name as model parameter
-					model_param = self.settings.azure_deployment_name if bot.model_provider == "Azure AI" else bot.model
+					model_param = manager.settings.azure_deployment_name if bot.model_provider == "Azure AI" else bot.model
 					
 					api_params = {
 						"model": model_param,
@@ -589,32 +655,35 @@ async def handle_ai_request_async(
 
 						# Check if the response contains tool calls
 						if hasattr(choice.message, "tool_calls") and choice.message.tool_calls:
-							# Execute tool calls
-							tool_results = []
-							for tool_call in choice.message.tool_calls:
-								tool_name = tool_call.function.name
-								tool_args = tool_call.function.arguments
-
-								# Truncate args for title to avoid length error
-								args_preview = tool_args[:50] + "..." if len(tool_args) > 50 else tool_args
-
-								# Find the tool in manager.tools
-								tool_result = None
-								for tool in manager.tools:
-									if tool.name == tool_name:
-										# Execute the tool
-										tool_result = await tool.on_invoke_tool(None, tool_args)
-										break
-
-								if tool_result:
-									tool_results.append({"tool_call_id": tool_call.id, "output": tool_result})
+							# Execute tool calls concurrently - read only tools run in threads (see tool_executor)
+							tools_by_name = {tool.name: tool for tool in manager.tools}
+							tool_calls = [
+								tool_call
+								for tool_call in choice.message.tool_calls
+								if tool_call.function.name in tools_by_name
+							]
+
+							outputs = await asyncio.gather(
+								*(
+									tools_by_name[tool_call.function.name].on_invoke_tool(
+										None, tool_call.function.arguments
+									)
+									for tool_call in tool_calls
+								)
+							)
+
+							tool_results = [
+								{"tool_call_id": tool_call.id, "output": output}
+								for tool_call, output in zip(tool_calls, outputs)
+								if output
+							]
 
 							# If we have tool results, make another API call with the results
 							if tool_results:
 								# Add assistant message with tool calls
 								messages = [
 									{"role": "system", "content": agent.instructions},
-									{"role": "user", "content": full_input},
+									*messages[1:],
 									choice.message.model_dump(),
 								]
 
@@ -665,6 +734,8 @@ async def handle_ai_request_async(
 			else:
 				raise
 
+		record_success(bot.model_provider)
+
 		# Format the response if not already formatted
 		from raven.ai.response_formatter import format_ai_response
 
@@ -683,6 +754,9 @@ async def handle_ai_request_async(
 	except Exception as e:
 		import traceback
 
+		if is_provider_error(e):
+			record_failure(bot.model_provider)
+
 		error_details = traceback.format_exc()
 		frappe.log_error(f"AI Agent Error: {str(e)}\n\nTraceback:\n{error_details}", "Raven AI")
 
@@ -693,15 +767,114 @@ async def handle_ai_request_async(
 		}
 
 
+async def run_agent_streamed(agent: Agent, agent_input: str | list, channel_id: str, bot):
+	"""
+	Run the agent with the streamed runner and publish the response on the `ai_event` channel as it is generated.
+
+	Updates are throttled to a few per second. The final response is sent as a message by the caller once the run is complete.
+	"""
+	from openai.types.responses import ResponseTextDeltaEvent
+
+	result = Runner.run_streamed(agent, agent_input, max_turns=5)
+
+	text = ""
+	last_published_at = 0
+
+	async for event in result.stream_events():
+		if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+			text += event.data.delta
+
+			now = time.monotonic()
+			if now - last_published_at >= STREAM_PUBLISH_INTERVAL:
+				publish_streamed_response(channel_id, bot, get_visible_text(text))
+				last_published_at = now
+
+		elif event.type == "run_item_stream_event" and event.item.type == "tool_call_item":
+			# Any text before a tool call is not part of the final response
+			text = ""
+			publish_streamed_response(channel_id, bot, "Eden AI is using tools...", is_streaming=False)
+
+	return result
+
+
+def get_visible_text(text: str) -> str:
+	"""
+	Hide the reasoning of the model (<think> tags) from a partial response
+	"""
+	text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+
+	# Reasoning which is still being generated
+	if "<think>" in text:
+		text = text.split("<think>", 1)[0]
+
+	return text.strip()
+
+
+def publish_streamed_response(channel_id: str, bot, text: str, is_streaming: bool = True):
+	if not text:
+		return
+
+	frappe.publish_realtime(
+		"ai_event",
+		{
+			"text": text,
+			"channel_id": channel_id,
+			"bot": bot.name,
+			"is_streaming": is_streaming,
+		},
+		doctype="Raven Channel",
+		docname=channel_id,
+	)
+
+
 def handle_ai_request_sync(
-	bot, message: str, channel_id: str, conversation_history: list = None, file_handler=None
+	bot,
+	message: str,
+	channel_id: str,
+	conversation_history: list = None,
+	file_handler=None,
+	conversation_summary: str = None,
 ):
 	"""Synchronous wrapper for async AI request handling"""
-	loop = asyncio.new_event_loop()
-	asyncio.set_event_loop(loop)
-	try:
-		return loop.run_until_complete(
-			handle_ai_request_async(bot, message, channel_id, conversation_history, file_handler)
+	loop = get_event_loop()
+	return loop.run_until_complete(
+		handle_ai_request_async(
+			bot, message, channel_id, conversation_history, file_handler, conversation_summary
+		)
+	)
+
+
+def get_input_messages(message: str, conversation_history: list = None, conversation_summary: str = None):
+	"""
+	Input messages for the model - the summary of older messages, the recent history and the current message
+	"""
+	messages = []
+
+	if conversation_summary:
+		messages.append(
+			{"role": "system", "content": f"Summary of the earlier conversation:\n{conversation_summary}"}
 		)
-	finally:
-		loop.close()
+
+	for msg in conversation_history or []:
+		messages.append({"role": msg["role"], "content": msg["content"]})
+
+	messages.append({"role": "user", "content": message})
+
+	return messages
+
+
+def get_event_loop():
+	"""
+	Get the event loop of the current worker thread.
+
+	The loop is kept alive across requests (instead of creating and closing one per message)
+	so that the pooled async clients and their open connections can be reused.
+	"""
+	loop = getattr(_thread_local, "loop", None)
+
+	if loop is None or loop.is_closed():
+		loop = asyncio.new_event_loop()
+		_thread_local.loop = loop
+
+	asyncio.set_event_loop(loop)
+	return loop
@@ -3,6 +3,7 @@ import frappe
 # Import agents integration - no fallback needed
 from raven.ai.agents_integration import handle_ai_request_sync
 from raven.ai.google_ai import run_document_ai_processor
+from raven.ai.history import build_conversation_history, enqueue_summary_update
 
 # Keep old handler import for fallback
 from raven.ai.handler import stream_response
@@ -193,14 +194,15 @@ def handle_bot_dm_with_assistants(message, bot):
 	stream_response(ai_thread_id=ai_thread.id, bot=bot, channel_id=thread_channel.name)
 
 
-def handle_ai_thread_message(message, channel):
+def handle_ai_thread_message(message, channel, bot=None):
 	"""
 	Function to handle messages in an AI thread.
 
 	Routes to Agents SDK for bots with model_provider, falls back to Assistants API for legacy bots.
 	"""
 
-	bot = frappe.get_cached_doc("Raven Bot", channel.thread_bot)
+	if not bot:
+		bot = frappe.get_cached_doc("Raven Bot", channel.thread_bot)
 
 	# Check if bot uses new Agents SDK
 	if bot.model_provider in ["OpenAI", "Azure AI", "Local LLM"] and not bot.openai_assistant_id:
@@ -397,47 +399,16 @@ def process_message_with_agent(
 			file_prefix = f"[User uploaded a {'file' if recent_file_message.message_type == 'File' else 'image'}: {file_url}]\n"
 			content = file_prefix + content
 
-	# Get conversation history if this is an existing thread
+	# Get conversation history (within the token budget of the bot) if this is an existing thread
 	conversation_history = []
+	conversation_summary = None
 	if not is_new_conversation and channel:
-		# Fetch previous messages from the channel
-		messages = frappe.get_all(
-			"Raven Message",
-			filters={"channel_id": channel.name},
-			fields=[
-				"text",
-				"content",
-				"owner",
-				"creation",
-				"bot",
-				"message_type",
-				"file",
-				"is_bot_message",
-			],
-			order_by="creation asc",
-			limit=20,  # Limit to last 20 messages for context
-		)
+		history = build_conversation_history(channel.name, message, bot)
+		conversation_history = history.messages
+		conversation_summary = history.summary
 
-		for msg in messages[:-1]:  # Exclude the current message
-			# Use text field which contains the actual message content
-			msg_text = msg.text or msg.content or ""
-
-			if msg.bot or msg.is_bot_message:
-				conversation_history.append({"role": "assistant", "content": msg_text})
-			else:
-				if msg.message_type in ["File", "Image"]:
-					# DON'T add historical files - only the current message file should be analyzed
-					# Just add a reference to the file in conversation history
-
-					file_url = msg.file.split("?fid=")[0] if "fid" in msg.file else msg.file
-					msg_content = (
-						f"[User uploaded a {'file' if msg.message_type == 'File' else 'image'}: {file_url}]"
-					)
-					if msg_text:
-						msg_content += f"\n{msg_text}"
-					conversation_history.append({"role": "user", "content": msg_content})
-				else:
-					conversation_history.append({"role": "user", "content": msg_text})
+		# Older messages which do not fit in the budget are summarized in the background
+		enqueue_summary_update(channel.name, bot, history)
 
 	# Use the improved sync handler
 	try:
@@ -448,6 +419,7 @@ def process_message_with_agent(
 			channel_id=channel_id,
 			conversation_history=conversation_history,
 			file_handler=file_handler,
+			conversation_summary=conversation_summary,
 		)
 
 		if response["success"]:
@@ -0,0 +1,81 @@
+"""
+Circuit breaker for the AI providers, shared by all workers of a site via Redis.
+
+- Closed: the provider is healthy and requests go through without any extra round trip.
+- Open: requests failed repeatedly - they are rejected immediately until the cool down is over.
+- Half open: after the cool down, a single worker probes the provider. Success closes the circuit, failure opens it again.
+"""
+
+import frappe
+from openai import APIConnectionError, AuthenticationError, InternalServerError
+
+CLOSED = "Closed"
+OPEN = "Open"
+HALF_OPEN = "Half Open"
+
+# Number of failed calls (within the failure window) after which the circuit is opened
+FAILURE_THRESHOLD = 3
+# Failures older than this (in seconds) are forgotten - i.e. the provider is considered healthy again
+FAILURE_WINDOW = 300
+# Time (in seconds) for which requests are rejected before the provider is probed again
+OPEN_TIMEOUT = 30
+# Time (in seconds) after which another worker may probe if the probing worker did not report back
+PROBE_TIMEOUT = 30
+
+# Errors which mean that the provider is unreachable or misconfigured (as opposed to a bad request)
+PROVIDER_ERRORS = (APIConnectionError, AuthenticationError, InternalServerError)
+
+
+def get_key(name: str, suffix: str) -> str:
+	# Raw redis commands are used for the counters, hence the keys are prefixed with the site name
+	return frappe.cache().make_key(f"raven:ai_circuit:{name}:{suffix}")
+
+
+def get_circuit_state(name: str) -> str:
+	"""
+	Get the state of the circuit of a provider
+	"""
+	cache = frappe.cache()
+
+	if cache.get(get_key(name, "open")):
+		return OPEN
+
+	failures = int(cache.get(get_key(name, "failures")) or 0)
+	if failures >= FAILURE_THRESHOLD:
+		return HALF_OPEN
+
+	return CLOSED
+
+
+def acquire_probe(name: str) -> bool:
+	"""
+	Only one worker probes a half open circuit - returns True if the current worker should probe
+	"""
+	return bool(frappe.cache().set(get_key(name, "probe"), 1, nx=True, ex=PROBE_TIMEOUT))
+
+
+def record_success(name: str):
+	"""
+	Close the circuit after a successful call to the provider
+	"""
+	pipe = frappe.cache().pipeline()
+	pipe.delete(get_key(name, "failures"), get_key(name, "open"), get_key(name, "probe"))
+	pipe.execute()
+
+
+def record_failure(name: str):
+	"""
+	Count a failed call to the provider and open the circuit if the threshold is reached
+	"""
+	pipe = frappe.cache().pipeline()
+	pipe.incr(get_key(name, "failures"))
+	pipe.expire(get_key(name, "failures"), FAILURE_WINDOW)
+	pipe.delete(get_key(name, "probe"))
+	failures = pipe.execute()[0]
+
+	if failures >= FAILURE_THRESHOLD:
+		frappe.cache().set(get_key(name, "open"), 1, ex=OPEN_TIMEOUT)
+
+
+def is_provider_error(error: Exception) -> bool:
+	return isinstance(error, PROVIDER_ERRORS)
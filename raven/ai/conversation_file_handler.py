@@ -3,9 +3,28 @@ Handler for files uploaded during conversations
 """
 
 import frappe
-import pypdf
 from agents import FunctionTool
 
+from raven.ai.file_extraction import (
+	SPREADSHEET_FILE_TYPES,
+	get_extracted_content,
+	get_extraction,
+	get_file_type,
+	get_pdf_pages,
+	is_error,
+	is_extractable,
+	normalize_file_path,
+	rank_pages,
+)
+from raven.ai.spreadsheets import DEFAULT_ROW_LIMIT, MAX_ROW_LIMIT, get_rows
+
+# Number of pages of a PDF returned for a query if no pages are requested
+DEFAULT_TOP_K_PAGES = 3
+# Maximum number of pages of a PDF returned in a single call
+MAX_PAGES_PER_CALL = 10
+# Maximum number of characters of PDF pages returned in a single call (shared by the returned pages)
+MAX_PDF_RESULT_CHARS = 12000
+
 
 class ConversationFileHandler:
 	"""Handles files uploaded during conversations for SDK Agents"""
@@ -36,6 +55,7 @@ class ConversationFileHandler:
 							"file_path": file_path,
 							"file_name": getattr(file_doc, "file_name", "Unknown"),
 							"file_type": self._get_file_type(file_doc),
+							"content_hash": file_doc.content_hash,
 							"message_id": message.name,
 							"uploaded_at": message.creation,
 						}
@@ -50,22 +70,35 @@ class ConversationFileHandler:
 
 	def _get_file_type(self, file_doc) -> str:
 		"""Determine file type from extension"""
-		file_name = getattr(file_doc, "file_name", "")
-		ext = file_name.lower().split(".")[-1] if "." in file_name else ""
-		return ext
+		return get_file_type(getattr(file_doc, "file_name", ""))
 
 	def create_file_analysis_tool(self) -> FunctionTool | None:
 		"""Create a tool to analyze files in current conversation"""
 		if not self.conversation_files:
 			return None
 
-		def analyze_conversation_file(query: str, file_name: str | None = None) -> dict:
+		def analyze_conversation_file(
+			query: str,
+			file_name: str | None = None,
+			pages: list[int] | None = None,
+			top_k: int | None = None,
+			sheet: str | None = None,
+			start_row: int | None = None,
+			row_limit: int | None = None,
+			filters: dict | None = None,
+		) -> dict:
 			"""
 			Analyze files uploaded in this conversation
 
 			Args:
 			    query: What to look for or analyze in the files
 			    file_name: Optional specific file to analyze
+			    pages: Optional page numbers of a PDF to return
+			    top_k: Number of pages of a PDF most relevant to the query to return (if no pages are given)
+			    sheet: Sheet of a spreadsheet to read rows from
+			    start_row: Index of the first row of a spreadsheet to return
+			    row_limit: Number of rows of a spreadsheet to return
+			    filters: Column -> value to filter the rows of a spreadsheet
 
 			Returns:
 			    Analysis results
@@ -95,39 +128,42 @@ class ConversationFileHandler:
 					file_path = file_info["file_path"]
 					file_type = file_info["file_type"]
 
-					# Extract content based on file type
-					content = ""
 					if file_type == "pdf":
-						content = self._extract_pdf_content(file_path)
-					elif file_type in ["txt", "md", "json"]:
-						with open(file_path, encoding="utf-8") as f:
-							content = f.read()
+						results.append(
+							{
+								"file_name": file_info["file_name"],
+								"file_type": file_type,
+								"file_path": file_path,
+								**self._get_pdf_result(file_info, query, pages, top_k),
+							}
+						)
+						continue
+
+					if file_type in SPREADSHEET_FILE_TYPES:
+						results.append(
+							{
+								"file_name": file_info["file_name"],
+								"file_type": file_type,
+								"file_path": file_path,
+								**self._get_spreadsheet_result(file_info, sheet, start_row, row_limit, filters),
+							}
+						)
+						continue
+
+					# Extract content based on file type - extractions are cached by the hash of the file content
+					content = ""
+					if is_extractable(file_type):
+						content = get_extracted_content(file_path, file_type, file_info.get("content_hash"))
 					elif file_type in ["jpg", "jpeg", "png", "gif"]:
 						content = f"[Image file: {file_info['file_name']}]"
-					elif file_type in ["xlsx", "xls", "csv"]:
-						content = self._convert_spreadsheet_to_markdown(file_path, file_type)
 					else:
 						content = f"[File type {file_type}: {file_info['file_name']}]"
 
 					# Build generic result
 					result = {"file_name": file_info["file_name"], "file_type": file_type, "file_path": file_path}
 
-					# Add content based on file type
-					if file_type in ["xlsx", "xls", "csv"]:
-						if content and not content.startswith("Error"):
-							result["content"] = content
-							result["analysis"] = "Spreadsheet content converted to markdown for analysis"
-						else:
-							result["analysis"] = (
-								content if content.startswith("Error") else "Unable to read spreadsheet"
-							)
-							result["note"] = "Failed to convert spreadsheet to readable format"
-					elif file_type == "pdf" and content and not content.startswith("Error"):
-						result["content_preview"] = content[:1000] + "..." if len(content) > 1000 else content
-						result["analysis"] = "PDF content extracted successfully"
-					else:
-						result["content_preview"] = content[:1000] + "..." if len(content) > 1000 else content
-						result["analysis"] = "File ready for analysis"
+					result["content_preview"] = content[:1000] + "..." if len(content) > 1000 else content
+					result["analysis"] = "File ready for analysis"
 
 					results.append(result)
 
@@ -152,7 +188,14 @@ class ConversationFileHandler:
 			try:
 				params = json_module.loads(json_str) if json_str else {}
 				result = analyze_conversation_file(
-					query=params.get("query", ""), file_name=params.get("file_name", None)
+					query=params.get("query", ""),
+					file_name=params.get("file_name", None),
+					pages=params.get("pages", None),
+					top_k=params.get("top_k", None),
+					sheet=params.get("sheet", None),
+					start_row=params.get("start_row", None),
+					row_limit=params.get("row_limit", None),
+					filters=params.get("filters", None),
 				)
 				return result
 			except Exception as e:
@@ -167,7 +210,7 @@ class ConversationFileHandler:
 		# Create the tool
 		tool = FunctionTool(
 			name="analyze_conversation_file",
-			description="Analyze files uploaded in this conversation. Use this to extract information from PDFs, invoices, documents etc. that were just shared.",
+			description="Analyze files uploaded in this conversation. Use this to extract information from PDFs, invoices, documents etc. that were just shared. For PDFs, the pages most relevant to the query are returned - ask for specific pages to read further. For spreadsheets, a summary of the columns is returned - ask for rows (with filters) to read the data.",
 			params_json_schema={
 				"type": "object",
 				"properties": {
@@ -176,6 +219,31 @@ class ConversationFileHandler:
 						"description": "What to analyze or extract from the files (e.g., 'invoice amount', 'summary', 'key points')",
 					},
 					"file_name": {"type": "string", "description": "Optional: specific file name to analyze"},
+					"pages": {
+						"type": "array",
+						"items": {"type": "integer"},
+						"description": f"Optional: page numbers of a PDF to read (starting from 1, at most {MAX_PAGES_PER_CALL})",
+					},
+					"top_k": {
+						"type": "integer",
+						"description": f"Optional: number of PDF pages most relevant to the query to return (default {DEFAULT_TOP_K_PAGES})",
+					},
+					"sheet": {
+						"type": "string",
+						"description": "Optional: name of the sheet of a spreadsheet to read rows from (default: first sheet)",
+					},
+					"start_row": {
+						"type": "integer",
+						"description": "Optional: index (from 0) of the first spreadsheet row to return, among the rows matching the filters",
+					},
+					"row_limit": {
+						"type": "integer",
+						"description": f"Optional: number of spreadsheet rows to return (default {DEFAULT_ROW_LIMIT}, at most {MAX_ROW_LIMIT})",
+					},
+					"filters": {
+						"type": "object",
+						"description": "Optional: only return spreadsheet rows where the column contains the value, e.g. {\"Status\": \"Paid\"}",
+					},
 				},
 				"required": ["query"],
 			},
@@ -185,31 +253,93 @@ class ConversationFileHandler:
 
 		return tool
 
-	def _extract_pdf_content(self, file_path: str) -> str:
-		"""Extract text content from PDF"""
+	def _get_pdf_result(
+		self, file_info: dict, query: str, pages: list[int] | None = None, top_k: int | None = None
+	) -> dict:
+		"""
+		Get the requested pages of a PDF - or the pages most relevant to the query - within the character budget
+		"""
+		page_numbers = sorted({int(page) for page in pages or []})[:MAX_PAGES_PER_CALL]
+
 		try:
-			if file_path.startswith("./"):
-				file_path = file_path[2:]
-				if not file_path.startswith("/"):
-					file_path = "/" + file_path
-
-			text = ""
-			with open(file_path, "rb") as file:
-				pdf_reader = pypdf.PdfReader(file)
-				for page in pdf_reader.pages:
-					text += page.extract_text() + "\n"
-
-			return text
-		except Exception as e:
-			file_name = file_path.split("/")[-1] if "/" in file_path else file_path
-			frappe.log_error(
-				f"Error reading PDF:\n"
-				f"File: {file_name}\n"
-				f"Error: {str(e)}\n"
-				f"Type: {type(e).__name__}",
-				"PDF Read Error",
+			page_count, page_texts = get_pdf_pages(
+				file_info["file_path"], file_info.get("content_hash"), page_numbers
 			)
-			return f"Error reading PDF: {str(e)}"
+		except Exception as e:
+			return {
+				"analysis": f"Error reading PDF: {str(e)}",
+				"note": "Failed to extract the content of the PDF",
+			}
+
+		if page_numbers:
+			selected = sorted(page_texts)
+			analysis = "Requested pages of the PDF"
+		else:
+			top_k = min(top_k or DEFAULT_TOP_K_PAGES, MAX_PAGES_PER_CALL)
+			selected = sorted(rank_pages(page_texts, query, top_k))
+			analysis = "Pages of the PDF most relevant to the query"
+
+			if not selected:
+				selected = sorted(page_texts)[:top_k]
+				analysis = "No pages matched the query - first pages of the PDF"
+
+		max_chars = MAX_PDF_RESULT_CHARS // max(len(selected), 1)
+
+		return {
+			"page_count": page_count,
+			"pages": [
+				{
+					"page": page_number,
+					"content": page_texts[page_number][:max_chars] + "..."
+					if len(page_texts[page_number]) > max_chars
+					else page_texts[page_number],
+				}
+				for page_number in selected
+			],
+			"analysis": f"{analysis} ({', '.join(str(page) for page in selected) or 'none'} of {page_count})",
+		}
+
+	def _get_spreadsheet_result(
+		self,
+		file_info: dict,
+		sheet: str | None = None,
+		start_row: int | None = None,
+		row_limit: int | None = None,
+		filters: dict | None = None,
+	) -> dict:
+		"""
+		Get the summary of a spreadsheet - or a window of its rows if rows are requested
+		"""
+		file_path = normalize_file_path(file_info["file_path"])
+
+		try:
+			if sheet or start_row is not None or row_limit or filters:
+				rows = get_rows(
+					file_path,
+					file_info["file_type"],
+					sheet=sheet,
+					start_row=start_row,
+					limit=row_limit,
+					filters=filters,
+				)
+
+				if rows.get("error"):
+					return {"analysis": rows["error"], "sheets": rows["sheets"]}
+
+				return {**rows, "analysis": "Requested rows of the spreadsheet"}
+
+			extraction = get_extraction(file_path, file_info["file_type"], file_info.get("content_hash"))
+		except Exception as e:
+			extraction = {"content": f"Error reading spreadsheet: {str(e)}"}
+
+		if is_error(extraction):
+			return {"analysis": extraction["content"], "note": "Failed to read the spreadsheet"}
+
+		return {
+			"sheets": [summary["sheet"] for summary in extraction["sheets"]],
+			"content": extraction["content"],
+			"analysis": "Summary of the columns of the spreadsheet - request rows (with filters) to read the data",
+		}
 
 	def _extract_invoice_info(self, content: str) -> dict:
 		"""Extract key invoice information from content"""
@@ -257,41 +387,3 @@ class ConversationFileHandler:
 				info["summary"] += f" for invoice #{info['invoice_number']}"
 
 		return info
-
-	def _convert_spreadsheet_to_markdown(self, file_path: str, file_type: str) -> str:
-		"""Convert spreadsheet to markdown format for better AI readability"""
-		try:
-			try:
-				from markitdown import MarkItDown
-
-				md = MarkItDown()
-				result = md.convert(file_path)
-				if result and result.text_content:
-					return result.text_content
-			except ImportError:
-				pass
-
-			import pandas as pd
-
-			if file_type == "csv":
-				df = pd.read_csv(file_path)
-				return df.to_markdown(index=False)
-			else:
-				excel_file = pd.ExcelFile(file_path)
-				markdown_parts = []
-
-				if len(excel_file.sheet_names) > 1:
-					for sheet_name in excel_file.sheet_names:
-						df = pd.read_excel(file_path, sheet_name=sheet_name)
-						markdown_parts.append(f"## Sheet: {sheet_name}\n")
-						markdown_parts.append(df.to_markdown(index=False))
-						markdown_parts.append("\n")
-					return "\n".join(markdown_parts)
-				else:
-					df = pd.read_excel(file_path)
-					return df.to_markdown(index=False)
-
-		except ImportError as e:
-			return f"Error: Required library not installed. Please install markitdown or pandas: {str(e)}"
-		except Exception as e:
-			return f"Error converting spreadsheet to markdown: {str(e)}"
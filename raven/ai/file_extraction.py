@@ -0,0 +1,322 @@
+"""
+Extraction of text from files uploaded in AI conversations.
+
+Extracted content is cached on disk (in the private files of the site), keyed by the hash of the file content.
+The same upload is parsed only once and the extraction is reused by all bots and threads - and across turns.
+Files uploaded in conversations with AI bots are extracted in the background right after the upload,
+so that the extraction is usually ready by the time the user asks about the file.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+
+import frappe
+import pypdf
+
+from raven.ai.spreadsheets import get_summary_markdown, summarize_spreadsheet
+
+# Bump this when the output of the extractors changes, so that older extractions are not used anymore
+EXTRACTION_VERSION = 4
+
+EXTRACTION_FOLDER = "raven_ai_extractions"
+
+# Extractions which were not written for this many days are deleted by a daily job (they are extracted again if needed)
+EXTRACTION_RETENTION_DAYS = 30
+
+TEXT_FILE_TYPES = ("txt", "md", "json")
+SPREADSHEET_FILE_TYPES = ("xlsx", "xls", "csv")
+
+EXTRACTION_QUEUE = "default"
+
+
+def get_file_type(file_name: str) -> str:
+	"""Determine file type from extension"""
+	return file_name.lower().split(".")[-1] if file_name and "." in file_name else ""
+
+
+def is_extractable(file_type: str) -> bool:
+	return file_type == "pdf" or file_type in TEXT_FILE_TYPES or file_type in SPREADSHEET_FILE_TYPES
+
+
+def enqueue_file_extraction(file_doc):
+	"""
+	Extract an uploaded file in the background (after the upload is committed)
+	"""
+	if not is_extractable(get_file_type(file_doc.file_name)):
+		return
+
+	frappe.enqueue(
+		"raven.ai.file_extraction.extract_file",
+		queue=EXTRACTION_QUEUE,
+		job_id=f"raven_ai_file_extraction:{frappe.local.site}:{file_doc.content_hash or file_doc.name}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		file_name=file_doc.name,
+	)
+
+
+def extract_file(file_name: str):
+	"""
+	Background job to extract a File and cache the extraction
+	"""
+	file_doc = frappe.get_doc("File", file_name)
+
+	get_extraction(file_doc.get_full_path(), get_file_type(file_doc.file_name), file_doc.content_hash)
+
+
+def get_file_hash(file_path: str) -> str:
+	# Same hash as the content_hash of File documents
+	file_hash = hashlib.md5()
+
+	with open(file_path, "rb") as f:
+		for block in iter(lambda: f.read(1024 * 1024), b""):
+			file_hash.update(block)
+
+	return file_hash.hexdigest()
+
+
+def get_extraction_path(content_hash: str) -> str:
+	folder = frappe.get_site_path("private", EXTRACTION_FOLDER)
+	os.makedirs(folder, exist_ok=True)
+
+	return os.path.join(folder, f"{content_hash}-v{EXTRACTION_VERSION}.json")
+
+
+def get_extraction(file_path: str, file_type: str, content_hash: str | None = None) -> dict:
+	"""
+	Get the extraction of a file from the cache - or extract the file and cache it.
+
+	Returns a dict with the `content_hash` of the file, `metadata` about the file and the text of the file:
+	the text of each page in `pages` for PDFs, else the text in `content`.
+	For spreadsheets, `sheets` has the summary of each sheet (and `content` the summary as markdown) - rows are read
+	on demand with `raven.ai.spreadsheets.get_rows`.
+	If extraction failed, `content` starts with "Error" and nothing is cached.
+	"""
+	file_path = normalize_file_path(file_path)
+	content_hash = content_hash or get_file_hash(file_path)
+	cache_path = get_extraction_path(content_hash)
+
+	extraction = load_extraction(cache_path)
+
+	if extraction:
+		return extraction
+
+	extraction = {"content_hash": content_hash, "file_type": file_type}
+
+	if file_type == "pdf":
+		try:
+			extraction["pages"] = [text for _page, text in iter_pdf_pages(file_path)]
+		except Exception as e:
+			log_pdf_error(file_path, e)
+			extraction["content"] = f"Error reading PDF: {str(e)}"
+	elif file_type in SPREADSHEET_FILE_TYPES:
+		try:
+			extraction["sheets"] = summarize_spreadsheet(file_path, file_type)
+			extraction["content"] = get_summary_markdown(extraction["sheets"])
+		except Exception as e:
+			extraction["content"] = f"Error reading spreadsheet: {str(e)}"
+	else:
+		extraction["content"] = extract_content(file_path, file_type)
+
+	extraction["metadata"] = {
+		"file_size": os.path.getsize(file_path),
+		"characters": sum(len(page) for page in extraction["pages"])
+		if "pages" in extraction
+		else len(extraction["content"]),
+		"page_count": len(extraction["pages"]) if "pages" in extraction else None,
+		"extracted_at": frappe.utils.now(),
+	}
+
+	if not is_error(extraction):
+		write_json_file(cache_path, extraction)
+
+	return extraction
+
+
+def get_content(extraction: dict) -> str:
+	if "pages" in extraction:
+		return "\n".join(extraction["pages"])
+
+	return extraction.get("content", "")
+
+
+def is_error(extraction: dict) -> bool:
+	return "pages" not in extraction and extraction.get("content", "").startswith("Error")
+
+
+def get_extracted_content(file_path: str, file_type: str, content_hash: str | None = None) -> str:
+	return get_content(get_extraction(file_path, file_type, content_hash))
+
+
+def load_extraction(cache_path: str) -> dict | None:
+	if not os.path.exists(cache_path):
+		return None
+
+	try:
+		with open(cache_path, encoding="utf-8") as f:
+			return json.load(f)
+	except ValueError:
+		# Partially written or corrupt cache file - extract again
+		return None
+
+
+def write_json_file(path: str, data: dict):
+	# Write to a temporary file and rename it, so that concurrent readers never see a partial file
+	temp_path = f"{path}.{frappe.generate_hash(length=8)}.tmp"
+
+	with open(temp_path, "w", encoding="utf-8") as f:
+		json.dump(data, f)
+
+	os.replace(temp_path, path)
+
+
+def delete_old_extractions():
+	"""
+	Daily job to delete extractions older than EXTRACTION_RETENTION_DAYS
+	"""
+	delete_old_files(EXTRACTION_FOLDER)
+
+
+def delete_old_files(folder_name: str):
+	"""
+	Delete files in a folder of the private files which were not written for EXTRACTION_RETENTION_DAYS
+	"""
+	folder = frappe.get_site_path("private", folder_name)
+
+	if not os.path.exists(folder):
+		return
+
+	cutoff = time.time() - EXTRACTION_RETENTION_DAYS * 24 * 60 * 60
+
+	for entry in os.scandir(folder):
+		if entry.is_file() and entry.stat().st_mtime < cutoff:
+			os.remove(entry.path)
+
+
+def normalize_file_path(file_path: str) -> str:
+	if file_path.startswith("./"):
+		file_path = file_path[2:]
+		if not file_path.startswith("/"):
+			file_path = "/" + file_path
+
+	return file_path
+
+
+def extract_content(file_path: str, file_type: str) -> str:
+	"""
+	Extract the text content of a text file (PDFs and spreadsheets are extracted by `get_extraction`)
+	"""
+	if file_type in TEXT_FILE_TYPES:
+		try:
+			# Text files are not always UTF-8 - undecodable characters are replaced instead of failing the extraction
+			with open(file_path, encoding="utf-8", errors="replace") as f:
+				return f.read()
+		except OSError as e:
+			return f"Error reading file: {str(e)}"
+
+	return ""
+
+
+def iter_pdf_pages(file_path: str, page_numbers: list[int] | None = None):
+	"""
+	Lazily extract the text of the pages of a PDF - yields (page number, text).
+	If page numbers (starting from 1) are given, only those pages are parsed.
+	"""
+	with open(file_path, "rb") as file:
+		pdf_reader = pypdf.PdfReader(file)
+		page_count = len(pdf_reader.pages)
+
+		if page_numbers is None:
+			page_numbers = range(1, page_count + 1)
+
+		for page_number in page_numbers:
+			if 0 < page_number <= page_count:
+				yield page_number, pdf_reader.pages[page_number - 1].extract_text() or ""
+
+
+def get_pdf_page_count(file_path: str) -> int:
+	with open(file_path, "rb") as file:
+		return len(pypdf.PdfReader(file).pages)
+
+
+def get_pdf_pages(file_path: str, content_hash: str | None = None, page_numbers: list[int] | None = None):
+	"""
+	Get the text of the pages of a PDF. Returns (page count, {page number: text}).
+
+	The cached extraction is used if available. Otherwise, if specific pages are requested, only those pages are parsed
+	(the full extraction is cached by the background job), else the whole PDF is extracted and cached.
+	"""
+	file_path = normalize_file_path(file_path)
+
+	if page_numbers:
+		extraction = load_extraction(get_extraction_path(content_hash or get_file_hash(file_path)))
+
+		if not extraction:
+			return get_pdf_page_count(file_path), dict(iter_pdf_pages(file_path, page_numbers))
+	else:
+		extraction = get_extraction(file_path, "pdf", content_hash)
+
+	if is_error(extraction):
+		raise Exception(extraction["content"])
+
+	pages = extraction["pages"]
+
+	if not page_numbers:
+		page_numbers = range(1, len(pages) + 1)
+
+	return len(pages), {
+		page_number: pages[page_number - 1]
+		for page_number in page_numbers
+		if 0 < page_number <= len(pages)
+	}
+
+
+def log_pdf_error(file_path: str, error: Exception):
+	file_name = file_path.split("/")[-1] if "/" in file_path else file_path
+	frappe.log_error(
+		f"Error reading PDF:\n"
+		f"File: {file_name}\n"
+		f"Error: {str(error)}\n"
+		f"Type: {type(error).__name__}",
+		"PDF Read Error",
+	)
+
+
+def tokenize(text: str) -> list[str]:
+	return [token for token in re.findall(r"\w+", text.lower()) if len(token) > 1]
+
+
+def rank_pages(pages: dict, query: str, top_k: int) -> list[int]:
+	"""
+	Get the numbers of the top_k pages most relevant to the query.
+
+	Pages are scored by the occurrences of the query terms, weighted by how rare the terms are in the document (TF-IDF).
+	Pages without any of the query terms are left out.
+	"""
+	terms = set(tokenize(query))
+
+	if not terms:
+		return []
+
+	page_terms = {page_number: Counter(tokenize(text)) for page_number, text in pages.items()}
+	document_frequency = Counter(term for counts in page_terms.values() for term in terms if term in counts)
+
+	scores = []
+	for page_number, counts in page_terms.items():
+		score = sum(
+			(1 + math.log(counts[term])) * math.log(1 + len(pages) / document_frequency[term])
+			for term in terms
+			if counts[term]
+		)
+
+		if score:
+			scores.append((score, page_number))
+
+	scores.sort(key=lambda score: (-score[0], score[1]))
+
+	return [page_number for _score, page_number in scores[:top_k]]
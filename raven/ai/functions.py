@@ -13,29 +13,125 @@ def get_document(doctype: str, document_id: str):
 def get_documents(doctype: str, document_ids: list):
 	"""
 	Get documents from the database
+
+	The parent rows are fetched with a single query (with permissions applied) and the child tables with one query per table,
+	instead of loading every document separately. Document and field level read permissions are applied on each document.
+	Documents which cannot be fetched are returned with an error in their place.
 	"""
+	document_ids = list(dict.fromkeys(document_ids or []))
+
+	if not document_ids:
+		return []
+
+	rows = {
+		row.name: row
+		for row in frappe.get_list(
+			doctype, filters={"name": ["in", document_ids]}, fields=["*"], limit_page_length=0
+		)
+	}
+
+	# get_list only applies the permission query conditions - the document level checks
+	# (has_permission hooks and controller permissions) are run on each document
+	for document_id, row in list(rows.items()):
+		if not frappe.has_permission(doctype, "read", doc=frappe.get_doc({**row, "doctype": doctype})):
+			del rows[document_id]
+
+	children = get_child_table_rows(doctype, list(rows))
+
+	missing = [document_id for document_id in document_ids if document_id not in rows]
+	# Documents which exist but were not returned by get_list (or failed the checks above) are not permitted for the user
+	existing = set(frappe.get_all(doctype, filters={"name": ["in", missing]}, pluck="name")) if missing else set()
+
 	docs = []
 	for document_id in document_ids:
-		# Use the frappe.client.get method to get the document with permissions applied
-		docs.append(client.get(doctype, name=document_id))
+		if document_id not in rows:
+			docs.append(
+				{
+					"document_id": document_id,
+					"error": _("Not permitted to read {0} {1}").format(doctype, document_id)
+					if document_id in existing
+					else _("{0} {1} not found").format(doctype, document_id),
+				}
+			)
+			continue
+
+		doc = frappe.get_doc({**rows[document_id], **children.get(document_id, {}), "doctype": doctype})
+		doc.apply_fieldlevel_read_permissions()
+		docs.append(doc.as_dict())
+
 	return docs
 
 
+def get_child_table_rows(doctype: str, document_ids: list) -> dict:
+	"""
+	Get the rows of all child tables of the given documents - one query per table.
+
+	Returns a dict of document ID -> {table fieldname: [rows]}
+	"""
+	children = {}
+
+	if not document_ids:
+		return children
+
+	for df in frappe.get_meta(doctype).get_table_fields():
+		rows = frappe.get_all(
+			df.options,
+			filters={"parent": ["in", document_ids], "parenttype": doctype, "parentfield": df.fieldname},
+			fields=["*"],
+			order_by="idx asc",
+		)
+
+		for row in rows:
+			children.setdefault(row.parent, {}).setdefault(df.fieldname, []).append(row)
+
+	return children
+
+
+def run_for_each(items: list, method) -> tuple[list, list]:
+	"""
+	Run the method for each item in its own savepoint, so that a failing item does not abort the other items.
+
+	Returns the results of the successful items and the errors of the failed ones (with the index of the item).
+	"""
+	results = []
+	errors = []
+
+	for index, item in enumerate(items):
+		savepoint = f"raven_ai_item_{index}"
+		frappe.db.savepoint(savepoint)
+
+		try:
+			results.append(method(item))
+		except Exception as e:
+			frappe.db.rollback(save_point=savepoint)
+			errors.append({"index": index, "error": str(e) or e.__class__.__name__})
+
+	return results, errors
+
+
+def set_default_values(data: dict, function=None):
+	"""
+	Set the default values of the function parameters on the data
+	"""
+	if not function:
+		return
+
+	for param in function.parameters:
+		if param.default_value:
+			# Check if this value was not to be asked by the AI
+			if param.do_not_ask_ai:
+				data[param.fieldname] = param.default_value
+
+			# Check if the value was not provided
+			if not data.get(param.fieldname):
+				data[param.fieldname] = param.default_value
+
+
 def create_document(doctype: str, data: dict, function=None):
 	"""
 	Create a document in the database
 	"""
-	if function:
-		# Get any default values
-		for param in function.parameters:
-			if param.default_value:
-				# Check if this value was not to be asked by the AI
-				if param.do_not_ask_ai:
-					data[param.fieldname] = param.default_value
-
-				# Check if the value was not provided
-				if not data.get(param.fieldname):
-					data[param.fieldname] = param.default_value
+	set_default_values(data, function)
 
 	doc = frappe.get_doc({"doctype": doctype, **data})
 	doc.insert()
@@ -44,30 +140,20 @@ def create_document(doctype: str, data: dict, function=None):
 
 def create_documents(doctype: str, data: list, function=None):
 	"""
-	Create documents in the database
+	Create documents in the database. Documents which fail are skipped and reported with their index in `errors`.
 	"""
-	docs = []
-	for item in data:
-		docs.append(create_document(doctype, item, function).get("document_id"))
+	docs, errors = run_for_each(
+		data or [], lambda item: create_document(doctype, item, function).get("document_id")
+	)
 
-	return {"documents": docs, "message": "Documents created", "doctype": doctype}
+	return {"documents": docs, "errors": errors, "message": "Documents created", "doctype": doctype}
 
 
 def update_document(doctype: str, document_id: str, data: dict, function=None):
 	"""
 	Update a document in the database
 	"""
-	if function:
-		# Get any default values
-		for param in function.parameters:
-			if param.default_value:
-				# Check if this value was not to be asked by the AI
-				if param.do_not_ask_ai:
-					data[param.fieldname] = param.default_value
-
-				# Check if the value was not provided
-				if not data.get(param.fieldname):
-					data[param.fieldname] = param.default_value
+	set_default_values(data, function)
 
 	doc = frappe.get_doc(doctype, document_id)
 	doc.update(data)
@@ -77,17 +163,26 @@ def update_document(doctype: str, document_id: str, data: dict, function=None):
 
 def update_documents(doctype: str, data: dict, function=None):
 	"""
-	Update documents in the database
+	Update documents in the database. Documents which fail are skipped and reported in `errors`.
 	"""
-	updated_docs = []
-	for document in data:
+
+	def update(document):
 		document_without_id = document.copy()
 		document_id = document_without_id.pop("document_id")
-		updated_docs.append(
-			update_document(doctype, document_id, document_without_id, function).get("document_id")
-		)
+		return update_document(doctype, document_id, document_without_id, function).get("document_id")
+
+	data = data or []
+	updated_docs, errors = run_for_each(data, update)
+
+	for error in errors:
+		error["document_id"] = data[error.pop("index")].get("document_id")
 
-	return {"document_ids": updated_docs, "message": "Documents updated", "doctype": doctype}
+	return {
+		"document_ids": updated_docs,
+		"errors": errors,
+		"message": "Documents updated",
+		"doctype": doctype,
+	}
 
 
 def delete_document(doctype: str, document_id: str):
@@ -100,11 +195,36 @@ def delete_document(doctype: str, document_id: str):
 
 def delete_documents(doctype: str, document_ids: list):
 	"""
-	Delete documents from the database
+	Delete documents from the database. Documents which fail are skipped and reported in `errors`.
 	"""
-	for document_id in document_ids:
+	document_ids = list(dict.fromkeys(document_ids or []))
+
+	# Check which documents exist with a single query instead of failing on each missing one
+	existing = set(frappe.get_all(doctype, filters={"name": ["in", document_ids]}, pluck="name"))
+
+	errors = [
+		{"document_id": document_id, "error": _("{0} {1} not found").format(doctype, document_id)}
+		for document_id in document_ids
+		if document_id not in existing
+	]
+
+	to_delete = [document_id for document_id in document_ids if document_id in existing]
+
+	def delete(document_id):
 		frappe.delete_doc(doctype, document_id)
-	return {"document_ids": document_ids, "message": "Documents deleted", "doctype": doctype}
+		return document_id
+
+	deleted, delete_errors = run_for_each(to_delete, delete)
+
+	for error in delete_errors:
+		error["document_id"] = to_delete[error.pop("index")]
+
+	return {
+		"document_ids": deleted,
+		"errors": errors + delete_errors,
+		"message": "Documents deleted",
+		"doctype": doctype,
+	}
 
 
 def submit_document(doctype: str, document_id: str):
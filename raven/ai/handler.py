@@ -25,6 +25,8 @@ from raven.ai.functions import (
 	update_documents,
 )
 from raven.ai.openai_client import get_open_ai_client
+from raven.ai.tool_cache import get_cached_result, get_referenced_doctype
+from raven.ai.tool_executor import execute_tool_calls, is_read_only_function
 
 
 def stream_response(ai_thread_id: str, bot, channel_id: str):
@@ -158,188 +160,207 @@ def stream_response(ai_thread_id: str, bot, channel_id: str):
 
 		def handle_requires_action(self, data, run_id):
 			tool_outputs = []
+			tool_calls = []
+			functions = {}
 
 			for tool in data.required_action.submit_tool_outputs.tool_calls:
-
-				function = None
-
 				try:
-					function = frappe.get_cached_doc("Raven AI Function", tool.function.name)
+					functions[tool.id] = frappe.get_cached_doc("Raven AI Function", tool.function.name)
+					tool_calls.append(tool)
 				except frappe.DoesNotExistError:
 					tool_outputs.append({"tool_call_id": tool.id, "output": "Function not found"})
-					return
 
-				# When calling the function, we need to pass the arguments as named params/json
-				# Args is a dictionary of the form {"param_name": "param_value"}
+			# Read only functions are run in parallel, functions which can write are run one after the other
+			results = execute_tool_calls(
+				tool_calls,
+				is_read_only=lambda tool: is_read_only_function(functions[tool.id].type),
+				execute=lambda tool: self.run_cached_function(functions[tool.id], tool, run_id),
+			)
 
-				try:
-					args = json.loads(tool.function.arguments)
-
-					# Check the type of function and then call it accordingly
-
-					function_output = {}
-
-					if function.type == "Custom Function":
-						function_name = frappe.get_attr(function.function_path)
-
-						if bot.allow_bot_to_write_documents:
-							# We can commit to the database if writes are allowed
-							if function.pass_parameters_as_json:
-								function_output = function_name(args)
-							else:
-								function_output = function_name(**args)
-						else:
-							# We need to savepoint and then rollback
-							frappe.db.savepoint(run_id + "_" + tool.id)
-							if function.pass_parameters_as_json:
-								function_output = function_name(args)
-							else:
-								function_output = function_name(**args)
-							frappe.db.rollback(save_point=run_id + "_" + tool.id)
-
-					if function.type == "Get Document":
-						self.publish_event(
-							"Fetching {} {}...".format(function.reference_doctype, args.get("document_id"))
-						)
-						function_output = get_document(function.reference_doctype, **args)
-
-					if function.type == "Get Multiple Documents":
-						self.publish_event(f"Fetching multiple {function.reference_doctype}s...")
-						function_output = get_documents(function.reference_doctype, **args)
-
-					if function.type == "Submit Document":
-						self.publish_event(f"Submitting {function.reference_doctype} {args.get('document_id')}...")
-						function_output = submit_document(function.reference_doctype, **args)
-
-					if function.type == "Cancel Document":
-						self.publish_event(f"Cancelling {function.reference_doctype} {args.get('document_id')}...")
-						function_output = cancel_document(function.reference_doctype, **args)
-
-					if function.type == "Get Amended Document":
-						self.publish_event(
-							f"Fetching amended document for {function.reference_doctype} {args.get('document_id')}..."
-						)
-						function_output = get_amended_document(function.reference_doctype, **args)
-
-					if function.type == "Delete Document":
-						self.publish_event(
-							"Deleting {} {}...".format(function.reference_doctype, args.get("document_id"))
-						)
-						function_output = delete_document(function.reference_doctype, **args)
-
-					if function.type == "Delete Multiple Documents":
-						self.publish_event(f"Deleting multiple {function.reference_doctype}s...")
-						function_output = delete_documents(function.reference_doctype, **args)
-
-					if function.type == "Create Document":
-						self.publish_event(f"Creating {function.reference_doctype}...")
-						function_output = create_document(function.reference_doctype, data=args, function=function)
-
-						docs_updated.append(
-							{"doctype": function.reference_doctype, "document_id": function_output.get("document_id")}
-						)
-
-					if function.type == "Create Multiple Documents":
-						self.publish_event(f"Creating multiple {function.reference_doctype}s...")
-						function_output = create_documents(
-							function.reference_doctype, data=args.get("data"), function=function
-						)
-
-						for doc_id in function_output.get("documents"):
-							docs_updated.append({"doctype": function.reference_doctype, "document_id": doc_id})
-
-					if function.type == "Update Document":
-						self.publish_event(f"Updating {function.reference_doctype}...")
-						function_output = update_document(
-							function.reference_doctype,
-							document_id=args.get("document_id"),
-							data=args,
-							function=function,
-						)
-
-						docs_updated.append(
-							{"doctype": function.reference_doctype, "document_id": args.get("document_id")}
-						)
-
-					if function.type == "Update Multiple Documents":
-						self.publish_event(f"Updating multiple {function.reference_doctype}s...")
-						function_output = update_documents(
-							function.reference_doctype, data=args.get("data"), function=function
-						)
-
-						for doc_id in function_output.get("documents"):
-							docs_updated.append({"doctype": function.reference_doctype, "document_id": doc_id})
-
-					if function.type == "Attach File to Document":
-						doctype = args.get("doctype")
-						document_id = args.get("document_id")
-						file_path = args.get("file_path")
-						self.publish_event(f"Attaching file to {doctype} {document_id}...")
-						function_output = attach_file_to_document(doctype, document_id, file_path)
-
-					if function.type == "Get List":
-						self.publish_event(f"Fetching list of {function.reference_doctype}...")
-						function_output = get_list(
-							function.reference_doctype,
-							filters=args.get("filters"),
-							fields=args.get("fields"),
-							limit=args.get("limit", 20),
-						)
-
-					if function.type == "Get Value":
-						self.publish_event(f"Fetching value for {function.reference_doctype}...")
-						function_output = get_value(
-							doctype=function.reference_doctype,
-							filters=args.get("filters"),
-							fieldname=args.get("fieldname"),
-						)
-
-					if function.type == "Set Value":
-						self.publish_event(f"Setting value for {function.reference_doctype}...")
-						function_output = set_value(
-							doctype=function.reference_doctype,
-							document_id=args.get("document_id"),
-							fieldname=args.get("fieldname"),
-							value=args.get("value"),
-						)
-
-					if function.type == "Get Report Result":
-						self.publish_event(f"Running report {args.get('report_name')}...")
-						function_output = get_report_result(
-							report_name=args.get("report_name"),
-							filters=args.get("filters"),
-							user=args.get("user", frappe.session.user),
-							ignore_prepared_report=args.get("ignore_prepared_report", False),
-							are_default_filters=args.get("are_default_filters", True),
-						)
+			for tool, (function_output, error) in zip(tool_calls, results):
+				if not error:
 					tool_outputs.append(
 						{"tool_call_id": tool.id, "output": json.dumps(function_output, default=str)}
 					)
+					continue
 
-				except Exception as e:
-					frappe.log_error("Raven AI Error", frappe.get_traceback())
+				frappe.log_error("Raven AI Error", error)
 
-					if bot.debug_mode:
-						bot.send_message(
-							channel_id=channel_id,
-							text=f"<details data-summary='Error in function call'><p>{frappe.get_traceback()}</p></details>",
-						)
-					tool_outputs.append(
-						{
-							"tool_call_id": tool.id,
-							"output": json.dumps(
-								{
-									"message": "There was an error in the function call",
-									"error": frappe.get_traceback(),
-								},
-								default=str,
-							),
-						}
+				if bot.debug_mode:
+					bot.send_message(
+						channel_id=channel_id,
+						text=f"<details data-summary='Error in function call'><p>{error}</p></details>",
 					)
+				tool_outputs.append(
+					{
+						"tool_call_id": tool.id,
+						"output": json.dumps(
+							{
+								"message": "There was an error in the function call",
+								"error": error,
+							},
+							default=str,
+						),
+					}
+				)
 
 			# Submit all tool_outputs at the same time
 			self.submit_tool_outputs(tool_outputs, run_id)
 
+		def run_cached_function(self, function, tool, run_id):
+			# Results of read-only functions are cached across turns (see tool_cache)
+			args = json.loads(tool.function.arguments)
+			return get_cached_result(
+				function.type,
+				function.name,
+				get_referenced_doctype(function.type, function.reference_doctype, args),
+				args,
+				lambda: self.run_function(function, tool, run_id),
+			)
+
+		def run_function(self, function, tool, run_id):
+			# When calling the function, we need to pass the arguments as named params/json
+			# Args is a dictionary of the form {"param_name": "param_value"}
+			args = json.loads(tool.function.arguments)
+
+			# Check the type of function and then call it accordingly
+			function_output = {}
+
+			if function.type == "Custom Function":
+				function_name = frappe.get_attr(function.function_path)
+
+				if bot.allow_bot_to_write_documents:
+					# We can commit to the database if writes are allowed
+					if function.pass_parameters_as_json:
+						function_output = function_name(args)
+					else:
+						function_output = function_name(**args)
+				else:
+					# We need to savepoint and then rollback
+					frappe.db.savepoint(run_id + "_" + tool.id)
+					if function.pass_parameters_as_json:
+						function_output = function_name(args)
+					else:
+						function_output = function_name(**args)
+					frappe.db.rollback(save_point=run_id + "_" + tool.id)
+
+			if function.type == "Get Document":
+				self.publish_event(
+					"Fetching {} {}...".format(function.reference_doctype, args.get("document_id"))
+				)
+				function_output = get_document(function.reference_doctype, **args)
+
+			if function.type == "Get Multiple Documents":
+				self.publish_event(f"Fetching multiple {function.reference_doctype}s...")
+				function_output = get_documents(function.reference_doctype, **args)
+
+			if function.type == "Submit Document":
+				self.publish_event(f"Submitting {function.reference_doctype} {args.get('document_id')}...")
+				function_output = submit_document(function.reference_doctype, **args)
+
+			if function.type == "Cancel Document":
+				self.publish_event(f"Cancelling {function.reference_doctype} {args.get('document_id')}...")
+				function_output = cancel_document(function.reference_doctype, **args)
+
+			if function.type == "Get Amended Document":
+				self.publish_event(
+					f"Fetching amended document for {function.reference_doctype} {args.get('document_id')}..."
+				)
+				function_output = get_amended_document(function.reference_doctype, **args)
+
+			if function.type == "Delete Document":
+				self.publish_event(
+					"Deleting {} {}...".format(function.reference_doctype, args.get("document_id"))
+				)
+				function_output = delete_document(function.reference_doctype, **args)
+
+			if function.type == "Delete Multiple Documents":
+				self.publish_event(f"Deleting multiple {function.reference_doctype}s...")
+				function_output = delete_documents(function.reference_doctype, **args)
+
+			if function.type == "Create Document":
+				self.publish_event(f"Creating {function.reference_doctype}...")
+				function_output = create_document(function.reference_doctype, data=args, function=function)
+
+				docs_updated.append(
+					{"doctype": function.reference_doctype, "document_id": function_output.get("document_id")}
+				)
+
+			if function.type == "Create Multiple Documents":
+				self.publish_event(f"Creating multiple {function.reference_doctype}s...")
+				function_output = create_documents(
+					function.reference_doctype, data=args.get("data"), function=function
+				)
+
+				for doc_id in function_output.get("documents"):
+					docs_updated.append({"doctype": function.reference_doctype, "document_id": doc_id})
+
+			if function.type == "Update Document":
+				self.publish_event(f"Updating {function.reference_doctype}...")
+				function_output = update_document(
+					function.reference_doctype,
+					document_id=args.get("document_id"),
+					data=args,
+					function=function,
+				)
+
+				docs_updated.append(
+					{"doctype": function.reference_doctype, "document_id": args.get("document_id")}
+				)
+
+			if function.type == "Update Multiple Documents":
+				self.publish_event(f"Updating multiple {function.reference_doctype}s...")
+				function_output = update_documents(
+					function.reference_doctype, data=args.get("data"), function=function
+				)
+
+				for doc_id in function_output.get("document_ids"):
+					docs_updated.append({"doctype": function.reference_doctype, "document_id": doc_id})
+
+			if function.type == "Attach File to Document":
+				doctype = args.get("doctype")
+				document_id = args.get("document_id")
+				file_path = args.get("file_path")
+				self.publish_event(f"Attaching file to {doctype} {document_id}...")
+				function_output = attach_file_to_document(doctype, document_id, file_path)
+
+			if function.type == "Get List":
+				self.publish_event(f"Fetching list of {function.reference_doctype}...")
+				function_output = get_list(
+					function.reference_doctype,
+					filters=args.get("filters"),
+					fields=args.get("fields"),
+					limit=args.get("limit", 20),
+				)
+
+			if function.type == "Get Value":
+				self.publish_event(f"Fetching value for {function.reference_doctype}...")
+				function_output = get_value(
+					doctype=function.reference_doctype,
+					filters=args.get("filters"),
+					fieldname=args.get("fieldname"),
+				)
+
+			if function.type == "Set Value":
+				self.publish_event(f"Setting value for {function.reference_doctype}...")
+				function_output = set_value(
+					doctype=function.reference_doctype,
+					document_id=args.get("document_id"),
+					fieldname=args.get("fieldname"),
+					value=args.get("value"),
+				)
+
+			if function.type == "Get Report Result":
+				self.publish_event(f"Running report {args.get('report_name')}...")
+				function_output = get_report_result(
+					report_name=args.get("report_name"),
+					filters=args.get("filters"),
+					user=args.get("user", frappe.session.user),
+					ignore_prepared_report=args.get("ignore_prepared_report", False),
+					are_default_filters=args.get("are_default_filters", True),
+				)
+			return function_output
+
 		def submit_tool_outputs(self, tool_outputs, run_id):
 			# Use the submit_tool_outputs_stream helper
 			with client.beta.threads.runs.submit_tool_outputs_stream(
@@ -0,0 +1,298 @@
+"""
+Conversation history of AI threads, built within a token budget per bot.
+
+The newest messages of the thread are included (newest first) until the budget is filled.
+Older messages which do not fit are folded (in a background job) into a rolling summary stored on the thread channel,
+so that the prompt size stays flat as the thread grows.
+"""
+
+from functools import lru_cache
+
+import frappe
+from frappe.query_builder import Order
+from frappe.utils import cint
+
+from raven.utils import get_keyset_condition
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 4000
+
+# Number of messages fetched per query while filling the budget
+HISTORY_PAGE_SIZE = 50
+
+# Maximum number of older messages folded into the summary at once
+MAX_OVERFLOW_MESSAGES = 200
+
+# When the summary is updated, the newest messages filling this share of the budget are left out of it
+SUMMARY_TARGET_RATIO = 0.5
+
+# Maximum length (in tokens) of the summary of older messages
+SUMMARY_MAX_TOKENS = 500
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant.
+Update the summary with the new messages. Keep facts, decisions, names, numbers and open questions. Drop small talk.
+Reply with the updated summary only, in at most {max_words} words."""
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+	"""
+	Get the tokenizer for a model. Returns None if tiktoken is not installed.
+	"""
+	try:
+		import tiktoken
+	except ImportError:
+		return None
+
+	try:
+		return tiktoken.encoding_for_model(model)
+	except KeyError:
+		# Local LLMs and newer models are not known to tiktoken - the OpenAI tokenizer is a good approximation
+		return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+	if not text:
+		return 0
+
+	encoding = get_encoding(model or "gpt-4o")
+
+	if encoding is None:
+		# Roughly 4 characters per token for English text
+		return len(text) // 4 + 1
+
+	return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_history_token_budget(bot) -> int:
+	return cint(bot.get("history_token_budget")) or DEFAULT_HISTORY_TOKEN_BUDGET
+
+
+def build_conversation_history(channel_id: str, message, bot) -> frappe._dict:
+	"""
+	Build the conversation history of an AI thread before the given message.
+
+	Returns a dict with:
+	- messages: list of {"role", "content"} in chronological order which fit in the token budget of the bot
+	- summary: summary of the older messages (if any)
+	- overflow: older messages which do not fit in the budget and are not part of the summary yet (chronological order)
+	"""
+	summary, summary_until = get_summary(channel_id)
+
+	budget = get_history_token_budget(bot) - count_tokens(summary, bot.model)
+
+	history, overflow = split_by_budget(
+		iter_previous_messages(channel_id, message, summary_until), budget, bot.model
+	)
+
+	return frappe._dict(messages=history, summary=summary, overflow=overflow)
+
+
+def get_summary(channel_id: str):
+	"""
+	Get the summary of a thread and the timestamp till which messages are included in it
+	"""
+	return frappe.db.get_value(
+		"Raven Channel", channel_id, ["ai_thread_summary", "ai_thread_summary_until"]
+	) or (None, None)
+
+
+def split_by_budget(rows, budget: int, model: str) -> tuple[list, list]:
+	"""
+	Split messages (newest first) into the ones which fit in the token budget and the older ones which do not.
+	Both lists are returned in chronological order.
+	"""
+	history = []
+	overflow = []
+	used_tokens = 0
+
+	for row in rows:
+		entry = get_history_entry(row)
+
+		if not entry["content"]:
+			continue
+
+		tokens = count_tokens(entry["content"], model)
+
+		# Once a message does not fit, all older messages are overflow - the history is always a contiguous window
+		if overflow or used_tokens + tokens > budget:
+			overflow.append(entry)
+
+			# Messages older than this are dropped instead of being summarized
+			if len(overflow) >= MAX_OVERFLOW_MESSAGES:
+				break
+
+			continue
+
+		history.append(entry)
+		used_tokens += tokens
+
+	history.reverse()
+	overflow.reverse()
+
+	return history, overflow
+
+
+def iter_previous_messages(channel_id: str, message=None, since=None):
+	"""
+	Iterate over the messages of a channel before the given message (or from the latest message) newest first,
+	with a keyset query. If `since` is set, only messages after that timestamp are returned.
+	"""
+	raven_message = frappe.qb.DocType("Raven Message")
+
+	from_timestamp, from_name = (message.creation, message.name) if message else (None, None)
+
+	while True:
+		query = (
+			frappe.qb.from_(raven_message)
+			.select(
+				raven_message.name,
+				raven_message.creation,
+				raven_message.text,
+				raven_message.content,
+				raven_message.bot,
+				raven_message.message_type,
+				raven_message.file,
+				raven_message.is_bot_message,
+			)
+			.where(raven_message.channel_id == channel_id)
+			.where(raven_message.message_type != "System")
+			.orderby(raven_message.creation, order=Order.desc)
+			.orderby(raven_message.name, order=Order.desc)
+			.limit(HISTORY_PAGE_SIZE)
+		)
+
+		if from_timestamp:
+			query = query.where(get_keyset_condition(raven_message, from_timestamp, from_name))
+
+		if since:
+			query = query.where(raven_message.creation > since)
+
+		rows = query.run(as_dict=True)
+
+		yield from rows
+
+		if len(rows) < HISTORY_PAGE_SIZE:
+			return
+
+		from_timestamp, from_name = rows[-1].creation, rows[-1].name
+
+
+def get_history_entry(row) -> dict:
+	"""
+	Convert a message into an entry of the conversation history
+	"""
+	text = row.text or row.content or ""
+
+	if row.bot or row.is_bot_message:
+		return {"role": "assistant", "content": text, "creation": row.creation}
+
+	if row.message_type in ["File", "Image"] and row.file:
+		# Historical files are not analyzed again - only a reference to the file is added
+		file_url = row.file.split("?fid=")[0] if "fid" in row.file else row.file
+		content = f"[User uploaded a {'file' if row.message_type == 'File' else 'image'}: {file_url}]"
+		if text:
+			content += f"\n{text}"
+		return {"role": "user", "content": content, "creation": row.creation}
+
+	return {"role": "user", "content": text, "creation": row.creation}
+
+
+async def summarize_messages(client, model: str, summary: str | None, messages: list) -> str:
+	"""
+	Fold messages into the running summary of the conversation
+	"""
+	transcript = "\n\n".join(
+		f"{'Assistant' if m['role'] == 'assistant' else 'User'}: {m['content']}" for m in messages
+	)
+
+	prompt = ""
+	if summary:
+		prompt += f"Current summary:\n{summary}\n\n"
+	prompt += f"New messages:\n{transcript}"
+
+	response = await client.chat.completions.create(
+		model=model,
+		messages=[
+			{"role": "system", "content": SUMMARY_PROMPT.format(max_words=int(SUMMARY_MAX_TOKENS * 0.75))},
+			{"role": "user", "content": prompt},
+		],
+		max_tokens=SUMMARY_MAX_TOKENS,
+		temperature=0.2,
+	)
+
+	return (response.choices[0].message.content or "").strip()
+
+
+def enqueue_summary_update(channel_id: str, bot, history):
+	"""
+	Update the summary of the thread in the background if the history overflowed the token budget.
+
+	Until the summary is updated, the overflow is left out of the prompt - so the request never waits for the summary.
+	"""
+	if not history.overflow:
+		return
+
+	from raven.ai.jobs import get_ai_queue
+
+	frappe.enqueue(
+		"raven.ai.history.update_thread_summary",
+		queue=get_ai_queue(),
+		job_id=f"raven_ai_thread_summary:{frappe.local.site}:{channel_id}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		channel_id=channel_id,
+		bot=bot.name,
+	)
+
+
+def update_thread_summary(channel_id: str, bot: str):
+	"""
+	Background job to fold older messages of a thread into its summary.
+
+	The newest messages are kept out of the summary till they fill SUMMARY_TARGET_RATIO of the budget. This leaves room
+	for the next few turns, so the summary is updated in batches once the thread grows past the budget - not on every turn.
+	"""
+	from raven.ai.agents_integration import get_event_loop
+	from raven.ai.openai_client import get_async_openai_client
+
+	bot = frappe.get_cached_doc("Raven Bot", bot)
+	summary, summary_until = get_summary(channel_id)
+
+	target = int(get_history_token_budget(bot) * SUMMARY_TARGET_RATIO) - count_tokens(summary, bot.model)
+
+	_history, overflow = split_by_budget(
+		iter_previous_messages(channel_id, since=summary_until), target, bot.model
+	)
+
+	if not overflow:
+		return
+
+	loop = get_event_loop()
+	client = get_async_openai_client(bot.model_provider)
+
+	new_summary = loop.run_until_complete(
+		summarize_messages(client, get_model_name(bot), summary, overflow)
+	)
+
+	if new_summary:
+		save_summary(channel_id, new_summary, overflow[-1]["creation"])
+
+
+def get_model_name(bot) -> str:
+	# For Azure AI, the deployment name is used as the model
+	if bot.model_provider == "Azure AI":
+		return frappe.get_cached_doc("Raven Settings").azure_deployment_name
+
+	return bot.model
+
+
+def save_summary(channel_id: str, summary: str, until):
+	"""
+	Store the summary on the thread channel (without touching the modified timestamp of the channel)
+	"""
+	frappe.db.set_value(
+		"Raven Channel",
+		channel_id,
+		{"ai_thread_summary": summary, "ai_thread_summary_until": until},
+		update_modified=False,
+	)
@@ -0,0 +1,169 @@
+"""
+Background jobs for AI bots.
+
+AI jobs run on a dedicated queue so that long LLM runs do not starve other background jobs (notifications etc).
+To set it up, add the queue to common_site_config.json and start as many workers as the desired concurrency:
+
+	"workers": {"raven_ai": {"timeout": 600}}
+
+	bench worker --queue raven_ai
+
+If the queue is not configured, AI jobs run on the "long" queue.
+
+The number of jobs in flight (queued or running) per bot and per user is limited so that one chatty user cannot monopolize
+the workers. The limits can be set via the site config keys `raven_ai_max_jobs_per_bot` and `raven_ai_max_jobs_per_user`.
+"""
+
+import time
+
+import frappe
+from frappe.utils import cint
+from frappe.utils.background_jobs import get_queue, get_queues_timeout
+
+AI_QUEUE = "raven_ai"
+FALLBACK_QUEUE = "long"
+AI_JOB_TIMEOUT = 600
+
+DEFAULT_MAX_JOBS_PER_BOT = 10
+DEFAULT_MAX_JOBS_PER_USER = 2
+
+# Jobs which did not release their slot (for eg. the worker was killed) are dropped from the count after this time (in seconds)
+STALE_JOB_TIMEOUT = AI_JOB_TIMEOUT * 2
+
+
+def get_ai_queue() -> str:
+	return AI_QUEUE if AI_QUEUE in get_queues_timeout() else FALLBACK_QUEUE
+
+
+def enqueue_ai_job(method: str, bot, user: str, channel_id: str, job_name: str, **kwargs) -> bool:
+	"""
+	Enqueue an AI job for a bot if the bot and the user are within their limits of jobs in flight.
+
+	If a limit is reached, the bot replies that it is busy and the job is not enqueued. Returns whether the job was enqueued.
+	"""
+	job_id = frappe.generate_hash(length=12)
+
+	if not acquire_slot(bot.name, user, job_id):
+		bot.send_message(
+			channel_id=channel_id,
+			text="I'm still working on your previous messages. Please wait for me to respond and try again.",
+		)
+		return False
+
+	queue = get_ai_queue()
+
+	try:
+		frappe.enqueue(
+			"raven.ai.jobs.run_ai_job",
+			queue=queue,
+			timeout=AI_JOB_TIMEOUT,
+			job_name=job_name,
+			# The dedicated queue is processed in order - jobs only need to jump the queue if they share it with other jobs
+			at_front=queue == FALLBACK_QUEUE,
+			ai_method=method,
+			job_id=job_id,
+			bot_name=bot.name,
+			user=user,
+			**kwargs,
+		)
+	except Exception:
+		# The job will never run to release its slot
+		release_slot(bot.name, user, job_id)
+		raise
+
+	return True
+
+
+def run_ai_job(ai_method: str, job_id: str, bot_name: str, user: str, **kwargs):
+	try:
+		frappe.get_attr(ai_method)(bot=frappe.get_cached_doc("Raven Bot", bot_name), **kwargs)
+	finally:
+		release_slot(bot_name, user, job_id)
+
+
+def get_in_flight_key(kind: str, name: str) -> str:
+	# Raw redis commands are used for the sorted sets, hence the key is prefixed with the site name
+	return frappe.cache().make_key(f"raven:ai_in_flight:{kind}:{name}")
+
+
+def get_limits(bot_name: str, user: str) -> dict:
+	"""
+	Map of the in flight key -> maximum number of jobs in flight for the bot and the user
+	"""
+	return {
+		get_in_flight_key("bot", bot_name): cint(
+			frappe.conf.get("raven_ai_max_jobs_per_bot", DEFAULT_MAX_JOBS_PER_BOT)
+		),
+		get_in_flight_key("user", user): cint(
+			frappe.conf.get("raven_ai_max_jobs_per_user", DEFAULT_MAX_JOBS_PER_USER)
+		),
+	}
+
+
+def acquire_slot(bot_name: str, user: str, job_id: str) -> bool:
+	"""
+	Reserve a slot for a job of the bot and the user. Returns False if either of them has reached the limit.
+
+	Jobs in flight are kept in a sorted set (scored by the time they were enqueued) per bot and per user.
+	The check and the reservation are not atomic - concurrent requests may overshoot the limit slightly, which is fine here.
+	"""
+	limits = get_limits(bot_name, user)
+	now = time.time()
+
+	pipe = frappe.cache().pipeline()
+	for key in limits:
+		pipe.zremrangebyscore(key, "-inf", now - STALE_JOB_TIMEOUT)
+		pipe.zcard(key)
+	counts = pipe.execute()[1::2]
+
+	if any(count >= limit for count, limit in zip(counts, limits.values())):
+		return False
+
+	pipe = frappe.cache().pipeline()
+	for key in limits:
+		pipe.zadd(key, {job_id: now})
+		pipe.expire(key, STALE_JOB_TIMEOUT)
+	pipe.execute()
+
+	return True
+
+
+def release_slot(bot_name: str, user: str, job_id: str):
+	pipe = frappe.cache().pipeline()
+	for key in get_limits(bot_name, user):
+		pipe.zrem(key, job_id)
+	pipe.execute()
+
+
+def get_ai_queue_metrics() -> dict:
+	"""
+	Depth of the AI queue (shared by all sites of the bench) and the jobs in flight per bot and user of this site
+	"""
+	from rq import Worker
+
+	queue_name = get_ai_queue()
+	queue = get_queue(queue_name)
+
+	in_flight = {"bot": {}, "user": {}}
+	now = time.time()
+
+	for key in frappe.cache().get_keys("raven:ai_in_flight:"):
+		kind, name = key.decode().split("raven:ai_in_flight:", 1)[1].split(":", 1)
+
+		pipe = frappe.cache().pipeline()
+		pipe.zremrangebyscore(key, "-inf", now - STALE_JOB_TIMEOUT)
+		pipe.zcard(key)
+		count = pipe.execute()[1]
+
+		if count and kind in in_flight:
+			in_flight[kind][name] = count
+
+	return {
+		"queue": queue_name,
+		"queued": queue.count,
+		"running": queue.started_job_registry.count,
+		"failed": queue.failed_job_registry.count,
+		"workers": len(Worker.all(queue=queue)),
+		"in_flight_per_bot": in_flight["bot"],
+		"in_flight_per_user": in_flight["user"],
+	}
@@ -1,6 +1,17 @@
+import asyncio
+import hashlib
+import threading
+
 import frappe
 from frappe import _
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+# Async clients are bound to the event loop they were first used on, hence they are pooled per thread (and loop)
+_async_clients = threading.local()
+
+# Bumped when the settings change - the pools of all threads of this process are dropped on their next use.
+# Other processes create new clients since the key of the client changes with the settings.
+_async_clients_version = 0
 
 
 def get_open_ai_client():
@@ -63,6 +74,155 @@ def get_azure_openai_client():
 	return AzureOpenAI(**client_args)
 
 
+def get_async_openai_client(provider: str):
+	"""
+	Get a pooled async client for the model provider of a bot (OpenAI, Azure AI or Local LLM)
+
+	Clients are reused across requests so that the HTTP connection pool (and TLS session) is kept alive.
+	Each client is keyed by the provider, endpoint and a hash of the API key - if the settings change, a new client is created.
+	"""
+	raven_settings = frappe.get_cached_doc("Raven Settings")
+
+	if provider == "Local LLM" and raven_settings.enable_local_llm:
+		if not raven_settings.local_llm_api_url:
+			frappe.throw(_("Local LLM API URL is not configured in Raven Settings"))
+
+		client_args = {
+			"api_key": "not-needed",  # LM Studio doesn't require API key
+			"base_url": raven_settings.local_llm_api_url,
+		}
+	elif provider == "Azure AI" and raven_settings.enable_azure_ai:
+		azure_api_key = raven_settings.get_password("azure_api_key")
+		azure_endpoint = (raven_settings.azure_endpoint or "").strip()
+		azure_deployment_name = (raven_settings.azure_deployment_name or "").strip()
+
+		if not azure_api_key:
+			frappe.throw(_("Azure API key is not configured in Raven Settings"))
+		if not azure_endpoint:
+			frappe.throw(_("Azure endpoint is not configured in Raven Settings"))
+		if not azure_deployment_name:
+			frappe.throw(_("Azure deployment name is not configured in Raven Settings"))
+
+		provider = "Azure AI"
+		client_args = {
+			"api_key": azure_api_key,
+			"api_version": (raven_settings.azure_api_version or "2024-02-15-preview").strip(),
+			"azure_endpoint": azure_endpoint,
+		}
+	else:
+		api_key = raven_settings.get_password("openai_api_key")
+		if not api_key:
+			frappe.throw(_("OpenAI API key is not configured in Raven Settings"))
+
+		provider = "OpenAI"
+		client_args = {
+			"api_key": api_key,
+			"organization": raven_settings.openai_organisation_id,
+			"project": raven_settings.openai_project_id if raven_settings.openai_project_id else None,
+		}
+
+	key = get_client_key(provider, client_args)
+	clients = get_async_client_pool()
+
+	if provider in clients and clients[provider][0] == key:
+		return clients[provider][1]
+
+	if provider == "Azure AI":
+		from openai import AsyncAzureOpenAI
+
+		client = AsyncAzureOpenAI(**client_args)
+	else:
+		client = AsyncOpenAI(**client_args)
+
+	# Settings were changed - the client of the older configuration is not needed anymore
+	if provider in clients:
+		close_async_client(clients[provider][1], _async_clients.loop)
+
+	clients[provider] = (key, client)
+	return client
+
+
+def get_client_key(provider: str, client_args: dict) -> tuple:
+	api_key = client_args.get("api_key") or ""
+	endpoint = client_args.get("azure_endpoint") or client_args.get("base_url")
+
+	return (
+		provider,
+		endpoint,
+		hashlib.sha256(api_key.encode()).hexdigest(),
+		client_args.get("api_version"),
+		client_args.get("organization"),
+		client_args.get("project"),
+	)
+
+
+def get_async_client_pool() -> dict:
+	"""
+	Pool of async clients of the current thread as a map of provider -> (key, client)
+	"""
+	loop = asyncio.get_event_loop()
+
+	# Clients cannot be used on another event loop, so the pool is reset if the loop changed (or the settings changed)
+	if (
+		getattr(_async_clients, "loop", None) is not loop
+		or getattr(_async_clients, "version", None) != _async_clients_version
+	):
+		close_async_clients()
+		_async_clients.loop = loop
+		_async_clients.version = _async_clients_version
+		_async_clients.clients = {}
+
+	return _async_clients.clients
+
+
+def close_async_clients():
+	"""
+	Close the pooled async clients of the current thread
+	"""
+	loop = getattr(_async_clients, "loop", None)
+
+	for _key, client in getattr(_async_clients, "clients", {}).values():
+		close_async_client(client, loop)
+
+	_async_clients.clients = {}
+
+
+def close_async_client(client, loop=None):
+	"""
+	Close the connections of a client on the event loop it was used on
+	"""
+	try:
+		running_loop = asyncio.get_running_loop()
+	except RuntimeError:
+		running_loop = None
+
+	try:
+		if running_loop and (loop is None or loop is running_loop):
+			running_loop.create_task(client.close())
+		elif running_loop:
+			# The loop of the client cannot be run while another loop is running in this thread -
+			# the connections are closed when the client is garbage collected
+			pass
+		elif loop and not loop.is_closed():
+			loop.run_until_complete(client.close())
+		else:
+			asyncio.run(client.close())
+	except Exception:
+		# The connections are closed when the client is garbage collected
+		pass
+
+
+def clear_async_openai_clients():
+	"""
+	Drop the pooled async clients of all threads of this process - for eg. when Raven Settings are updated.
+	The clients of the current thread are closed right away, other threads close theirs on their next request.
+	"""
+	global _async_clients_version
+	_async_clients_version += 1
+
+	close_async_clients()
+
+
 def get_openai_models():
 	"""
 	Get the available OpenAI models
@@ -0,0 +1,368 @@
+"""
+Local retrieval over the files of AI bots and AI threads - works offline and for every model provider.
+
+The extracted text of the files (see file_extraction) is split into chunks and an inverted index of the chunks is stored
+on disk per bot and per AI thread. The index is rebuilt when the files change. Chunks are ranked with BM25, so only the
+top few chunks are sent to the model instead of whole files.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import frappe
+from agents import FunctionTool
+
+from raven.ai.file_extraction import (
+	delete_old_files,
+	get_extraction,
+	get_file_hash,
+	get_file_type,
+	is_error,
+	is_extractable,
+	tokenize,
+	write_json_file,
+)
+from raven.ai.tool_executor import run_read_only
+
+# Bump this when the format of the index or the chunking changes
+INDEX_VERSION = 1
+
+INDEX_FOLDER = "raven_ai_indexes"
+
+# Size of a chunk and the overlap between consecutive chunks (in words)
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 40
+
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 10
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Indexes loaded in this process - path -> (modified time of the file, index), least recently used first.
+# Indexes of large files take a lot of memory, so only the last few are kept.
+MAX_LOADED_INDEXES = 8
+_loaded_indexes = OrderedDict()
+_loaded_indexes_lock = threading.Lock()
+
+
+def get_index_path(scope: str, name: str) -> str:
+	folder = frappe.get_site_path("private", INDEX_FOLDER)
+	os.makedirs(folder, exist_ok=True)
+
+	# Names of bots and channels may contain characters which are not safe in file names
+	return os.path.join(folder, f"{scope}-{hashlib.md5(name.encode()).hexdigest()}.json")
+
+
+def get_bot_sources(bot_name: str) -> list[dict]:
+	"""
+	Files of the bot (from its file sources)
+	"""
+	bot = frappe.get_cached_doc("Raven Bot", bot_name)
+	file_sources = [f.file for f in bot.file_sources]
+
+	if not file_sources:
+		return []
+
+	return get_file_sources(
+		frappe.get_all("Raven AI File Source", filters={"name": ["in", file_sources]}, pluck="file")
+	)
+
+
+def get_thread_sources(channel_id: str) -> list[dict]:
+	"""
+	Files uploaded in the channel
+	"""
+	return get_file_sources(
+		frappe.get_all(
+			"Raven Message",
+			filters={"channel_id": channel_id, "message_type": "File", "file": ["is", "set"]},
+			pluck="file",
+		)
+	)
+
+
+def get_file_sources(file_urls: list[str]) -> list[dict]:
+	"""
+	Get the files (which can be extracted) for the given file URLs
+	"""
+	file_urls = list(dict.fromkeys(url.split("?fid=")[0] for url in file_urls if url))
+
+	if not file_urls:
+		return []
+
+	files = frappe.get_all(
+		"File",
+		filters={"file_url": ["in", file_urls]},
+		fields=["name", "file_name", "file_url", "is_private", "content_hash"],
+	)
+
+	sources = {}
+
+	for file in files:
+		file_type = get_file_type(file.file_name)
+
+		if file.file_url in sources or not is_extractable(file_type):
+			continue
+
+		try:
+			file_path = frappe.get_doc({"doctype": "File", **file}).get_full_path()
+			content_hash = file.content_hash or get_file_hash(file_path)
+		except OSError:
+			# The file is missing on the disk
+			continue
+
+		sources[file.file_url] = {
+			"file_name": file.file_name,
+			"file_type": file_type,
+			"file_path": file_path,
+			"content_hash": content_hash,
+		}
+
+	return list(sources.values())
+
+
+def get_index(scope: str, name: str, sources: list[dict]) -> dict:
+	"""
+	Get the index of the files - rebuilt only if the files (by their content hash) changed
+	"""
+	path = get_index_path(scope, name)
+	signature = sorted(source["content_hash"] for source in sources)
+
+	index = load_index(path)
+
+	if index and index.get("version") == INDEX_VERSION and index.get("signature") == signature:
+		return index
+
+	index = build_index(sources)
+	index["signature"] = signature
+
+	write_json_file(path, index)
+	cache_loaded_index(path, os.path.getmtime(path), index)
+
+	return index
+
+
+def delete_old_indexes():
+	"""
+	Daily job to delete indexes of bots and threads which were not rebuilt for a while (they are rebuilt when searched)
+	"""
+	delete_old_files(INDEX_FOLDER)
+
+
+def load_index(path: str) -> dict | None:
+	if not os.path.exists(path):
+		return None
+
+	modified = os.path.getmtime(path)
+
+	with _loaded_indexes_lock:
+		loaded = _loaded_indexes.get(path)
+
+		if loaded and loaded[0] == modified:
+			_loaded_indexes.move_to_end(path)
+			return loaded[1]
+
+	try:
+		with open(path, encoding="utf-8") as f:
+			index = json.load(f)
+	except ValueError:
+		return None
+
+	cache_loaded_index(path, modified, index)
+
+	return index
+
+
+def cache_loaded_index(path: str, modified: float, index: dict):
+	with _loaded_indexes_lock:
+		_loaded_indexes[path] = (modified, index)
+		_loaded_indexes.move_to_end(path)
+
+		while len(_loaded_indexes) > MAX_LOADED_INDEXES:
+			_loaded_indexes.popitem(last=False)
+
+
+def build_index(sources: list[dict]) -> dict:
+	"""
+	Split the text of the files into chunks and build an inverted index (term -> [[chunk, term frequency]]) of the chunks
+	"""
+	chunks = []
+
+	for source in sources:
+		extraction = get_extraction(source["file_path"], source["file_type"], source["content_hash"])
+
+		if is_error(extraction):
+			continue
+
+		if "pages" in extraction:
+			for page_number, text in enumerate(extraction["pages"], start=1):
+				chunks.extend(chunk_text(text, source["file_name"], page_number))
+		else:
+			chunks.extend(chunk_text(extraction["content"], source["file_name"]))
+
+	postings = defaultdict(list)
+	lengths = []
+
+	for chunk_id, chunk in enumerate(chunks):
+		term_counts = Counter(tokenize(chunk["text"]))
+		lengths.append(sum(term_counts.values()))
+
+		for term, count in term_counts.items():
+			postings[term].append([chunk_id, count])
+
+	return {"version": INDEX_VERSION, "chunks": chunks, "lengths": lengths, "postings": postings}
+
+
+def chunk_text(text: str, file_name: str, page: int | None = None) -> list[dict]:
+	"""
+	Split text into chunks of about CHUNK_SIZE words along line boundaries (so that tables stay readable).
+	Consecutive chunks share up to CHUNK_OVERLAP words, so that text around a boundary is found in full.
+	"""
+	chunks = []
+	lines = []
+	words = 0
+
+	for line in split_lines(text):
+		line_words = len(line.split())
+
+		if lines and words + line_words > CHUNK_SIZE:
+			chunks.append({"file_name": file_name, "page": page, "text": "\n".join(lines)})
+
+			overlap = []
+			overlap_words = 0
+			for previous_line in reversed(lines):
+				previous_words = len(previous_line.split())
+				if overlap_words + previous_words > CHUNK_OVERLAP:
+					break
+				overlap.insert(0, previous_line)
+				overlap_words += previous_words
+
+			# The overlap is left out if the line would not fit with it
+			if overlap_words + line_words > CHUNK_SIZE:
+				overlap, overlap_words = [], 0
+
+			lines, words = overlap, overlap_words
+
+		lines.append(line)
+		words += line_words
+
+	if lines:
+		chunks.append({"file_name": file_name, "page": page, "text": "\n".join(lines)})
+
+	return chunks
+
+
+def split_lines(text: str):
+	"""
+	Non empty lines of the text - lines longer than CHUNK_SIZE words are split
+	"""
+	for line in text.splitlines():
+		line_words = line.split()
+
+		if not line_words:
+			continue
+
+		if len(line_words) <= CHUNK_SIZE:
+			yield line.strip()
+			continue
+
+		for start in range(0, len(line_words), CHUNK_SIZE):
+			yield " ".join(line_words[start : start + CHUNK_SIZE])
+
+
+def search_index(index: dict, query: str, top_k: int = DEFAULT_TOP_K) -> list[dict]:
+	"""
+	Get the top_k chunks of the index most relevant to the query (ranked with BM25)
+	"""
+	chunks = index["chunks"]
+	lengths = index["lengths"]
+
+	if not chunks:
+		return []
+
+	average_length = sum(lengths) / len(lengths) or 1
+	scores = defaultdict(float)
+
+	for term in set(tokenize(query)):
+		postings = index["postings"].get(term)
+
+		if not postings:
+			continue
+
+		idf = math.log(1 + (len(chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+
+		for chunk_id, frequency in postings:
+			length_norm = 1 - BM25_B + BM25_B * lengths[chunk_id] / average_length
+			scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+
+	top_chunks = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+	return [{**chunks[chunk_id], "score": round(score, 3)} for chunk_id, score in top_chunks]
+
+
+def search_files(scope: str, name: str, query: str, top_k: int | None = None) -> dict:
+	sources = get_bot_sources(name) if scope == "bot" else get_thread_sources(name)
+
+	if not sources:
+		return {"success": False, "message": "No files to search"}
+
+	top_k = min(top_k or DEFAULT_TOP_K, MAX_TOP_K)
+	results = search_index(get_index(scope, name, sources), query, top_k)
+
+	return {
+		"success": True,
+		"query": query,
+		"files": [source["file_name"] for source in sources],
+		"results": results,
+		"message": None if results else "No content matched the query - try other keywords",
+	}
+
+
+def create_file_search_tool(scope: str, name: str) -> FunctionTool:
+	"""
+	Create a tool to search the files of a bot (scope "bot") or of an AI thread (scope "thread")
+	"""
+
+	async def on_invoke_tool(ctx, args_json: str) -> str:
+		try:
+			args = json.loads(args_json) if args_json else {}
+			result = await run_read_only(search_files, scope, name, args.get("query", ""), args.get("top_k"))
+		except Exception as e:
+			frappe.log_error("Raven AI File Search Error", frappe.get_traceback())
+			result = {"success": False, "error": str(e)}
+
+		return json.dumps(result, default=str)
+
+	if scope == "bot":
+		tool_name = "search_knowledge_files"
+		description = "Search the knowledge files of this assistant. Returns the passages most relevant to the query, with the file name and page."
+	else:
+		tool_name = "search_conversation_files"
+		description = "Search all files uploaded in this conversation. Returns the passages most relevant to the query, with the file name and page."
+
+	return FunctionTool(
+		name=tool_name,
+		description=description,
+		params_json_schema={
+			"type": "object",
+			"properties": {
+				"query": {
+					"type": "string",
+					"description": "Keywords or question to search for in the files",
+				},
+				"top_k": {
+					"type": "integer",
+					"description": f"Optional: number of passages to return (default {DEFAULT_TOP_K}, at most {MAX_TOP_K})",
+				},
+			},
+			"required": ["query"],
+		},
+		on_invoke_tool=on_invoke_tool,
+		strict_json_schema=False,
+	)
@@ -8,6 +8,9 @@ import frappe
 from agents import FunctionTool
 from frappe import client
 
+from raven.ai.tool_cache import get_cached_result
+from raven.ai.tool_executor import is_read_only_function, run_read_only
+
 
 def create_raven_tools(bot) -> list[FunctionTool]:
 	"""
@@ -99,6 +102,7 @@ def create_raven_tools(bot) -> list[FunctionTool]:
 						function_path,  # Utiliser la variable function_path définie plus haut
 						params,
 						extra_args=extra_args,
+						function_type=function_doc.type,
 					)
 
 					if tool:
@@ -116,6 +120,7 @@ def create_function_tool(
 	function_name: str,
 	parameters: dict[str, Any],
 	extra_args: dict[str, Any] = None,
+	function_type: str = None,
 ) -> FunctionTool:
 	"""
 	Create a FunctionTool for Raven functions
@@ -126,6 +131,8 @@ def create_function_tool(
 	    function_name: Function name to call
 	    parameters: Function parameters schema
 	    extra_args: Extra arguments to pass to the function
+	    function_type: Type of the Raven AI Function - results of read-only types are cached
+	        and they are run in a thread so that the agent can run multiple tool calls concurrently
 
 	Returns:
 	    FunctionTool: Function tool
@@ -142,12 +149,14 @@ def create_function_tool(
 		# Store extra_args in a closure
 		_extra_args = extra_args or {}
 		_function = function
+		read_only = is_read_only_function(function_type)
 
 		# Create a tracking mechanism for duplicate requests
 		import hashlib
 		from datetime import datetime, timedelta
 
-		# Create a simple cache to prevent duplicate function executions
+		# Create a simple cache to prevent duplicate executions of functions which write
+		# (results of read-only functions are cached in Redis - see tool_cache)
 		_request_cache = {}
 		_cache_ttl = 5  # seconds - short TTL to prevent duplicates in same conversation
 
@@ -155,11 +164,14 @@ def create_function_tool(
 		async def on_invoke_tool(ctx, args_json: str) -> str:
 			try:
 				# Create a unique hash for this request to detect duplicates
-				request_hash = hashlib.md5(args_json.encode()).hexdigest()
+				# Tools are cached across requests, so the site and user are part of the hash to never share results
+				request_hash = hashlib.md5(
+					f"{frappe.local.site}:{frappe.session.user}:{args_json}".encode()
+				).hexdigest()
 				now = datetime.now()
 
 				# Check if we've seen this exact request recently (deduplication)
-				if request_hash in _request_cache:
+				if not read_only and request_hash in _request_cache:
 					last_time, cached_result = _request_cache[request_hash]
 					# If the request was made very recently, return cached result
 					if now - last_time < timedelta(seconds=_cache_ttl):
@@ -178,7 +190,17 @@ def create_function_tool(
 					frappe.flags.current_function_doctype = _extra_args["reference_doctype"]
 
 				# Call the function
-				result = _function(**args_dict)
+				if read_only:
+					result = await run_read_only(
+						get_cached_result,
+						function_type,
+						name,
+						_extra_args.get("reference_doctype"),
+						args_dict,
+						lambda: _function(**args_dict),
+					)
+				else:
+					result = _function(**args_dict)
 
 				# Convert result to string (JSON)
 				result_str = ""
@@ -189,7 +211,8 @@ def create_function_tool(
 					result_str = str(result)
 
 				# Store in cache to prevent duplicate executions
-				_request_cache[request_hash] = (now, result_str)
+				if not read_only:
+					_request_cache[request_hash] = (now, result_str)
 
 				# Clean up old cache entries
 				for hash_key in list(_request_cache.keys()):
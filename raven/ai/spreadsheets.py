@@ -0,0 +1,318 @@
+"""
+Streaming reader for spreadsheets (CSV, XLSX and XLS) uploaded in AI conversations.
+
+Spreadsheets are never loaded (or sent to the model) as a whole. A summary of each sheet - its columns with their types
+and statistics, and a few preview rows - is computed in a single pass and cached with the extraction of the file.
+Rows are served on demand in windows, optionally filtered by column values.
+"""
+
+import csv
+import datetime
+
+# Number of rows shown in the preview of a sheet
+PREVIEW_ROWS = 5
+# Number of distinct values shown as samples of a text column
+MAX_SAMPLE_VALUES = 5
+
+DEFAULT_ROW_LIMIT = 50
+MAX_ROW_LIMIT = 200
+
+# Maximum length of a cell in the markdown tables
+MAX_CELL_LENGTH = 200
+
+
+def iter_sheets(file_path: str, file_type: str):
+	"""
+	Yields (sheet name, rows) for each sheet - rows are read lazily and the first row is the header.
+	CSV files have a single sheet without a name.
+	"""
+	if file_type == "csv":
+		with open(file_path, newline="", encoding="utf-8-sig", errors="replace") as f:
+			sample = f.read(64 * 1024)
+			f.seek(0)
+
+			try:
+				dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+			except csv.Error:
+				dialect = csv.excel
+
+			yield None, csv.reader(f, dialect)
+
+	elif file_type == "xlsx":
+		from openpyxl import load_workbook
+
+		# Read only mode streams the rows instead of loading the whole workbook in memory
+		workbook = load_workbook(file_path, read_only=True, data_only=True)
+
+		try:
+			for worksheet in workbook.worksheets:
+				yield worksheet.title, worksheet.iter_rows(values_only=True)
+		finally:
+			workbook.close()
+
+	else:
+		# Legacy XLS files cannot be streamed - each sheet is parsed once from the same workbook
+		import pandas as pd
+
+		excel_file = pd.ExcelFile(file_path)
+
+		for sheet_name in excel_file.sheet_names:
+			df = excel_file.parse(sheet_name, header=None)
+			yield sheet_name, df.itertuples(index=False, name=None)
+
+
+def iter_records(rows):
+	"""
+	Yields (header, values) for each non empty row after the header
+	"""
+	header = None
+
+	for row in rows:
+		values = [normalize_cell(value) for value in row]
+
+		if not any(value is not None for value in values):
+			continue
+
+		if header is None:
+			header = [
+				str(value) if value is not None else f"Column {index + 1}" for index, value in enumerate(values)
+			]
+			continue
+
+		# Rows may be shorter or longer than the header
+		values = (values + [None] * len(header))[: len(header)]
+
+		yield header, values
+
+
+def normalize_cell(value):
+	if value is None:
+		return None
+
+	# NaN (from pandas) is not equal to itself
+	if isinstance(value, float) and value != value:
+		return None
+
+	if isinstance(value, str):
+		value = value.strip()
+		return value or None
+
+	return value
+
+
+def summarize_spreadsheet(file_path: str, file_type: str) -> list[dict]:
+	"""
+	Get the summary of each sheet in a single pass: row count, columns with their statistics and preview rows
+	"""
+	summaries = []
+
+	for sheet_name, rows in iter_sheets(file_path, file_type):
+		header = []
+		stats = []
+		preview = []
+		row_count = 0
+
+		for header, values in iter_records(rows):
+			if not stats:
+				stats = [new_column_stats() for _column in header]
+
+			row_count += 1
+
+			if len(preview) < PREVIEW_ROWS:
+				preview.append([format_cell(value) for value in values])
+
+			for column_stats, value in zip(stats, values):
+				update_column_stats(column_stats, value)
+
+		summaries.append(
+			{
+				"sheet": sheet_name,
+				"row_count": row_count,
+				"columns": [get_column_summary(column, column_stats) for column, column_stats in zip(header, stats)],
+				"preview": preview,
+			}
+		)
+
+	return summaries
+
+
+def new_column_stats() -> dict:
+	return {"non_empty": 0, "numeric": 0, "min": None, "max": None, "sum": 0, "samples": []}
+
+
+def update_column_stats(stats: dict, value):
+	if value is None:
+		return
+
+	stats["non_empty"] += 1
+
+	number = to_number(value)
+
+	if number is not None:
+		stats["numeric"] += 1
+		stats["sum"] += number
+		stats["min"] = number if stats["min"] is None else min(stats["min"], number)
+		stats["max"] = number if stats["max"] is None else max(stats["max"], number)
+
+	elif len(stats["samples"]) < MAX_SAMPLE_VALUES:
+		sample = format_cell(value)
+		if sample not in stats["samples"]:
+			stats["samples"].append(sample)
+
+
+def get_column_summary(column: str, stats: dict) -> dict:
+	summary = {"name": column, "non_empty": stats["non_empty"]}
+
+	if stats["non_empty"] and stats["numeric"] == stats["non_empty"]:
+		summary.update(
+			type="number",
+			min=stats["min"],
+			max=stats["max"],
+			mean=round(stats["sum"] / stats["numeric"], 4),
+		)
+	else:
+		summary.update(type="text", sample_values=stats["samples"])
+
+	return summary
+
+
+def to_number(value):
+	if isinstance(value, bool):
+		return None
+
+	if isinstance(value, (int, float)):
+		return value
+
+	if isinstance(value, str):
+		try:
+			return float(value.replace(",", ""))
+		except ValueError:
+			return None
+
+	return None
+
+
+def format_cell(value) -> str:
+	if value is None:
+		return ""
+
+	# Dates are read from Excel files as datetimes at midnight
+	if isinstance(value, datetime.datetime) and value.time() == datetime.time.min:
+		value = value.date()
+
+	if isinstance(value, float) and value.is_integer():
+		value = int(value)
+
+	text = str(value)
+
+	return text[:MAX_CELL_LENGTH] + "..." if len(text) > MAX_CELL_LENGTH else text
+
+
+def get_rows(
+	file_path: str,
+	file_type: str,
+	sheet: str | None = None,
+	start_row: int = 0,
+	limit: int = DEFAULT_ROW_LIMIT,
+	filters: dict | None = None,
+) -> dict:
+	"""
+	Get a window of rows of a sheet (the first sheet if not given), streamed from the file.
+
+	Filters are a dict of column -> value. A row matches if the cell contains the value (case insensitive).
+	`start_row` is the index (from 0) of the first matching row to return.
+	"""
+	limit = min(max(int(limit or DEFAULT_ROW_LIMIT), 1), MAX_ROW_LIMIT)
+	start_row = max(int(start_row or 0), 0)
+	filters = {str(column).lower(): str(value).lower() for column, value in (filters or {}).items()}
+
+	sheet_names = []
+
+	for sheet_name, rows in iter_sheets(file_path, file_type):
+		sheet_names.append(sheet_name)
+
+		if sheet and (sheet_name or "").lower() != sheet.lower():
+			continue
+
+		header = []
+		window = []
+		matching_rows = 0
+
+		for header, values in iter_records(rows):
+			if filters and not matches_filters(header, values, filters):
+				continue
+
+			if start_row <= matching_rows < start_row + limit:
+				window.append([format_cell(value) for value in values])
+
+			matching_rows += 1
+
+		unknown_columns = set(filters) - {column.lower() for column in header}
+
+		return {
+			"sheet": sheet_name,
+			"columns": header,
+			"start_row": start_row,
+			"rows_returned": len(window),
+			"matching_rows": matching_rows,
+			"unknown_filter_columns": sorted(unknown_columns) or None,
+			"content": to_markdown_table(header, window),
+		}
+
+	return {"error": f"Sheet '{sheet}' not found", "sheets": sheet_names}
+
+
+def matches_filters(header: list[str], values: list, filters: dict) -> bool:
+	row = {column.lower(): value for column, value in zip(header, values)}
+
+	for column, value in filters.items():
+		if column in row and value not in format_cell(row[column]).lower():
+			return False
+
+	return True
+
+
+def to_markdown_table(columns: list[str], rows: list[list[str]]) -> str:
+	if not columns:
+		return ""
+
+	def escape(text: str) -> str:
+		return text.replace("|", "\\|").replace("\n", " ")
+
+	lines = [
+		"| " + " | ".join(escape(column) for column in columns) + " |",
+		"| " + " | ".join("---" for _column in columns) + " |",
+	]
+
+	for row in rows:
+		lines.append("| " + " | ".join(escape(cell) for cell in row) + " |")
+
+	return "\n".join(lines)
+
+
+def get_summary_markdown(summaries: list[dict]) -> str:
+	"""
+	Markdown of the summaries of the sheets - used as the text content of the spreadsheet (for eg. for search)
+	"""
+	parts = []
+
+	for summary in summaries:
+		title = f"## Sheet: {summary['sheet']}" if summary["sheet"] else "## Data"
+		parts.append(f"{title} ({summary['row_count']} rows)\n")
+
+		parts.append("Columns:")
+		for column in summary["columns"]:
+			if column["type"] == "number":
+				details = f"min {column['min']}, max {column['max']}, mean {column['mean']}"
+			else:
+				details = "e.g. " + ", ".join(column["sample_values"]) if column["sample_values"] else "empty"
+
+			parts.append(f"- {column['name']} ({column['type']}, {column['non_empty']} values): {details}")
+
+		if summary["preview"]:
+			parts.append(f"\nFirst {len(summary['preview'])} rows:\n")
+			parts.append(to_markdown_table([column["name"] for column in summary["columns"]], summary["preview"]))
+
+		parts.append("")
+
+	return "\n".join(parts)
@@ -0,0 +1,64 @@
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.circuit_breaker import (
+	CLOSED,
+	FAILURE_THRESHOLD,
+	HALF_OPEN,
+	OPEN,
+	acquire_probe,
+	get_circuit_state,
+	get_key,
+	record_failure,
+	record_success,
+)
+
+PROVIDER = "Test Provider"
+
+
+class TestCircuitBreaker(IntegrationTestCase):
+	def setUp(self):
+		record_success(PROVIDER)
+
+	def tearDown(self):
+		record_success(PROVIDER)
+
+	def test_circuit_opens_after_repeated_failures(self):
+		for _i in range(FAILURE_THRESHOLD - 1):
+			record_failure(PROVIDER)
+
+		self.assertEqual(get_circuit_state(PROVIDER), CLOSED)
+
+		record_failure(PROVIDER)
+		self.assertEqual(get_circuit_state(PROVIDER), OPEN)
+
+	def test_half_open_circuit_is_probed_by_one_worker(self):
+		"""
+		After the cool down, only one worker probes the provider - a success closes the circuit
+		"""
+		for _i in range(FAILURE_THRESHOLD):
+			record_failure(PROVIDER)
+
+		# Cool down is over
+		frappe.cache().delete(get_key(PROVIDER, "open"))
+		self.assertEqual(get_circuit_state(PROVIDER), HALF_OPEN)
+
+		self.assertTrue(acquire_probe(PROVIDER))
+		self.assertFalse(acquire_probe(PROVIDER))
+
+		record_success(PROVIDER)
+		self.assertEqual(get_circuit_state(PROVIDER), CLOSED)
+
+	def test_failed_probe_opens_circuit_again(self):
+		for _i in range(FAILURE_THRESHOLD):
+			record_failure(PROVIDER)
+
+		frappe.cache().delete(get_key(PROVIDER, "open"))
+		self.assertTrue(acquire_probe(PROVIDER))
+
+		record_failure(PROVIDER)
+		self.assertEqual(get_circuit_state(PROVIDER), OPEN)
+
+		# The probe is released, so that another worker can probe after the next cool down
+		frappe.cache().delete(get_key(PROVIDER, "open"))
+		self.assertTrue(acquire_probe(PROVIDER))
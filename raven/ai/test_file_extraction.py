@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.file_extraction import (
+	get_extraction,
+	get_extraction_path,
+	get_file_hash,
+	rank_pages,
+)
+
+
+class TestFileExtraction(IntegrationTestCase):
+	def setUp(self):
+		self.files = []
+
+	def tearDown(self):
+		for path in self.files:
+			if os.path.exists(path):
+				os.remove(path)
+
+	def create_file(self, content: bytes, extension: str) -> str:
+		with tempfile.NamedTemporaryFile(suffix=f".{extension}", delete=False) as f:
+			f.write(content)
+
+		self.files.extend([f.name, get_extraction_path(get_file_hash(f.name))])
+		return f.name
+
+	def test_extraction_is_cached_by_content_hash(self):
+		path = self.create_file(b"Invoice number 42", "txt")
+
+		extraction = get_extraction(path, "txt")
+
+		self.assertEqual(extraction["content"], "Invoice number 42")
+		self.assertEqual(extraction["content_hash"], get_file_hash(path))
+		self.assertTrue(os.path.exists(get_extraction_path(extraction["content_hash"])))
+
+		# The same content uploaded again is not extracted again
+		os.remove(path)
+		self.assertEqual(get_extraction(path, "txt", extraction["content_hash"]), extraction)
+
+	def test_text_file_which_is_not_utf8(self):
+		path = self.create_file("Café crème".encode("latin-1"), "txt")
+
+		extraction = get_extraction(path, "txt")
+
+		self.assertTrue(extraction["content"].startswith("Caf"))
+		self.assertIn("cr", extraction["content"])
+
+	def test_rank_pages(self):
+		"""
+		Pages are ranked by the query terms they contain, rare terms counting more than common ones
+		"""
+		pages = {
+			1: "Table of contents. Invoice totals, payment terms.",
+			2: "Payment terms: the invoice is due within 30 days.",
+			3: "Refund policy. Refunds are paid within 14 days of the refund request.",
+			4: "Appendix with contact details.",
+		}
+
+		self.assertEqual(rank_pages(pages, "refund", 3), [3])
+		# "refund" appears on one page only, so it outweighs the common "invoice"
+		self.assertEqual(rank_pages(pages, "invoice refund", 3), [3, 1, 2])
+		self.assertEqual(rank_pages(pages, "invoice refund", 1), [3])
+		# Pages with the same score are in page order
+		self.assertEqual(rank_pages(pages, "payment terms", 3), [1, 2])
+
+	def test_rank_pages_without_matches(self):
+		pages = {1: "Invoice", 2: "Payment"}
+
+		self.assertEqual(rank_pages(pages, "shipping", 2), [])
+		# Single characters and punctuation are not search terms
+		self.assertEqual(rank_pages(pages, "a ?", 2), [])
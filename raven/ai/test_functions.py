@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.functions import create_documents, delete_documents, get_documents, update_documents
+
+
+def create_todo(description: str) -> str:
+	return frappe.get_doc({"doctype": "ToDo", "description": description}).insert().name
+
+
+def create_user() -> str:
+	return (
+		frappe.get_doc(
+			{
+				"doctype": "User",
+				"email": "raven-ai-functions@example.com",
+				"first_name": "Raven AI Functions",
+				"send_welcome_email": 0,
+			}
+		)
+		.insert(ignore_permissions=True)
+		.name
+	)
+
+
+class TestAIFunctions(IntegrationTestCase):
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.db.rollback()
+
+	def test_get_documents(self):
+		"""
+		Documents are returned in the order of the IDs (without duplicates), with an error for missing documents
+		"""
+		first, second = create_todo("First"), create_todo("Second")
+
+		docs = get_documents("ToDo", [second, "missing-todo", first, second])
+
+		self.assertEqual(len(docs), 3)
+		self.assertEqual(docs[0]["name"], second)
+		self.assertEqual(docs[0]["description"], "Second")
+		self.assertEqual(docs[1]["document_id"], "missing-todo")
+		self.assertIn("not found", docs[1]["error"])
+		self.assertEqual(docs[2]["name"], first)
+
+	def test_get_documents_without_permission(self):
+		"""
+		Documents which exist but cannot be read by the user are reported as not permitted
+		"""
+		todo = create_todo("Private")
+
+		frappe.set_user(create_user())
+		docs = get_documents("ToDo", [todo])
+
+		self.assertEqual(docs[0]["document_id"], todo)
+		self.assertIn("Not permitted", docs[0]["error"])
+
+	def test_get_documents_denied_by_permission_hook(self):
+		"""
+		Documents returned by the list query are still checked with the has_permission hooks
+		"""
+		frappe.set_user(create_user())
+		allowed, denied = create_todo("Allowed"), create_todo("Denied")
+
+		def has_controller_permissions(doc, *args, **kwargs):
+			return False if doc.name == denied else None
+
+		with patch("frappe.permissions.has_controller_permissions", side_effect=has_controller_permissions):
+			docs = get_documents("ToDo", [allowed, denied])
+
+		self.assertEqual(docs[0]["name"], allowed)
+		self.assertEqual(docs[1]["document_id"], denied)
+		self.assertIn("Not permitted", docs[1]["error"])
+
+	def test_create_documents_with_failures(self):
+		"""
+		A failing document is rolled back to its savepoint - the other documents are created
+		"""
+		result = create_documents(
+			"ToDo",
+			[{"description": "First"}, {"description": "Second", "status": "Invalid Status"}, {"description": "Third"}],
+		)
+
+		self.assertEqual(len(result["documents"]), 2)
+		self.assertEqual([error["index"] for error in result["errors"]], [1])
+		self.assertEqual(
+			sorted(frappe.get_all("ToDo", filters={"name": ["in", result["documents"]]}, pluck="description")),
+			["First", "Third"],
+		)
+		self.assertFalse(frappe.db.exists("ToDo", {"description": "Second"}))
+
+	def test_update_documents_with_failures(self):
+		first, second = create_todo("First"), create_todo("Second")
+
+		result = update_documents(
+			"ToDo",
+			[
+				{"document_id": first, "description": "First updated"},
+				{"document_id": second, "status": "Invalid Status"},
+			],
+		)
+
+		self.assertEqual(result["document_ids"], [first])
+		self.assertEqual([error["document_id"] for error in result["errors"]], [second])
+		self.assertEqual(frappe.db.get_value("ToDo", first, "description"), "First updated")
+		self.assertEqual(frappe.db.get_value("ToDo", second, "status"), "Open")
+
+	def test_delete_documents(self):
+		first, second = create_todo("First"), create_todo("Second")
+
+		result = delete_documents("ToDo", [first, "missing-todo", second])
+
+		self.assertEqual(sorted(result["document_ids"]), sorted([first, second]))
+		self.assertEqual([error["document_id"] for error in result["errors"]], ["missing-todo"])
+		self.assertFalse(frappe.db.exists("ToDo", first))
@@ -0,0 +1,128 @@
+import datetime
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.history import (
+	build_conversation_history,
+	count_tokens,
+	save_summary,
+	split_by_budget,
+)
+
+CHANNEL_ID = "Public Workspace-test-ai-history"
+
+EXTRA_TEST_RECORD_DEPENDENCIES = ["Raven Workspace"]
+
+MODEL = "gpt-4o"
+
+
+def get_row(index: int, text: str, is_bot_message: bool = False) -> frappe._dict:
+	return frappe._dict(
+		name=f"message-{index}",
+		creation=datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=index),
+		text=text,
+		content=text,
+		bot=None,
+		message_type="Text",
+		file=None,
+		is_bot_message=1 if is_bot_message else 0,
+	)
+
+
+class TestConversationHistory(IntegrationTestCase):
+	def setUp(self):
+		channel = frappe.get_doc(
+			{
+				"doctype": "Raven Channel",
+				"channel_name": "Test AI History",
+				"type": "Public",
+				"workspace": "Public Workspace",
+			}
+		)
+		channel.flags.do_not_add_member = True
+		channel.insert()
+
+		# Message 0 is the oldest, message 9 the newest
+		for i in range(10):
+			creation = datetime.datetime.now() - datetime.timedelta(minutes=10 - i)
+			frappe.get_doc(
+				{
+					"doctype": "Raven Message",
+					"name": f"{CHANNEL_ID}-{i}",
+					"text": f"Message number {i}",
+					"channel_id": CHANNEL_ID,
+					"message_type": "Text",
+					"is_bot_message": i % 2,
+					"creation": creation,
+					"modified": creation,
+				}
+			).db_insert()
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_split_by_budget(self):
+		"""
+		The newest messages which fit in the budget are the history, all older ones are overflow - both in chronological order
+		"""
+		rows = [get_row(3, "three"), get_row(2, "two " * 50), get_row(1, "one"), get_row(0, "")]
+
+		budget = count_tokens("three", MODEL) + count_tokens("one", MODEL)
+		history, overflow = split_by_budget(rows, budget, MODEL)
+
+		self.assertEqual([entry["content"] for entry in history], ["three"])
+		# The small older message is not pulled into the history past a message which does not fit - empty ones are skipped
+		self.assertEqual([entry["content"] for entry in overflow], ["one", "two " * 50])
+
+	def test_history_roles(self):
+		history, _overflow = split_by_budget(
+			[get_row(1, "Hi, how can I help?", is_bot_message=True), get_row(0, "Hello")], 1000, MODEL
+		)
+
+		self.assertEqual([entry["role"] for entry in history], ["user", "assistant"])
+
+	def test_build_conversation_history(self):
+		"""
+		The history is built from the messages before the current message, within the token budget of the bot
+		"""
+		message = frappe.get_doc("Raven Message", f"{CHANNEL_ID}-9")
+		budget = sum(count_tokens(f"Message number {i}", MODEL) for i in range(5, 9))
+
+		history = build_conversation_history(
+			CHANNEL_ID, message, frappe._dict(model=MODEL, history_token_budget=budget)
+		)
+
+		self.assertIsNone(history.summary)
+		self.assertEqual(
+			[entry["content"] for entry in history.messages], [f"Message number {i}" for i in range(5, 9)]
+		)
+		self.assertEqual(
+			[entry["content"] for entry in history.overflow], [f"Message number {i}" for i in range(5)]
+		)
+
+	def test_build_conversation_history_with_summary(self):
+		"""
+		Messages folded into the summary are left out of the history, and the summary takes up part of the budget
+		"""
+		summary = "The user said hello a few times."
+		until = frappe.db.get_value("Raven Message", f"{CHANNEL_ID}-4", "creation")
+		save_summary(CHANNEL_ID, summary, until)
+
+		message = frappe.get_doc("Raven Message", f"{CHANNEL_ID}-9")
+		budget = count_tokens(summary, MODEL) + sum(
+			count_tokens(f"Message number {i}", MODEL) for i in range(7, 9)
+		)
+
+		history = build_conversation_history(
+			CHANNEL_ID, message, frappe._dict(model=MODEL, history_token_budget=budget)
+		)
+
+		self.assertEqual(history.summary, summary)
+		self.assertEqual(
+			[entry["content"] for entry in history.messages], [f"Message number {i}" for i in range(7, 9)]
+		)
+		# Only the messages after the summary which do not fit are overflow
+		self.assertEqual(
+			[entry["content"] for entry in history.overflow], [f"Message number {i}" for i in range(5, 7)]
+		)
@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from raven.ai.jobs import acquire_slot, enqueue_ai_job, get_in_flight_key, get_limits, release_slot
+
+BOT = "Test AI Jobs Bot"
+USER = "test@example.com"
+
+
+class TestAIJobs(IntegrationTestCase):
+	def setUp(self):
+		self.clear_slots()
+
+	def tearDown(self):
+		self.clear_slots()
+
+	def clear_slots(self):
+		frappe.cache().delete(*get_limits(BOT, USER))
+
+	def get_user_limit(self):
+		return get_limits(BOT, USER)[get_in_flight_key("user", USER)]
+
+	def test_jobs_in_flight_are_limited_per_user(self):
+		job_ids = [f"job-{i}" for i in range(self.get_user_limit())]
+
+		for job_id in job_ids:
+			self.assertTrue(acquire_slot(BOT, USER, job_id))
+
+		self.assertFalse(acquire_slot(BOT, USER, "job-over-limit"))
+
+		# Another user of the same bot is not affected
+		self.assertTrue(acquire_slot(BOT, "test1@example.com", "job-other-user"))
+		release_slot(BOT, "test1@example.com", "job-other-user")
+
+		release_slot(BOT, USER, job_ids[0])
+		self.assertTrue(acquire_slot(BOT, USER, "job-after-release"))
+
+	def test_slot_is_released_if_enqueue_fails(self):
+		bot = frappe._dict(name=BOT)
+
+		with patch("frappe.enqueue", side_effect=RedisConnectionError("Queue is not available")):
+			# A job still holding its slot would make the last attempts reply that the bot is busy instead of raising
+			for _i in range(self.get_user_limit() + 1):
+				with self.assertRaises(RedisConnectionError):
+					enqueue_ai_job(
+						"raven.ai.ai.handle_ai_thread_message",
+						bot=bot,
+						user=USER,
+						channel_id="test-channel",
+						job_name="test",
+					)
+
+		# None of the failed jobs hold a slot
+		for key in get_limits(BOT, USER):
+			self.assertEqual(frappe.cache().zcard(key), 0)
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from frappe.tests import IntegrationTestCase
+
+from raven.ai import retrieval
+from raven.ai.file_extraction import get_extraction_path, get_file_hash
+from raven.ai.retrieval import CHUNK_OVERLAP, CHUNK_SIZE, build_index, chunk_text, load_index, search_index
+
+
+def get_lines(count: int, words_per_line: int = 10, prefix: str = "line") -> str:
+	return "\n".join(" ".join([f"{prefix}{i}"] * words_per_line) for i in range(count))
+
+
+class TestRetrieval(IntegrationTestCase):
+	def setUp(self):
+		self.files = []
+
+	def tearDown(self):
+		for path in self.files:
+			if os.path.exists(path):
+				os.remove(path)
+
+	def create_file(self, content: str, extension: str = "txt", track_extraction: bool = True) -> str:
+		with tempfile.NamedTemporaryFile(mode="w", suffix=f".{extension}", delete=False) as f:
+			f.write(content)
+
+		self.files.append(f.name)
+		if track_extraction:
+			self.files.append(get_extraction_path(get_file_hash(f.name)))
+
+		return f.name
+
+	def test_chunk_text(self):
+		"""
+		Chunks are split along lines, with consecutive chunks sharing up to CHUNK_OVERLAP words
+		"""
+		chunks = chunk_text(get_lines(50), "notes.txt", page=3)
+
+		self.assertGreater(len(chunks), 1)
+
+		for chunk in chunks:
+			self.assertEqual(chunk["file_name"], "notes.txt")
+			self.assertEqual(chunk["page"], 3)
+			self.assertLessEqual(len(chunk["text"].split()), CHUNK_SIZE)
+
+		first_lines, second_lines = chunks[0]["text"].split("\n"), chunks[1]["text"].split("\n")
+		overlap = CHUNK_OVERLAP // 10
+		self.assertEqual(first_lines[-overlap:], second_lines[:overlap])
+
+		# No line is lost
+		lines = {line for chunk in chunks for line in chunk["text"].split("\n")}
+		self.assertEqual(lines, set(get_lines(50).split("\n")))
+
+	def test_chunk_text_with_long_lines(self):
+		"""
+		Lines longer than a chunk are split, empty lines are skipped
+		"""
+		chunks = chunk_text("word " * (CHUNK_SIZE * 2 + 10) + "\n\n   \n", "long.txt")
+
+		self.assertEqual(len(chunks), 3)
+		self.assertEqual(sum(len(chunk["text"].split()) for chunk in chunks), CHUNK_SIZE * 2 + 10)
+		self.assertEqual(chunk_text("\n \n", "empty.txt"), [])
+
+	def test_build_and_search_index(self):
+		invoices = self.create_file("Invoices are due within 30 days.\nLate invoices are charged a fee.")
+		refunds = self.create_file("Refunds are paid within 14 days of the refund request.")
+
+		index = build_index(
+			[
+				{"file_name": name, "file_path": path, "file_type": "txt", "content_hash": None}
+				for name, path in (("invoices.txt", invoices), ("refunds.txt", refunds))
+			]
+		)
+
+		self.assertEqual(len(index["chunks"]), 2)
+		self.assertEqual(index["lengths"], [11, 10])
+		self.assertEqual(index["postings"]["invoices"], [[0, 2]])
+
+		results = search_index(index, "refund policy")
+		self.assertEqual([result["file_name"] for result in results], ["refunds.txt"])
+		self.assertGreater(results[0]["score"], 0)
+
+		# Chunks matching more (and rarer) terms come first
+		results = search_index(index, "days refund")
+		self.assertEqual([result["file_name"] for result in results], ["refunds.txt", "invoices.txt"])
+		self.assertEqual(len(search_index(index, "days refund", top_k=1)), 1)
+
+		self.assertEqual(search_index(index, "shipping"), [])
+		self.assertEqual(search_index({"chunks": [], "lengths": [], "postings": {}}, "refund"), [])
+
+	def test_loaded_indexes_are_bounded(self):
+		"""
+		Only the most recently used indexes are kept in memory
+		"""
+		paths = [
+			self.create_file(json.dumps({"version": i}), "json", track_extraction=False) for i in range(3)
+		]
+
+		with patch.object(retrieval, "MAX_LOADED_INDEXES", 2), patch.dict(retrieval._loaded_indexes, clear=True):
+			load_index(paths[0])
+			load_index(paths[1])
+			# Using an index makes it the most recently used
+			load_index(paths[0])
+			load_index(paths[2])
+
+			self.assertEqual(list(retrieval._loaded_indexes), [paths[0], paths[2]])
+			self.assertEqual(load_index(paths[1]), {"version": 1})
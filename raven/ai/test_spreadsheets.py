@@ -0,0 +1,149 @@
+import datetime
+import os
+import tempfile
+
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.spreadsheets import (
+	MAX_ROW_LIMIT,
+	format_cell,
+	get_rows,
+	get_summary_markdown,
+	summarize_spreadsheet,
+)
+
+CSV_CONTENT = """Customer;Country;Amount;Status
+Acme Corp;India;1,200.50;Paid
+Globex;United States;300;Unpaid
+;;;
+Initech;India;75;Unpaid
+Umbrella | Labs;Germany;;Paid
+Hooli;India;450;Unpaid
+"""
+
+
+class TestSpreadsheets(IntegrationTestCase):
+	def setUp(self):
+		with tempfile.NamedTemporaryFile(
+			mode="w", suffix=".csv", delete=False, encoding="utf-8"
+		) as f:
+			f.write(CSV_CONTENT)
+
+		self.file_path = f.name
+
+	def tearDown(self):
+		os.remove(self.file_path)
+
+	def test_summarize_spreadsheet(self):
+		"""
+		The delimiter is detected, empty rows are skipped and column types are inferred from the values
+		"""
+		(summary,) = summarize_spreadsheet(self.file_path, "csv")
+
+		self.assertIsNone(summary["sheet"])
+		self.assertEqual(summary["row_count"], 5)
+		self.assertEqual(
+			[column["name"] for column in summary["columns"]],
+			["Customer", "Country", "Amount", "Status"],
+		)
+
+		amount = summary["columns"][2]
+		self.assertEqual(amount["type"], "number")
+		self.assertEqual(amount["non_empty"], 4)
+		self.assertEqual((amount["min"], amount["max"]), (75, 1200.5))
+
+		status = summary["columns"][3]
+		self.assertEqual(status["type"], "text")
+		self.assertEqual(status["sample_values"], ["Paid", "Unpaid"])
+
+		markdown = get_summary_markdown([summary])
+		self.assertIn("## Data (5 rows)", markdown)
+		self.assertIn("Umbrella \\| Labs", markdown)
+
+	def test_get_rows_window(self):
+		rows = get_rows(self.file_path, "csv", start_row=1, limit=2)
+
+		self.assertEqual(rows["matching_rows"], 5)
+		self.assertEqual(rows["rows_returned"], 2)
+		self.assertEqual(rows["start_row"], 1)
+		self.assertIn("| Globex | United States | 300 | Unpaid |", rows["content"])
+		self.assertIn("| Initech | India | 75 | Unpaid |", rows["content"])
+		self.assertNotIn("Acme Corp", rows["content"])
+
+		# The limit is clamped
+		self.assertEqual(get_rows(self.file_path, "csv", limit=-5)["rows_returned"], 1)
+		self.assertEqual(
+			get_rows(self.file_path, "csv", limit=MAX_ROW_LIMIT * 10)["rows_returned"],
+			5,
+		)
+
+	def test_get_rows_with_filters(self):
+		"""
+		Filters match cells containing the value (case insensitive), and the window applies to the matching rows
+		"""
+		rows = get_rows(
+			self.file_path, "csv", filters={"country": "INDIA", "Status": "unpaid"}
+		)
+
+		self.assertEqual(rows["matching_rows"], 2)
+		self.assertIsNone(rows["unknown_filter_columns"])
+		self.assertIn("Initech", rows["content"])
+		self.assertIn("Hooli", rows["content"])
+		self.assertNotIn("Acme Corp", rows["content"])
+
+		rows = get_rows(
+			self.file_path,
+			"csv",
+			start_row=1,
+			filters={"country": "india", "status": "unpaid"},
+		)
+		self.assertEqual(rows["matching_rows"], 2)
+		self.assertEqual(rows["rows_returned"], 1)
+		self.assertIn("Hooli", rows["content"])
+
+	def test_get_rows_with_unknown_filter_column(self):
+		"""
+		Filters on columns which are not in the sheet are ignored and reported
+		"""
+		rows = get_rows(
+			self.file_path, "csv", filters={"Region": "Asia", "Status": "paid"}
+		)
+
+		self.assertEqual(rows["unknown_filter_columns"], ["region"])
+		# "paid" is also contained in "Unpaid"
+		self.assertEqual(rows["matching_rows"], 5)
+
+	def test_get_rows_of_missing_sheet(self):
+		rows = get_rows(self.file_path, "csv", sheet="Invoices")
+
+		self.assertEqual(rows["error"], "Sheet 'Invoices' not found")
+		self.assertEqual(rows["sheets"], [None])
+
+	def test_format_dates(self):
+		"""
+		Datetimes at midnight (dates in Excel files) are shown as dates
+		"""
+		self.assertEqual(format_cell(datetime.datetime(2024, 1, 1)), "2024-01-01")
+		self.assertEqual(format_cell(datetime.datetime(2024, 1, 1, 9, 30)), "2024-01-01 09:30:00")
+		self.assertEqual(format_cell(datetime.date(2024, 1, 1)), "2024-01-01")
+
+	def test_xlsx_with_dates(self):
+		from openpyxl import Workbook
+
+		workbook = Workbook()
+		worksheet = workbook.active
+		worksheet.title = "Invoices"
+		worksheet.append(["Invoice", "Date", "Paid At"])
+		worksheet.append(["INV-1", datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 5, 14, 0)])
+
+		with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
+			workbook.save(f.name)
+
+		self.addCleanup(os.remove, f.name)
+
+		(summary,) = summarize_spreadsheet(f.name, "xlsx")
+		self.assertEqual(summary["sheet"], "Invoices")
+		self.assertEqual(summary["preview"], [["INV-1", "2024-01-01", "2024-01-05 14:00:00"]])
+
+		rows = get_rows(f.name, "xlsx", sheet="invoices")
+		self.assertIn("| INV-1 | 2024-01-01 | 2024-01-05 14:00:00 |", rows["content"])
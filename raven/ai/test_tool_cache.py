@@ -0,0 +1,55 @@
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.tool_cache import (
+	clear_pending_tool_caches,
+	clear_tool_cache,
+	get_cached_result,
+)
+
+DOCTYPE = "ToDo"
+
+
+class TestToolCache(IntegrationTestCase):
+	def setUp(self):
+		clear_tool_cache(DOCTYPE)
+		self.calls = 0
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def get_result(self, args=None, result=None):
+		def compute():
+			self.calls += 1
+			return result if result is not None else {"count": self.calls}
+
+		return get_cached_result("Get List", "get_todos", DOCTYPE, args or {"limit": 10}, compute)
+
+	def test_results_are_cached_per_arguments(self):
+		self.assertEqual(self.get_result(), {"count": 1})
+		self.assertEqual(self.get_result(), {"count": 1})
+
+		self.assertEqual(self.get_result({"limit": 20}), {"count": 2})
+		self.assertEqual(self.calls, 2)
+
+	def test_failed_results_are_not_cached(self):
+		self.get_result(result={"success": False, "error": "Something went wrong"})
+		self.get_result(result={"success": False, "error": "Something went wrong"})
+
+		self.assertEqual(self.calls, 2)
+
+	def test_results_are_invalidated_on_change(self):
+		"""
+		Changing a document of the doctype invalidates the results - right away and again once the change is committed
+		"""
+		self.get_result()
+
+		frappe.get_doc({"doctype": DOCTYPE, "description": "Invalidate the AI tool cache"}).insert()
+		self.assertEqual(self.get_result(), {"count": 2})
+
+		# Another worker cached the data from before the commit under the new version
+		self.assertEqual(self.get_result(), {"count": 2})
+
+		# The change is committed
+		clear_pending_tool_caches()
+		self.assertEqual(self.get_result(), {"count": 3})
@@ -0,0 +1,67 @@
+import threading
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.ai.tool_executor import execute_tool_calls
+
+
+def execute(call):
+	if call["fail"]:
+		raise frappe.ValidationError(f"Call {call['id']} failed")
+
+	return {"id": call["id"], "thread": threading.get_ident(), "user": frappe.session.user}
+
+
+def is_read_only(call):
+	return call["read_only"]
+
+
+CALLS = [
+	{"id": 0, "read_only": True, "fail": False},
+	{"id": 1, "read_only": True, "fail": True},
+	{"id": 2, "read_only": True, "fail": False},
+	{"id": 3, "read_only": False, "fail": False},
+	{"id": 4, "read_only": True, "fail": False},
+]
+
+
+class TestToolExecutor(IntegrationTestCase):
+	def test_sequential_tool_calls(self):
+		"""
+		In tests (or if the transaction has writes), all calls are run in the current thread
+		"""
+		results = execute_tool_calls(CALLS, is_read_only, execute)
+
+		self.assert_results(results)
+		self.assertTrue(all(output["thread"] == threading.get_ident() for output, _error in results if output))
+
+	def test_parallel_tool_calls(self):
+		"""
+		Consecutive read-only calls are run in the thread pool as the current user, the others in the current thread
+		"""
+		with patch("raven.ai.tool_executor.can_run_in_parallel", return_value=True):
+			results = execute_tool_calls(CALLS, is_read_only, execute)
+
+		self.assert_results(results)
+
+		self.assertNotEqual(results[0][0]["thread"], threading.get_ident())
+		self.assertEqual(results[0][0]["user"], frappe.session.user)
+		self.assertEqual(results[3][0]["thread"], threading.get_ident())
+		# A single read-only call is not worth a thread
+		self.assertEqual(results[4][0]["thread"], threading.get_ident())
+
+	def assert_results(self, results):
+		"""
+		Results are in the order of the calls, and a failed call does not affect the others
+		"""
+		self.assertEqual(len(results), len(CALLS))
+
+		for call, (output, error) in zip(CALLS, results):
+			if call["fail"]:
+				self.assertIsNone(output)
+				self.assertIn(f"Call {call['id']} failed", error)
+			else:
+				self.assertEqual(output["id"], call["id"])
+				self.assertIsNone(error)
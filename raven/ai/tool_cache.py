@@ -0,0 +1,112 @@
+"""
+Cache of the results of read-only AI function calls, shared by all workers of a site via Redis.
+
+Results are cached per function, arguments and user (so that permissions of the user are respected) with a TTL per
+function type. When a document of the referenced doctype changes, the cached results for that doctype are invalidated
+by bumping a version number which is part of the cache key (when the document changes and again when the change is
+committed) - the stale entries are left to expire.
+"""
+
+import hashlib
+import json
+
+import frappe
+
+# Time (in seconds) for which the results of a function type are cached. Function types which are not listed are not cached.
+TOOL_CACHE_TTL = {
+	"Get Document": 300,
+	"Get Multiple Documents": 300,
+	"Get Amended Document": 300,
+	"Get Value": 120,
+	"Get List": 60,
+	"Get Report Result": 120,
+}
+
+# Set of doctypes which have cached results - only changes to these doctypes need to invalidate anything
+CACHED_DOCTYPES_KEY = "raven:ai_tool_cache_doctypes"
+
+
+def get_version_key(doctype: str) -> str:
+	# Raw redis commands are used for the version counter, hence the key is prefixed with the site name
+	return frappe.cache().make_key(f"raven:ai_tool_cache_version:{doctype}")
+
+
+def get_cache_key(function_name: str, doctype: str, args: dict) -> str:
+	version = int(frappe.cache().get(get_version_key(doctype)) or 0)
+	args_hash = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()
+
+	return f"raven:ai_tool_result:{doctype}:{version}:{function_name}:{frappe.session.user}:{args_hash}"
+
+
+def get_referenced_doctype(function_type: str, reference_doctype: str = None, args: dict = None):
+	"""
+	Doctype whose changes invalidate the results of a function call. Reports are invalidated by their reference doctype.
+	"""
+	if function_type == "Get Report Result" and args and args.get("report_name"):
+		return frappe.get_cached_value("Report", args.get("report_name"), "ref_doctype")
+
+	return reference_doctype
+
+
+def get_cached_result(function_type: str, function_name: str, doctype: str, args: dict, compute):
+	"""
+	Get the cached result of a function call, or call `compute()` and cache its result.
+
+	Only function types in TOOL_CACHE_TTL which reference a doctype are cached. Failed calls are not cached.
+	"""
+	ttl = TOOL_CACHE_TTL.get(function_type)
+
+	if not ttl or not doctype:
+		return compute()
+
+	# Register the doctype before computing the result so that changes made in the meantime invalidate it
+	frappe.cache().sadd(CACHED_DOCTYPES_KEY, doctype)
+
+	key = get_cache_key(function_name, doctype, args)
+	result = frappe.cache().get_value(key)
+
+	if result is not None:
+		return result
+
+	result = compute()
+
+	if not (isinstance(result, dict) and result.get("success") is False):
+		frappe.cache().set_value(key, result, expires_in_sec=ttl)
+
+	return result
+
+
+def clear_tool_cache(doctype: str):
+	frappe.cache().incr(get_version_key(doctype))
+
+
+def invalidate_tool_cache(doc, method=None):
+	"""
+	Hooked to the events of all doctypes - invalidate the cached results of AI functions for the doctype of the document
+	"""
+	if frappe.flags.in_install or frappe.flags.in_migrate:
+		return
+
+	if not frappe.cache().sismember(CACHED_DOCTYPES_KEY, doc.doctype):
+		return
+
+	clear_tool_cache(doc.doctype)
+
+	# Until the transaction is committed, other workers still read the old data - and may cache it under the new version.
+	# Hence the version is bumped again once the change is committed.
+	pending = frappe.flags.raven_ai_tool_cache_pending
+
+	if pending is None:
+		pending = frappe.flags.raven_ai_tool_cache_pending = set()
+		frappe.db.after_commit.add(clear_pending_tool_caches)
+		frappe.db.after_rollback.add(lambda: frappe.flags.pop("raven_ai_tool_cache_pending", None))
+
+	pending.add(doc.doctype)
+
+
+def clear_pending_tool_caches():
+	"""
+	Invalidate the cached results for the doctypes which were changed in the committed transaction
+	"""
+	for doctype in frappe.flags.pop("raven_ai_tool_cache_pending", None) or ():
+		clear_tool_cache(doctype)
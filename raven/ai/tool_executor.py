@@ -0,0 +1,129 @@
+"""
+Execution of the tool calls of AI bots.
+
+Tool calls of read-only function types do not depend on each other, so they are run concurrently in a thread pool.
+Each thread sets up its own site context (and database connection) for the current user.
+Tool calls which can write are run one by one in the current thread, in the order in which the model issued them.
+"""
+
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+
+READ_ONLY_FUNCTION_TYPES = (
+	"Get Document",
+	"Get Multiple Documents",
+	"Get List",
+	"Get Value",
+	"Get Report Result",
+	"Get Amended Document",
+)
+
+# Maximum number of tool calls run at the same time (per worker process)
+MAX_PARALLEL_TOOL_CALLS = 4
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+	global _executor
+
+	if _executor is None:
+		_executor = ThreadPoolExecutor(
+			max_workers=MAX_PARALLEL_TOOL_CALLS, thread_name_prefix="raven_ai_tool"
+		)
+
+	return _executor
+
+
+def is_read_only_function(function_type: str) -> bool:
+	return function_type in READ_ONLY_FUNCTION_TYPES
+
+
+def can_run_in_parallel() -> bool:
+	"""
+	Threads use their own database connection and cannot see uncommitted changes of the current transaction.
+	If anything was written in this transaction (or in tests, where nothing is committed), tool calls are run sequentially.
+	"""
+	return not frappe.flags.in_test and not frappe.db.transaction_writes
+
+
+def run_in_site_context(site: str, sites_path: str, user: str, func, *args, **kwargs):
+	frappe.init(site=site, sites_path=sites_path)
+	frappe.connect()
+
+	try:
+		frappe.set_user(user)
+		return func(*args, **kwargs)
+	finally:
+		frappe.destroy()
+
+
+def submit(func, *args, **kwargs):
+	"""
+	Run a function in the thread pool as the current user of the current site. Returns a Future.
+	"""
+	return get_executor().submit(
+		run_in_site_context,
+		frappe.local.site,
+		frappe.local.sites_path,
+		frappe.session.user,
+		func,
+		*args,
+		**kwargs,
+	)
+
+
+async def run_read_only(func, *args, **kwargs):
+	"""
+	Await a read-only function - run in the thread pool if possible so that other tool calls are not blocked
+	"""
+	if not can_run_in_parallel():
+		return func(*args, **kwargs)
+
+	return await asyncio.wrap_future(submit(func, *args, **kwargs))
+
+
+def execute_tool_calls(calls: list, is_read_only, execute) -> list[tuple]:
+	"""
+	Run `execute(call)` for every call.
+
+	Consecutive read-only calls (as per `is_read_only(call)`) are run concurrently. All other calls are run sequentially
+	in the current thread so that they see the changes of the calls before them.
+
+	Returns a list of (output, error traceback) in the order of the calls.
+	"""
+	results = [None] * len(calls)
+	batch = []
+
+	def run(call):
+		try:
+			return execute(call), None
+		except Exception:
+			return None, traceback.format_exc()
+
+	def run_batch():
+		if len(batch) == 1:
+			results[batch[0]] = run(calls[batch[0]])
+		elif batch:
+			futures = {index: submit(run, calls[index]) for index in batch}
+			for index, future in futures.items():
+				results[index] = future.result()
+
+		batch.clear()
+
+	parallel = can_run_in_parallel()
+
+	for index, call in enumerate(calls):
+		if parallel and is_read_only(call):
+			batch.append(index)
+			continue
+
+		run_batch()
+		results[index] = run(call)
+
+	run_batch()
+
+	return results
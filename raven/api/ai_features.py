@@ -67,6 +67,17 @@ def get_openai_available_models():
 	return compatible_models
 
 
+@frappe.whitelist(methods=["GET"])
+def get_ai_queue_metrics():
+	"""
+	API to get the depth of the AI job queue and the number of jobs in flight per bot and user
+	"""
+	frappe.only_for(["System Manager", "Raven Admin"])
+	from raven.ai.jobs import get_ai_queue_metrics
+
+	return get_ai_queue_metrics()
+
+
 @frappe.whitelist(allow_guest=True)
 def test_llm_configuration(provider: str = "OpenAI", api_url: str = None, api_key: str = None, endpoint: str = None, api_version: str = None, deployment_name: str = None):
 	"""
@@ -3,8 +3,29 @@ import datetime
 import frappe
 from frappe import _
 from frappe.query_builder import Order
-
-from raven.utils import track_channel_visit
+from frappe.utils import add_days, add_to_date, cint, get_datetime, now_datetime
+from pypika.terms import ValueWrapper
+
+from raven.message_cache import (
+	LATEST_MESSAGES_CACHE_SIZE,
+	MESSAGE_FIELDS,
+	get_cache_version,
+	get_latest_messages,
+	set_latest_messages,
+)
+from raven.raven_messaging.doctype.raven_message_tombstone.raven_message_tombstone import (
+	TOMBSTONE_RETENTION_DAYS,
+)
+from raven.utils import (
+	decode_cursor,
+	encode_cursor,
+	get_keyset_condition,
+	get_paginated_results,
+	track_channel_visit,
+)
+
+# Maximum number of changed messages returned in a page by `get_channel_changes`
+MAX_CHANGES_PAGE_SIZE = 1000
 
 
 @frappe.whitelist()
@@ -22,99 +43,157 @@ def get_messages(channel_id: str, limit: int = 20, base_message: str | None = No
 	if base_message:
 		return get_messages_around_base(channel_id, base_message)
 
+	limit = cint(limit)
+
+	# The latest messages of a channel are served from the cache if possible
+	cached_messages = get_latest_messages(channel_id, limit)
+
+	if cached_messages is not None:
+		messages, has_old_messages = cached_messages
+	else:
+		messages, has_old_messages = fetch_latest_messages(channel_id, limit)
+
+	track_channel_visit(channel_id=channel_id, commit=True)
+	return {
+		"messages": messages,
+		"has_old_messages": has_old_messages,
+		"has_new_messages": False,
+		**get_page_cursors(messages),
+	}
+
+
+def fetch_latest_messages(channel_id: str, limit: int = 20):
+	"""
+	Fetch the latest messages of a channel from the database and populate the cache with them.
+
+	At least `LATEST_MESSAGES_CACHE_SIZE` messages are fetched so that subsequent requests can be served from the cache.
+	"""
+	version = get_cache_version(channel_id)
+
+	# Earlier reads of this request (permission checks etc.) may have opened the snapshot of the transaction (REPEATABLE READ)
+	# before the version was read - so a message committed in between would be missing from the rows, yet cached under
+	# the newer version. Start a new snapshot after reading the version. This is not possible if the transaction has writes,
+	# in which case the rows are returned but not cached.
+	can_populate_cache = start_new_snapshot()
+
 	# Cannot use `get_all` as it does not apply the `order_by` clause to multiple fields
 	message = frappe.qb.DocType("Raven Message")
 
-	messages = (
-		frappe.qb.from_(message)
-		.select(
-			message.name,
-			message.owner,
-			message.creation,
-			message.modified,
-			message.text,
-			message.file,
-			message.message_type,
-			message.message_reactions,
-			message.is_reply,
-			message.linked_message,
-			message._liked_by,
-			message.channel_id,
-			message.thumbnail_width,
-			message.thumbnail_height,
-			message.file_thumbnail,
-			message.link_doctype,
-			message.link_document,
-			message.replied_message_details,
-			message.content,
-			message.is_edited,
-			message.is_forwarded,
-			message.poll_id,
-			message.is_bot_message,
-			message.bot,
-			message.hide_link_preview,
-			message.is_thread,
-			message.blurhash,
-		)
+	query = (
+		get_messages_query(message)
 		.where(message.channel_id == channel_id)
 		.orderby(message.creation, order=Order.desc)
 		.orderby(message.name, order=Order.desc)
-		.limit(limit)
-		.run(as_dict=True)
 	)
 
-	has_old_messages = False
-
-	# Check if older messages are available
-	if len(messages) == limit:
-		# Check if there are more messages available
-		older_message = frappe.db.get_all(
-			"Raven Message",
-			pluck="name",
-			filters={"channel_id": channel_id, "creation": ("<", messages[-1].creation)},
-			order_by="creation desc, name desc",
-			limit=1,
-		)
+	messages, has_old_messages = get_paginated_results(
+		query, max(limit, LATEST_MESSAGES_CACHE_SIZE)
+	)
 
-		if len(older_message) > 0:
-			has_old_messages = True
+	if can_populate_cache:
+		set_latest_messages(channel_id, messages, has_old_messages, version)
 
-	track_channel_visit(channel_id=channel_id, commit=True)
-	return {
-		"messages": messages,
-		"has_old_messages": has_old_messages,
-		"has_new_messages": False,
-	}
+	return messages[:limit], has_old_messages or len(messages) > limit
 
 
-def get_messages_around_base(channel_id: str, base_message: str):
+def start_new_snapshot() -> bool:
 	"""
-	Get 10 messages before base message and 10 messages after
+	End the current transaction (if it has no writes) so that the next query reads from a new snapshot of the database.
+
+	Returns False if the transaction has writes - they are not committed (or discarded) by this read.
 	"""
-	# Fetch older messages for the channel
-	from_timestamp = frappe.get_cached_value("Raven Message", base_message, "creation")
+	if frappe.db.transaction_writes:
+		return False
+
+	# Nothing to roll back - this only ends the transaction (and its snapshot)
+	frappe.db.rollback()
+	return True
+
+
+def get_messages_around_base(channel_id: str, base_message: str, limit: int = 10):
+	"""
+	Get 10 messages before base message and 10 messages after (the base message is included in the newer messages)
 
-	# TODO: Optimize this to use a complex SQL query to fetch around the main message
-	older_messages = fetch_older_messages(channel_id, base_message, from_timestamp, 10)
-	newer_messages = fetch_newer_messages(
-		channel_id, base_message, from_timestamp, 10, include_from_message=True
+	Both sides of the window are fetched in a single UNION query. Each side fetches one extra row
+	so that we know whether more messages are available without firing another query.
+	The timestamp of the base message is resolved via a subquery instead of a separate lookup.
+	"""
+	message = frappe.qb.DocType("Raven Message")
+	base = frappe.qb.DocType("Raven Message").as_("base")
+
+	base_creation = frappe.qb.from_(base).select(base.creation).where(base.name == base_message)
+
+	older_query = (
+		get_messages_query(message)
+		.select(ValueWrapper("older", alias="_window"))
+		.where(message.channel_id == channel_id)
+		.where(get_keyset_condition(message, base_creation, base_message, older=True))
+		.orderby(message.creation, order=Order.desc)
+		.orderby(message.name, order=Order.desc)
+		.limit(limit + 1)
+	)
+
+	newer_query = (
+		get_messages_query(message)
+		.select(ValueWrapper("newer", alias="_window"))
+		.where(message.channel_id == channel_id)
+		.where(
+			get_keyset_condition(message, base_creation, base_message, older=False, inclusive=True)
+		)
+		.orderby(message.creation, order=Order.asc)
+		.orderby(message.name, order=Order.asc)
+		.limit(limit + 1)
 	)
 
-	combined_messages = newer_messages.get("messages", []) + older_messages.get("messages", [])
+	rows = older_query.union_all(newer_query).run(as_dict=True)
+
+	older_messages = []
+	newer_messages = []
+
+	for row in rows:
+		window = row.pop("_window")
+		if window == "older":
+			older_messages.append(row)
+		else:
+			newer_messages.append(row)
+
+	# UNION does not guarantee the order of the rows, so sort each side of the window (newest first)
+	older_messages.sort(key=lambda m: (m.creation, m.name), reverse=True)
+	newer_messages.sort(key=lambda m: (m.creation, m.name), reverse=True)
+
+	has_old_messages = len(older_messages) > limit
+	has_new_messages = len(newer_messages) > limit
+
+	# Drop the extra rows - these are the ones furthest away from the base message
+	older_messages = older_messages[:limit]
+	newer_messages = newer_messages[-limit:]
+
+	from_timestamp = None
+	for m in newer_messages:
+		if m.name == base_message:
+			from_timestamp = m.creation
+			break
+
+	messages = newer_messages + older_messages
 
 	return {
-		**older_messages,
-		**newer_messages,
-		"messages": combined_messages,
+		"messages": messages,
+		"has_old_messages": has_old_messages,
+		"has_new_messages": has_new_messages,
 		"from_timestamp": from_timestamp,
+		**get_page_cursors(messages),
 	}
 
 
 @frappe.whitelist()
-def get_older_messages(channel_id: str, from_message: str, limit: int = 20):
+def get_older_messages(
+	channel_id: str, from_message: str | None = None, limit: int = 20, cursor: str | None = None
+):
 	"""
 	API to get older messages for a channel, ordered by creation date (newest first)
 
+	Pass the `older_cursor` returned with the previous page as `cursor` to skip the lookup of the `from_message`.
+
 	Function is split into two to avoid duplicate perm check and timestamp check
 	"""
 
@@ -122,7 +201,7 @@ def get_older_messages(channel_id: str, from_message: str, limit: int = 20):
 	if not frappe.has_permission(doctype="Raven Channel", doc=channel_id, ptype="read"):
 		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
 	# Fetch older messages for the channel
-	from_timestamp = frappe.get_cached_value("Raven Message", from_message, "creation")
+	from_timestamp, from_message = get_cursor_position(from_message, cursor)
 
 	return fetch_older_messages(channel_id, from_message, from_timestamp, limit)
 
@@ -133,75 +212,31 @@ def fetch_older_messages(
 	# Cannot use `get_all` as it does not apply the `order_by` clause to multiple fields
 	message = frappe.qb.DocType("Raven Message")
 
-	messages = (
-		frappe.qb.from_(message)
-		.select(
-			message.name,
-			message.owner,
-			message.creation,
-			message.modified,
-			message.text,
-			message.file,
-			message.message_type,
-			message.message_reactions,
-			message.is_reply,
-			message.linked_message,
-			message._liked_by,
-			message.channel_id,
-			message.thumbnail_width,
-			message.thumbnail_height,
-			message.file_thumbnail,
-			message.link_doctype,
-			message.link_document,
-			message.replied_message_details,
-			message.content,
-			message.is_edited,
-			message.is_forwarded,
-			message.poll_id,
-			message.is_bot_message,
-			message.bot,
-			message.hide_link_preview,
-			message.is_thread,
-			message.blurhash,
-		)
+	query = (
+		get_messages_query(message)
 		.where(message.channel_id == channel_id)
-		.where(
-			(message.creation < from_timestamp)
-			| ((message.creation == from_timestamp) & (message.name < from_message))
-		)
+		.where(get_keyset_condition(message, from_timestamp, from_message, older=True))
 		.orderby(message.creation, order=Order.desc)
 		.orderby(message.name, order=Order.desc)
-		.limit(limit)
-		.run(as_dict=True)
 	)
 
-	has_old_messages = False
-
-	# Check if older messages are available
-	if len(messages) == limit:
-		# Check if there are more messages available
-		older_message = frappe.db.get_all(
-			"Raven Message",
-			pluck="name",
-			filters={
-				"channel_id": channel_id,
-				"creation": ("<=", messages[-1].creation),
-				"name": ["!=", messages[-1].name],
-			},
-			order_by="creation desc, name desc",
-			limit=1,
-		)
-
-		if len(older_message) > 0:
-			has_old_messages = True
+	messages, has_old_messages = get_paginated_results(query, limit)
 
-	return {"messages": messages, "has_old_messages": has_old_messages}
+	return {
+		"messages": messages,
+		"has_old_messages": has_old_messages,
+		**get_page_cursors(messages),
+	}
 
 
 @frappe.whitelist()
-def get_newer_messages(channel_id: str, from_message: str, limit: int = 20):
+def get_newer_messages(
+	channel_id: str, from_message: str | None = None, limit: int = 20, cursor: str | None = None
+):
 	"""
-	API to get older messages for a channel, ordered by creation date (newest first)
+	API to get newer messages for a channel, ordered by creation date (newest first)
+
+	Pass the `newer_cursor` returned with the previous page as `cursor` to skip the lookup of the `from_message`.
 	"""
 
 	# Check permission for channel access
@@ -209,7 +244,7 @@ def get_newer_messages(channel_id: str, from_message: str, limit: int = 20):
 		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
 
 	# Fetch older messages for the channel
-	from_timestamp = frappe.get_cached_value("Raven Message", from_message, "creation")
+	from_timestamp, from_message = get_cursor_position(from_message, cursor)
 
 	response = fetch_newer_messages(
 		channel_id, from_message, from_timestamp, limit, include_from_message=False
@@ -235,75 +270,141 @@ def fetch_newer_messages(
 
 	message = frappe.qb.DocType("Raven Message")
 
-	if include_from_message:
-		condition = (message.creation > from_timestamp) | (
-			(message.creation == from_timestamp) & (message.name >= from_message)
+	query = (
+		get_messages_query(message)
+		.where(message.channel_id == channel_id)
+		.where(
+			get_keyset_condition(
+				message, from_timestamp, from_message, older=False, inclusive=include_from_message
+			)
 		)
+		.orderby(message.creation, order=Order.asc)
+		.orderby(message.name, order=Order.asc)
+	)
+
+	messages, has_new_messages = get_paginated_results(query, limit)
+
+	# The messages are in ascending order, so reverse them
+	messages.reverse()
+	return {
+		"messages": messages,
+		"has_new_messages": has_new_messages,
+		**get_page_cursors(messages),
+	}
 
+
+@frappe.whitelist(methods=["GET"])
+def get_channel_changes(
+	channel_id: str, since: str | None = None, cursor: str | None = None, limit: int = 500
+):
+	"""
+	API to get all changes to messages in a channel since a point in time - used by clients to sync after reconnecting.
+
+	Pass `since` (a timestamp) on the first call, and the `cursor` returned by the previous call after that.
+	Returns messages that were created/edited/reacted to (ordered by modified) and IDs of messages that were deleted.
+
+	If `has_more` is set, call the API again with the returned cursor to fetch the next page of changes.
+	If `full_refresh_required` is set, changes cannot be computed and the client should refetch the channel.
+	"""
+
+	# Check permission for channel access
+	if not frappe.has_permission(doctype="Raven Channel", doc=channel_id, ptype="read"):
+		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
+
+	limit = min(max(cint(limit), 1), MAX_CHANGES_PAGE_SIZE)
+
+	# Sync timestamp is set a few seconds in the past so that messages in transactions that were not committed yet are not missed
+	sync_timestamp = add_to_date(now_datetime(), seconds=-5)
+
+	if cursor:
+		from_timestamp, from_name = decode_cursor(cursor)
+	elif since:
+		from_timestamp, from_name = get_datetime(since), ""
 	else:
-		condition = (message.creation > from_timestamp) | (
-			(message.creation == from_timestamp) & (message.name > from_message)
-		)
+		frappe.throw(_("Either a timestamp or a cursor is required to fetch changes"))
+
+	# Deleted messages are only tracked for a limited time
+	if from_timestamp < add_days(now_datetime(), -TOMBSTONE_RETENTION_DAYS):
+		return {
+			"messages": [],
+			"deleted_messages": [],
+			"has_more": False,
+			"cursor": None,
+			"full_refresh_required": True,
+		}
 
-	messages = (
-		frappe.qb.from_(message)
-		.select(
-			message.name,
-			message.owner,
-			message.creation,
-			message.modified,
-			message.text,
-			message.file,
-			message.message_type,
-			message.message_reactions,
-			message.is_reply,
-			message.linked_message,
-			message._liked_by,
-			message.channel_id,
-			message.thumbnail_width,
-			message.thumbnail_height,
-			message.file_thumbnail,
-			message.link_doctype,
-			message.link_document,
-			message.replied_message_details,
-			message.content,
-			message.is_edited,
-			message.is_forwarded,
-			message.poll_id,
-			message.is_bot_message,
-			message.bot,
-			message.hide_link_preview,
-			message.is_thread,
-			message.blurhash,
-		)
+	message = frappe.qb.DocType("Raven Message")
+
+	query = (
+		get_messages_query(message)
 		.where(message.channel_id == channel_id)
-		.where(condition)
-		.orderby(message.creation, order=Order.asc)
+		.where(
+			get_keyset_condition(
+				message, from_timestamp, from_name, older=False, timestamp_field="modified"
+			)
+		)
+		.orderby(message.modified, order=Order.asc)
 		.orderby(message.name, order=Order.asc)
-		.limit(limit)
-		.run(as_dict=True)
 	)
 
-	has_new_messages = False
-
-	# Check if newer messages are available
-	if len(messages) == limit:
-		# Check if there are more messages available
-		newer_message = frappe.db.get_all(
-			"Raven Message",
-			pluck="name",
-			filters={
-				"channel_id": channel_id,
-				"creation": (">=", messages[-1].creation),
-				"name": ["!=", messages[-1].name],
-			},
-			order_by="creation asc, name asc",
-			limit=1,
-		)
+	messages, has_more = get_paginated_results(query, limit)
 
-		if len(newer_message) > 0:
-			has_new_messages = True
+	# Deletions are returned for the same time window as the page of messages
+	tombstone_filters = [
+		["channel_id", "=", channel_id],
+		["creation", ">", from_timestamp],
+	]
 
-	# The messages are in ascending order, so reverse them
-	messages.reverse()
-	return {"messages": messages, "has_new_messages": has_new_messages}
+	if has_more:
+		to_timestamp = messages[-1].modified
+		tombstone_filters.append(["creation", "<=", to_timestamp])
+		next_cursor = encode_cursor(to_timestamp, messages[-1].name)
+	else:
+		next_cursor = encode_cursor(sync_timestamp, "")
+
+	deleted_messages = frappe.get_all(
+		"Raven Message Tombstone", filters=tombstone_filters, pluck="message_id"
+	)
+
+	return {
+		"messages": messages,
+		"deleted_messages": deleted_messages,
+		"has_more": has_more,
+		"cursor": next_cursor,
+		"full_refresh_required": False,
+	}
+
+
+def get_cursor_position(from_message: str | None = None, cursor: str | None = None):
+	"""
+	Get the (creation, name) position to paginate from.
+
+	If a cursor is passed, the position is decoded from it - else the creation timestamp of the message is looked up.
+	"""
+	if cursor:
+		return decode_cursor(cursor)
+
+	if not from_message:
+		frappe.throw(_("Either a message or a cursor is required to fetch messages"))
+
+	return frappe.get_cached_value("Raven Message", from_message, "creation"), from_message
+
+
+def get_page_cursors(messages: list) -> dict:
+	"""
+	Cursors to fetch the pages before and after a list of messages (ordered newest first)
+	"""
+	if not messages:
+		return {"older_cursor": None, "newer_cursor": None}
+
+	return {
+		"older_cursor": encode_cursor(messages[-1].creation, messages[-1].name),
+		"newer_cursor": encode_cursor(messages[0].creation, messages[0].name),
+	}
+
+
+def get_messages_query(message):
+	"""
+	Base query for the chat stream - selects all fields of a message that are needed by the client
+	"""
+	return frappe.qb.from_(message).select(*[message.field(field) for field in MESSAGE_FIELDS])
@@ -3,7 +3,14 @@ from frappe import _
 from frappe.query_builder import Order
 
 from raven.api.raven_users import get_current_raven_user
-from raven.utils import get_channel_members, is_channel_member, track_channel_visit
+from raven.unread_counts import reset_unread_counts
+from raven.utils import (
+	clear_channel_visits,
+	delete_channel_members_cache,
+	get_channel_members,
+	is_channel_member,
+	is_workspace_member,
+)
 
 
 @frappe.whitelist()
@@ -256,9 +263,99 @@ def toggle_pin_message(channel_id, message_id):
 def mark_all_messages_as_read(channel_ids: list):
 	"""
 	Mark all messages in these channels as read
+
+	Updates the last visit of all memberships of the user in a single statement,
+	and adds the user as a member of open channels they are not a member of yet.
 	"""
 	user = frappe.session.user
-	for channel_id in channel_ids:
-		track_channel_visit(channel_id, user=user)
+	channel_ids = list(set(channel_ids))
+
+	if not channel_ids:
+		return "Ok"
+
+	now = frappe.utils.now()
+
+	channel_member = frappe.qb.DocType("Raven Channel Member")
+	(
+		frappe.qb.update(channel_member)
+		.set(channel_member.last_visit, now)
+		.where(channel_member.user_id == user)
+		.where(channel_member.channel_id.isin(channel_ids))
+	).run()
+
+	member_channel_ids = frappe.get_all(
+		"Raven Channel Member",
+		filters={"user_id": user, "channel_id": ("in", channel_ids)},
+		pluck="channel_id",
+	)
+	non_member_channel_ids = set(channel_ids) - set(member_channel_ids)
+
+	if non_member_channel_ids:
+		open_channels = frappe.get_all(
+			"Raven Channel",
+			filters={"name": ("in", list(non_member_channel_ids)), "type": "Open"},
+			fields=["name", "workspace"],
+		)
+		# Same as the create permission of Raven Channel Member -
+		# users can only join open channels of workspaces they are a member of
+		open_channel_ids = [
+			channel.name for channel in open_channels if is_workspace_member(channel.workspace, user)
+		]
+
+		if open_channel_ids:
+			# The first member of a channel becomes its admin (like in Raven Channel Member.before_insert)
+			channels_with_members = set(
+				frappe.get_all(
+					"Raven Channel Member",
+					filters={"channel_id": ("in", open_channel_ids)},
+					pluck="channel_id",
+					distinct=True,
+				)
+			)
+
+			frappe.db.bulk_insert(
+				"Raven Channel Member",
+				fields=[
+					"name",
+					"channel_id",
+					"user_id",
+					"last_visit",
+					"allow_notifications",
+					"is_admin",
+					"owner",
+					"modified_by",
+					"creation",
+					"modified",
+				],
+				values=[
+					(
+						frappe.generate_hash(length=10),
+						channel_id,
+						user,
+						now,
+						1,
+						0 if channel_id in channels_with_members else 1,
+						user,
+						user,
+						now,
+						now,
+					)
+					for channel_id in open_channel_ids
+				],
+			)
+
+			for channel_id in open_channel_ids:
+				delete_channel_members_cache(channel_id)
+
+	# Visits to these channels that are buffered in the cache are older - they should not overwrite this one
+	clear_channel_visits(channel_ids, user)
+	reset_unread_counts(channel_ids, user)
+
+	frappe.publish_realtime(
+		"raven:channels_marked_as_read",
+		{"channel_ids": channel_ids, "last_visit": now},
+		user=user,
+		after_commit=True,
+	)
 
 	return "Ok"
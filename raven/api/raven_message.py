@@ -4,10 +4,24 @@ from datetime import timedelta
 import frappe
 from frappe import _
 from frappe.query_builder import JoinType, Order
-from frappe.query_builder.functions import Coalesce, Count
+from frappe.query_builder.functions import Count
+from frappe.utils import cint
 
 from raven.api.raven_channel import create_direct_message_channel, get_peer_user_id
-from raven.utils import get_channel_member, is_channel_member, track_channel_visit
+from raven.message_cache import update_message_fields
+from raven.unread_counts import get_unread_counts
+from raven.utils import (
+	decode_cursor,
+	encode_cursor,
+	get_channel_member,
+	get_keyset_condition,
+	get_paginated_results,
+	is_channel_member,
+	track_channel_visit,
+)
+
+# Maximum number of messages in a page of `get_messages_with_dates_page`
+MAX_MESSAGES_PAGE_SIZE = 500
 
 
 @frappe.whitelist(methods=["POST"])
@@ -64,38 +78,45 @@ def fetch_recent_files(channel_id):
 
 
 def get_messages(channel_id):
+	"""
+	Fetches all messages of a channel (ordered by creation ascending)
 
-	messages = frappe.db.get_all(
-		"Raven Message",
-		filters={"channel_id": channel_id},
-		fields=[
-			"name",
-			"owner",
-			"creation",
-			"modified",
-			"text",
-			"file",
-			"message_type",
-			"message_reactions",
-			"is_reply",
-			"linked_message",
-			"_liked_by",
-			"channel_id",
-			"thumbnail_width",
-			"thumbnail_height",
-			"file_thumbnail",
-			"link_doctype",
-			"link_document",
-			"replied_message_details",
-			"content",
-			"is_edited",
-			"is_thread",
-			"is_forwarded",
-		],
-		order_by="creation asc",
-	)
+	Deprecated: this loads the entire history of the channel - use `iter_messages` instead
+	"""
+	return list(iter_messages(channel_id))
 
-	return messages
+
+def get_messages_query(channel_id):
+	message = frappe.qb.DocType("Raven Message")
+
+	return (
+		frappe.qb.from_(message)
+		.select(
+			message.name,
+			message.owner,
+			message.creation,
+			message.modified,
+			message.text,
+			message.file,
+			message.message_type,
+			message.message_reactions,
+			message.is_reply,
+			message.linked_message,
+			message._liked_by,
+			message.channel_id,
+			message.thumbnail_width,
+			message.thumbnail_height,
+			message.file_thumbnail,
+			message.link_doctype,
+			message.link_document,
+			message.replied_message_details,
+			message.content,
+			message.is_edited,
+			message.is_thread,
+			message.is_forwarded,
+		)
+		.where(message.channel_id == channel_id)
+	)
 
 
 @frappe.whitelist()
@@ -107,7 +128,11 @@ def save_message(message_id, add=False):
 
 	toggle_like("Raven Message", message_id, add)
 
-	liked_by = frappe.db.get_value("Raven Message", message_id, "_liked_by")
+	liked_by, channel_id = frappe.db.get_value(
+		"Raven Message", message_id, ["_liked_by", "channel_id"]
+	)
+
+	update_message_fields(channel_id, message_id, {"_liked_by": liked_by})
 
 	frappe.publish_realtime(
 		"message_saved",
@@ -210,11 +235,17 @@ def get_saved_messages():
 
 def parse_messages(messages):
 
-	messages_with_date_header = []
-	previous_message = None
+	return list(iter_message_blocks(messages))
+
+
+def iter_message_blocks(messages, previous_message=None):
+	"""
+	Yields date and message blocks for messages (ordered by creation ascending)
 
-	for i in range(len(messages)):
-		message = messages[i]
+	`previous_message` is the message just before the first message - pass this when parsing messages page by page
+	so that the date headers and continuation flags are computed correctly across page boundaries.
+	"""
+	for message in messages:
 		is_continuation = (
 			previous_message
 			and message["owner"] == previous_message["owner"]
@@ -222,14 +253,59 @@ def parse_messages(messages):
 		)
 		message["is_continuation"] = int(bool(is_continuation))
 
-		if i == 0 or message["creation"].date() != previous_message["creation"].date():
-			messages_with_date_header.append({"block_type": "date", "data": message["creation"].date()})
+		if not previous_message or message["creation"].date() != previous_message["creation"].date():
+			yield {"block_type": "date", "data": message["creation"].date()}
 
-		messages_with_date_header.append({"block_type": "message", "data": message})
+		yield {"block_type": "message", "data": message}
 
 		previous_message = message
 
-	return messages_with_date_header
+
+def iter_messages(channel_id, page_size=500):
+	"""
+	Yields all messages of a channel (ordered by creation ascending) while fetching them page by page,
+	so that only one page of messages is held in memory at a time.
+	"""
+	message = frappe.qb.DocType("Raven Message")
+	from_message = None
+
+	while True:
+		query = get_messages_query(channel_id)
+
+		if from_message:
+			query = query.where(
+				get_keyset_condition(message, from_message.creation, from_message.name, older=False)
+			)
+
+		messages, has_more = get_paginated_results(
+			query.orderby(message.creation, order=Order.asc).orderby(message.name, order=Order.asc),
+			page_size,
+		)
+
+		yield from messages
+
+		if not has_more:
+			break
+
+		from_message = messages[-1]
+
+
+def iter_messages_with_dates(channel_id, chunk_size=500):
+	"""
+	Yields chunks of date and message blocks for all messages of a channel.
+	Continuation flags and date headers are carried over from one chunk to the next.
+	"""
+	chunk = []
+
+	for block in iter_message_blocks(iter_messages(channel_id, page_size=chunk_size)):
+		chunk.append(block)
+
+		if len(chunk) >= chunk_size:
+			yield chunk
+			chunk = []
+
+	if chunk:
+		yield chunk
 
 
 def check_permission(channel_id):
@@ -244,63 +320,98 @@ def check_permission(channel_id):
 
 @frappe.whitelist()
 def get_messages_with_dates(channel_id):
+	"""
+	Deprecated: this returns the entire history of the channel - use `get_messages_with_dates_page` instead
+	"""
 	check_permission(channel_id)
-	messages = get_messages(channel_id)
 	track_channel_visit(channel_id=channel_id, publish_event_for_user=True, commit=True)
-	return parse_messages(messages)
+
+	blocks = []
+	for chunk in iter_messages_with_dates(channel_id):
+		blocks.extend(chunk)
+
+	return blocks
 
 
 @frappe.whitelist()
-def get_unread_count_for_channels():
+def get_messages_with_dates_page(channel_id, limit=100, cursor=None):
 	"""
-	Fetch all channels where the user has unread messages > 0
+	Get a page of date and message blocks for a channel, ordered by creation ascending.
+
+	Without a cursor, the latest messages are returned. Pass the `older_cursor` of the previous response as `cursor`
+	to get the page before it. The page is computed with the message before it so that the date headers and
+	continuation flags line up when pages are joined.
 	"""
+	check_permission(channel_id)
 
-	channel = frappe.qb.DocType("Raven Channel")
-	channel_member = frappe.qb.DocType("Raven Channel Member")
 	message = frappe.qb.DocType("Raven Message")
-	query = (
-		frappe.qb.from_(channel)
-		.left_join(channel_member)
-		.on(
-			(channel.name == channel_member.channel_id) & (channel_member.user_id == frappe.session.user)
-		)
-		.where(channel_member.user_id == frappe.session.user)
-		.where(channel.is_archived == 0)
-		.where(channel.is_thread == 0)
-		.where(message.message_type != "System")
-		.where(
-			message.creation > Coalesce(channel_member.last_visit, "2000-11-11")
-		)  # Only count messages after the last visit for performance
-		.left_join(message)
-		.on(channel.name == message.channel_id)
-	)
+	query = get_messages_query(channel_id)
+
+	if cursor:
+		from_timestamp, from_name = decode_cursor(cursor)
+		query = query.where(get_keyset_condition(message, from_timestamp, from_name, older=True))
+	else:
+		track_channel_visit(channel_id=channel_id, publish_event_for_user=True, commit=True)
 
-	channels_query = (
-		query.select(channel.name, channel.is_direct_message, Count(message.name).as_("unread_count"))
-		.groupby(channel.name, channel.is_direct_message)
+	limit = min(max(cint(limit), 1), MAX_MESSAGES_PAGE_SIZE)
+
+	# Fetch one extra message - it tells us if there are older messages, and is the message before this page
+	messages = (
+		query.orderby(message.creation, order=Order.desc)
+		.orderby(message.name, order=Order.desc)
+		.limit(limit + 1)
 		.run(as_dict=True)
 	)
 
-	return channels_query
+	previous_message = messages[limit] if len(messages) > limit else None
+	messages = messages[:limit]
+	messages.reverse()
+
+	return {
+		"blocks": list(iter_message_blocks(messages, previous_message=previous_message)),
+		"has_old_messages": previous_message is not None,
+		"older_cursor": encode_cursor(messages[0].creation, messages[0].name) if messages else None,
+	}
 
 
 @frappe.whitelist()
-def get_unread_count_for_channel(channel_id):
-	channel_member = get_channel_member(channel_id=channel_id)
-	if channel_member:
-		last_timestamp = frappe.get_cached_value(
-			"Raven Channel Member", channel_member["name"], "last_visit"
+def get_unread_count_for_channels():
+	"""
+	Fetch all channels where the user has unread messages > 0
+
+	Counts are maintained incrementally in the cache - see `raven.unread_counts`
+	"""
+	unread_counts = get_unread_counts()
+
+	channels = []
+
+	for channel_id, unread_count in unread_counts.items():
+		channel = frappe.get_cached_value(
+			"Raven Channel",
+			channel_id,
+			["is_direct_message", "is_archived", "is_thread"],
+			as_dict=True,
 		)
 
-		return frappe.db.count(
-			"Raven Message",
-			filters={
-				"channel_id": channel_id,
-				"creation": (">", last_timestamp),
-				"message_type": ["!=", "System"],
-			},
+		if not channel or channel.is_archived or channel.is_thread:
+			continue
+
+		channels.append(
+			{
+				"name": channel_id,
+				"is_direct_message": channel.is_direct_message,
+				"unread_count": unread_count,
+			}
 		)
+
+	return channels
+
+
+@frappe.whitelist()
+def get_unread_count_for_channel(channel_id):
+	channel_member = get_channel_member(channel_id=channel_id)
+	if channel_member:
+		return get_unread_counts().get(channel_id, 0)
 	else:
 		if frappe.get_cached_value("Raven Channel", channel_id, "type") == "Open":
 			return frappe.db.count(
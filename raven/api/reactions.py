@@ -3,6 +3,7 @@ import json
 import frappe
 from frappe import _
 
+from raven.message_cache import update_message_fields
 from raven.utils import is_channel_member
 
 
@@ -91,14 +92,22 @@ def calculate_message_reaction(message_id, channel_id: str = None, do_not_publis
 				"reaction": reaction_item.reaction,
 				"is_custom": reaction_item.is_custom,
 			}
+	message_reactions = json.dumps(total_reactions, indent=4)
+	# Bump the modified timestamp (without changing modified_by) so that clients syncing the channel pick up the change
+	modified = frappe.utils.now_datetime()
 	frappe.db.set_value(
 		"Raven Message",
 		message_id,
-		"message_reactions",
-		json.dumps(total_reactions, indent=4),
+		{"message_reactions": message_reactions, "modified": modified},
 		update_modified=False,
 	)
 
+	update_message_fields(
+		channel_id or frappe.get_cached_value("Raven Message", message_id, "channel_id"),
+		message_id,
+		{"message_reactions": message_reactions, "modified": modified},
+	)
+
 	if do_not_publish:
 		return
 
@@ -3,7 +3,13 @@ import datetime
 import frappe
 from frappe.tests import IntegrationTestCase
 
-from raven.api.chat_stream import get_messages, get_newer_messages, get_older_messages
+from raven.api.chat_stream import (
+	get_channel_changes,
+	get_messages,
+	get_newer_messages,
+	get_older_messages,
+)
+from raven.message_cache import clear_latest_messages, get_latest_messages
 
 CHANNEL_ID = "Public Workspace-test-channel"
 
@@ -51,6 +57,23 @@ def create_channel():
 	channel_doc.insert()
 
 
+def get_new_connection():
+	"""
+	Second connection to the database of the site - to simulate a concurrent request
+	"""
+	from frappe.database import get_db
+
+	conf = frappe.local.conf
+	return get_db(
+		socket=conf.db_socket,
+		host=conf.db_host,
+		port=conf.db_port,
+		user=conf.db_user or conf.db_name,
+		password=conf.db_password,
+		cur_db_name=conf.db_name,
+	)
+
+
 class TestChatStream(IntegrationTestCase):
 	def setUp(self):
 		try:
@@ -62,6 +85,8 @@ class TestChatStream(IntegrationTestCase):
 		# Messages are ordered by an index. Greater the index, newer the message.
 		# So Test Message 99 is the latest message and Test Message 0 is the oldest
 		create_messages()
+		# The latest messages are only cached by requests without writes in their transaction
+		frappe.db.commit()  # nosemgrep
 
 	def tearDown(self):
 		frappe.delete_doc("Raven Channel", CHANNEL_ID)
@@ -271,3 +296,141 @@ class TestChatStream(IntegrationTestCase):
 		# Loop over and check indexes of all messages
 		for i, message in enumerate(response["messages"]):
 			self.assertEqual(message.text, f"Test Message {99-i}")
+
+	def test_get_messages_with_cursor(self):
+		"""
+		Paginating with the cursors returned by the APIs should give the same results as paginating with message IDs
+		"""
+		response = get_messages(CHANNEL_ID)
+
+		response = get_older_messages(CHANNEL_ID, cursor=response["older_cursor"])
+
+		self.assertEqual(len(response["messages"]), 20)
+		self.assertEqual(response["has_old_messages"], True)
+
+		for i, message in enumerate(response["messages"]):
+			self.assertEqual(message.text, f"Test Message {79-i}")
+
+		response = get_newer_messages(CHANNEL_ID, cursor=response["newer_cursor"], limit=10)
+
+		self.assertEqual(len(response["messages"]), 10)
+		self.assertEqual(response["has_new_messages"], True)
+
+		for i, message in enumerate(response["messages"]):
+			self.assertEqual(message.text, f"Test Message {89-i}")
+
+		# Cursors which have been tampered with should be rejected
+		payload, signature = response["older_cursor"].rsplit(".", 1)
+		with self.assertRaises(frappe.ValidationError):
+			get_older_messages(CHANNEL_ID, cursor=f"{payload}.{signature[::-1]}")
+
+		# Malformed cursors should be rejected with a validation error as well
+		with self.assertRaises(frappe.ValidationError):
+			get_older_messages(CHANNEL_ID, cursor=f"{payload}.é{signature[1:]}")
+
+	def test_get_messages_from_cache(self):
+		"""
+		The latest messages are served from the cache after the first request and the cache is invalidated on changes
+		"""
+		response = get_messages(CHANNEL_ID)
+		self.assertIsNotNone(get_latest_messages(CHANNEL_ID, 20))
+
+		cached_response = get_messages(CHANNEL_ID)
+		self.assertEqual(
+			[m.name for m in response["messages"]], [m.name for m in cached_response["messages"]]
+		)
+		self.assertEqual(cached_response["has_old_messages"], True)
+
+		frappe.delete_doc("Raven Message", response["messages"][0].name)
+
+		response = get_messages(CHANNEL_ID)
+		self.assertEqual(len(response["messages"]), 20)
+
+		for i, message in enumerate(response["messages"]):
+			self.assertEqual(message.text, f"Test Message {98-i}")
+
+	def test_latest_messages_are_not_cached_with_writes(self):
+		"""
+		Reading the latest messages neither commits nor discards the writes of the request - and they are not cached
+		"""
+		clear_latest_messages(CHANNEL_ID)
+
+		frappe.db.set_value("Raven Message", f"{CHANNEL_ID}-99", "text", "Edited Message 99")
+
+		response = get_messages(CHANNEL_ID)
+		self.assertEqual(response["messages"][0].text, "Edited Message 99")
+		self.assertIsNone(get_latest_messages(CHANNEL_ID, 20))
+
+		frappe.db.rollback()
+		self.assertEqual(frappe.db.get_value("Raven Message", f"{CHANNEL_ID}-99", "text"), "Test Message 99")
+
+	def test_latest_messages_cache_with_concurrent_write(self):
+		"""
+		A message committed by another request after the snapshot of this request was opened (and before the cache version
+		was read) should not be left out of the cache
+		"""
+		clear_latest_messages(CHANNEL_ID)
+
+		# Open the snapshot of the transaction - like the permission checks at the start of a request do
+		frappe.db.count("Raven Message", {"channel_id": CHANNEL_ID})
+
+		# Another request inserts a message, commits and then bumps the version of the cache
+		other_db = get_new_connection()
+		db = frappe.local.db
+		frappe.local.db = other_db
+
+		try:
+			creation = frappe.utils.now_datetime()
+			frappe.get_doc(
+				{
+					"doctype": "Raven Message",
+					"name": f"{CHANNEL_ID}-100",
+					"text": "Test Message 100",
+					"content": "Test Message 100",
+					"channel_id": CHANNEL_ID,
+					"message_type": "Text",
+					"creation": creation,
+					"modified": creation,
+				}
+			).db_insert()
+			frappe.db.commit()  # nosemgrep
+		finally:
+			frappe.local.db = db
+			other_db.close()
+
+		clear_latest_messages(CHANNEL_ID)
+
+		response = get_messages(CHANNEL_ID)
+		self.assertEqual(response["messages"][0].text, "Test Message 100")
+
+		cached_messages, _has_old_messages = get_latest_messages(CHANNEL_ID, 20)
+		self.assertEqual(cached_messages[0].text, "Test Message 100")
+
+	def test_get_channel_changes(self):
+		"""
+		Chat Stream `get_channel_changes` API
+		The API should return messages edited and deleted after a point in time
+		"""
+		since = frappe.utils.now_datetime()
+
+		edited_message = frappe.get_doc("Raven Message", f"{CHANNEL_ID}-10")
+		edited_message.text = "Edited Message"
+		edited_message.save()
+
+		frappe.delete_doc("Raven Message", f"{CHANNEL_ID}-20")
+
+		response = get_channel_changes(CHANNEL_ID, since=str(since))
+
+		self.assertEqual(response["full_refresh_required"], False)
+		self.assertEqual(response["has_more"], False)
+		self.assertEqual([m.name for m in response["messages"]], [f"{CHANNEL_ID}-10"])
+		self.assertEqual(response["deleted_messages"], [f"{CHANNEL_ID}-20"])
+
+		# The page size is clamped to at least one message
+		response = get_channel_changes(CHANNEL_ID, since=str(since), limit=-1)
+		self.assertEqual(len(response["messages"]), 1)
+		self.assertEqual(response["has_more"], False)
+
+		# Older timestamps than the retention period require a full refresh
+		response = get_channel_changes(CHANNEL_ID, since="2000-01-01 00:00:00")
+		self.assertEqual(response["full_refresh_required"], True)
@@ -0,0 +1,81 @@
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.api.raven_channel import mark_all_messages_as_read
+from raven.utils import delete_workspace_members_cache
+
+EXTRA_TEST_RECORD_DEPENDENCIES = ["User", "Raven User"]
+
+WORKSPACE = "Test Mark As Read Workspace"
+OWNER = "test@example.com"
+USER = "test1@example.com"
+
+
+class TestMarkAllMessagesAsRead(IntegrationTestCase):
+	def setUp(self):
+		frappe.set_user("Administrator")
+
+		frappe.get_doc(
+			{
+				"doctype": "Raven Workspace",
+				"workspace_name": WORKSPACE,
+				"type": "Private",
+				"owner": OWNER,
+			}
+		).insert()
+
+		self.channel_ids = []
+		for channel_name in ("Test Mark As Read Member", "Test Mark As Read Open"):
+			channel = frappe.get_doc(
+				{
+					"doctype": "Raven Channel",
+					"channel_name": channel_name,
+					"type": "Open",
+					"workspace": WORKSPACE,
+				}
+			)
+			channel.flags.do_not_add_member = True
+			channel.insert()
+			self.channel_ids.append(channel.name)
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.db.rollback()
+		delete_workspace_members_cache(WORKSPACE)
+
+	def get_membership(self, channel_id: str):
+		return frappe.db.get_value(
+			"Raven Channel Member",
+			{"channel_id": channel_id, "user_id": USER},
+			["last_visit", "is_admin"],
+			as_dict=True,
+		)
+
+	def test_open_channels_of_other_workspaces_are_not_joined(self):
+		"""
+		Users cannot join open channels of workspaces they are not a member of by marking them as read
+		"""
+		frappe.set_user(USER)
+		mark_all_messages_as_read(self.channel_ids)
+
+		for channel_id in self.channel_ids:
+			self.assertIsNone(self.get_membership(channel_id))
+
+	def test_open_channels_are_joined(self):
+		"""
+		Workspace members join the open channels - the first member of a channel becomes its admin
+		"""
+		frappe.get_doc({"doctype": "Raven Workspace Member", "workspace": WORKSPACE, "user": USER}).insert()
+		frappe.get_doc(
+			{"doctype": "Raven Channel Member", "channel_id": self.channel_ids[0], "user_id": OWNER}
+		).insert()
+
+		frappe.set_user(USER)
+		mark_all_messages_as_read(self.channel_ids)
+
+		member, open_channel = (self.get_membership(channel_id) for channel_id in self.channel_ids)
+
+		self.assertIsNotNone(member.last_visit)
+		self.assertEqual(member.is_admin, 0)
+		self.assertIsNotNone(open_channel.last_visit)
+		self.assertEqual(open_channel.is_admin, 1)
@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.api import raven_message
+from raven.api.raven_message import get_messages_with_dates_page
+from raven.api.test_chat_stream import CHANNEL_ID, create_channel, create_messages
+
+EXTRA_TEST_RECORD_DEPENDENCIES = ["Raven Workspace"]
+
+
+def get_message_names(page: dict) -> list[str]:
+	return [block["data"]["name"] for block in page["blocks"] if block["block_type"] == "message"]
+
+
+class TestGetMessagesWithDatesPage(IntegrationTestCase):
+	def setUp(self):
+		if frappe.db.exists("Raven Channel", CHANNEL_ID):
+			frappe.delete_doc("Raven Channel", CHANNEL_ID)
+
+		create_channel()
+		create_messages()
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_pages(self):
+		"""
+		Pages can be joined using the older cursor until there are no older messages
+		"""
+		names = []
+		cursor = None
+
+		while True:
+			page = get_messages_with_dates_page(CHANNEL_ID, limit=30, cursor=cursor)
+			names = get_message_names(page) + names
+
+			if not page["has_old_messages"]:
+				break
+
+			cursor = page["older_cursor"]
+
+		self.assertEqual(names, [f"{CHANNEL_ID}-{i}" for i in range(100)])
+
+	def test_limit_is_clamped(self):
+		"""
+		A limit of 0 still returns a page with a cursor, a large limit is capped
+		"""
+		page = get_messages_with_dates_page(CHANNEL_ID, limit=0)
+
+		self.assertEqual(get_message_names(page), [f"{CHANNEL_ID}-99"])
+		self.assertTrue(page["has_old_messages"])
+		self.assertIsNotNone(page["older_cursor"])
+
+		with patch.object(raven_message, "MAX_MESSAGES_PAGE_SIZE", 10):
+			page = get_messages_with_dates_page(CHANNEL_ID, limit=1000)
+
+		self.assertEqual(get_message_names(page), [f"{CHANNEL_ID}-{i}" for i in range(90, 100)])
+		self.assertTrue(page["has_old_messages"])
@@ -4,7 +4,7 @@ from frappe.query_builder import Order
 from frappe.query_builder.functions import Coalesce, Count
 
 from raven.api.raven_channel import get_peer_user_id, is_channel_member
-from raven.utils import get_channel_members, get_thread_reply_count
+from raven.utils import get_channel_members, get_channel_visit_condition, get_thread_reply_count
 
 
 @frappe.whitelist(methods=["GET"])
@@ -95,6 +95,11 @@ def get_all_threads(
 			channel.last_message_timestamp > Coalesce(channel_member.last_visit, "2000-11-11")
 		)
 
+		# Visits to threads which are not yet written to the database
+		visit_condition = get_channel_visit_condition(channel.name, channel.last_message_timestamp)
+		if visit_condition is not None:
+			query = query.where(visit_condition)
+
 	query = query.orderby(channel.last_message_timestamp, order=Order.desc)
 
 	# return
@@ -229,6 +234,11 @@ def get_unread_threads(workspace: str = None, thread_id: str = None):
 	if thread_id:
 		query = query.where(channel.name == thread_id)
 
+	# Visits to threads which are not yet written to the database
+	visit_condition = get_channel_visit_condition(channel.name, message.creation)
+	if visit_condition is not None:
+		query = query.where(visit_condition)
+
 	return query.run(as_dict=True)
 
 
@@ -10,6 +10,9 @@ from frappe.handler import upload_file
 from frappe.utils.image import optimize_image
 from PIL import Image, ImageOps
 
+from raven.ai.file_extraction import enqueue_file_extraction
+from raven.raven_messaging.doctype.raven_message.raven_message import get_ai_bot_for_channel
+
 
 def upload_JPEG_wrt_EXIF(content, filename, optimize=False):
 	"""
@@ -175,4 +178,18 @@ def upload_file_with_message():
 
 	message_doc.save()
 
+	# Extract the file for the AI bot in the background, so that it is ready by the time the user asks about it
+	if message_doc.message_type == "File" and is_ai_conversation(message_doc.channel_id):
+		enqueue_file_extraction(file_doc)
+
 	return message_doc
+
+
+def is_ai_conversation(channel_id: str) -> bool:
+	"""
+	Check if an AI bot responds to messages in the channel (AI threads and DMs with AI bots)
+	"""
+	if not frappe.get_cached_doc("Raven Settings").enable_ai_integration:
+		return False
+
+	return bool(get_ai_bot_for_channel(frappe.get_cached_doc("Raven Channel", channel_id)))
@@ -0,0 +1,244 @@
+from contextlib import contextmanager
+
+import click
+import frappe
+from frappe import _
+from frappe.commands import get_site, pass_context
+
+# EXPLAIN access types which read every row of the table (ALL) or of an index (index)
+FULL_SCAN_TYPES = ("ALL", "index")
+
+# Redis commands which change data. They are skipped while the queries are captured, since the database
+# rollback cannot undo them (for eg. buffered channel visits, unread counts and cached messages)
+CACHE_WRITE_COMMANDS = (
+	"set_value",
+	"delete_value",
+	"delete_keys",
+	"delete_key",
+	"delete",
+	"incr",
+	"hset",
+	"hdel",
+	"sadd",
+	"srem",
+	"spop",
+	"rename",
+	"expire",
+	"eval",
+	"lpush",
+	"rpush",
+	"ltrim",
+	"publish",
+)
+
+
+@click.command("raven-explain-queries")
+@click.option("--user", default="Administrator", help="User to run the API methods as")
+@click.option("--channel", help="Channel to run the API methods against (defaults to the latest active one)")
+@pass_context
+def explain_queries(context, user="Administrator", channel=None):
+	"""
+	Run EXPLAIN on the queries fired by a fixed list of hot Raven API methods and report full table scans.
+
+	Only these methods are covered (see `get_api_methods`):
+	chat_stream.fetch_latest_messages, chat_stream.get_messages (around a message), chat_stream.get_older_messages,
+	chat_stream.get_newer_messages, chat_stream.get_channel_changes, raven_message.fetch_recent_files,
+	raven_message.get_pinned_messages, raven_message.get_messages_with_dates_page, raven_message.get_saved_messages,
+	unread_counts.get_unread_counts_from_db, threads.get_all_threads, threads.get_unread_threads, mentions.get_mentions
+	and raven_message.get_timeline_message_content (if a message is linked to a document).
+
+	The API methods are run inside a transaction which is rolled back, so no changes are written to the database.
+	Commands which write to Redis are skipped while the methods run, so the cache is only read from.
+	Exits with a non-zero status if a full scan was found, so this can be used in CI.
+	"""
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+
+	try:
+		if frappe.db.db_type != "mariadb":
+			click.secho("EXPLAIN analysis is only supported on MariaDB", fg="yellow")
+			return
+
+		frappe.set_user(user)
+		full_scans = []
+
+		for label, method, kwargs in get_api_methods(channel):
+			for query in capture_queries(method, **kwargs):
+				for row in frappe.db.sql(f"EXPLAIN {query}", as_dict=True):
+					if row.type in FULL_SCAN_TYPES and (row.table or "").startswith("tabRaven"):
+						full_scans.append((label, row, query))
+	finally:
+		frappe.db.rollback()
+		frappe.destroy()
+
+	if not full_scans:
+		click.secho("No full scans found", fg="green")
+		return
+
+	for label, row, query in full_scans:
+		click.secho(f"{label}: full scan on `{row.table}` ({row.rows} rows)", fg="red")
+		click.echo(f"  possible keys: {row.possible_keys or '-'}, extra: {row.Extra or '-'}")
+		click.echo(f"  {query}")
+
+	raise SystemExit(1)
+
+
+def get_api_methods(channel: str = None):
+	"""
+	Whitelisted API methods (and their arguments) whose queries are explained.
+	Sample arguments are picked from the latest messages on the site.
+	"""
+	from raven.api import chat_stream, mentions, raven_message, threads
+	from raven.unread_counts import get_unread_counts_from_db
+
+	filters = {"message_type": ["!=", "System"]}
+	if channel:
+		filters["channel_id"] = channel
+
+	message = frappe.db.get_value(
+		"Raven Message", filters, ["name", "channel_id"], as_dict=True, order_by="creation desc"
+	)
+
+	if not message:
+		frappe.throw(_("No messages found to run the queries against"))
+
+	methods = [
+		# `get_messages` serves the latest messages from the cache - this is the query it runs on a cache miss
+		(
+			"chat_stream.fetch_latest_messages",
+			chat_stream.fetch_latest_messages,
+			{"channel_id": message.channel_id},
+		),
+		(
+			"chat_stream.get_messages (around a message)",
+			chat_stream.get_messages,
+			{"channel_id": message.channel_id, "base_message": message.name},
+		),
+		(
+			"chat_stream.get_older_messages",
+			chat_stream.get_older_messages,
+			{"channel_id": message.channel_id, "from_message": message.name},
+		),
+		(
+			"chat_stream.get_newer_messages",
+			chat_stream.get_newer_messages,
+			{"channel_id": message.channel_id, "from_message": message.name},
+		),
+		(
+			"chat_stream.get_channel_changes",
+			chat_stream.get_channel_changes,
+			{"channel_id": message.channel_id, "since": frappe.utils.add_days(frappe.utils.now(), -1)},
+		),
+		(
+			"raven_message.fetch_recent_files",
+			raven_message.fetch_recent_files,
+			{"channel_id": message.channel_id},
+		),
+		(
+			"raven_message.get_pinned_messages",
+			raven_message.get_pinned_messages,
+			{"channel_id": message.channel_id},
+		),
+		(
+			"raven_message.get_messages_with_dates_page",
+			raven_message.get_messages_with_dates_page,
+			{"channel_id": message.channel_id},
+		),
+		("raven_message.get_saved_messages", raven_message.get_saved_messages, {}),
+		("unread_counts.get_unread_counts_from_db", get_unread_counts_from_db, {"user": frappe.session.user}),
+		("threads.get_all_threads", threads.get_all_threads, {}),
+		("threads.get_unread_threads", threads.get_unread_threads, {}),
+		("mentions.get_mentions", mentions.get_mentions, {}),
+	]
+
+	linked_message = frappe.db.get_value(
+		"Raven Message",
+		{"link_doctype": ["is", "set"]},
+		["link_doctype", "link_document"],
+		as_dict=True,
+		order_by="creation desc",
+	)
+	if linked_message:
+		methods.append(
+			(
+				"raven_message.get_timeline_message_content",
+				raven_message.get_timeline_message_content,
+				{"doctype": linked_message.link_doctype, "docname": linked_message.link_document},
+			)
+		)
+
+	return methods
+
+
+def capture_queries(method, **kwargs) -> list:
+	"""
+	Run the method and return the SELECT queries that it fired
+	"""
+	queries = []
+	sql, commit, publish_realtime = frappe.db.sql, frappe.db.commit, frappe.publish_realtime
+
+	def capturing_sql(*args, **kw):
+		result = sql(*args, **kw)
+		query = str(frappe.db.last_query or "")
+		if query.lstrip().upper().startswith("SELECT") and query not in queries:
+			queries.append(query)
+		return result
+
+	frappe.db.sql = capturing_sql
+	# GET endpoints commit visits to open channels - keep everything in the transaction so it can be rolled back
+	frappe.db.commit = lambda *args, **kw: None
+	# Realtime events (for eg. unread count updates) are published via Redis and would reach the clients
+	frappe.publish_realtime = lambda *args, **kw: None
+
+	try:
+		with read_only_cache():
+			method(**kwargs)
+	except Exception as e:
+		click.secho(f"{method.__module__}.{method.__name__} failed: {e}", fg="yellow")
+	finally:
+		frappe.db.sql, frappe.db.commit, frappe.publish_realtime = sql, commit, publish_realtime
+
+	return queries
+
+
+@contextmanager
+def read_only_cache():
+	"""
+	Skip the commands which write to Redis (on the cache and on its pipelines) within the block
+	"""
+	cache = frappe.cache()
+	pipeline = cache.pipeline
+
+	def skip(*args, **kwargs):
+		return None
+
+	for command in CACHE_WRITE_COMMANDS:
+		setattr(cache, command, skip)
+
+	cache.pipeline = lambda *args, **kwargs: ReadOnlyPipeline(pipeline(*args, **kwargs))
+
+	try:
+		yield
+	finally:
+		# Remove the overrides on the instance, so that the methods of the class are used again
+		for command in (*CACHE_WRITE_COMMANDS, "pipeline"):
+			cache.__dict__.pop(command, None)
+
+
+class ReadOnlyPipeline:
+	"""
+	Redis pipeline which only queues the commands that read data
+	"""
+
+	def __init__(self, pipeline):
+		self.pipeline = pipeline
+
+	def __getattr__(self, name):
+		if name in CACHE_WRITE_COMMANDS:
+			return lambda *args, **kwargs: self
+
+		return getattr(self.pipeline, name)
+
+
+commands = [explain_queries]
@@ -130,11 +130,28 @@ after_uninstall = "raven.uninstall.after_uninstall"
 
 doc_events = {
 	"*": {
-		"after_insert": "raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
-		"on_update": "raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
-		"on_trash": "raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
-		"on_cancel": "raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
-		"on_submit": "raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
+		"after_insert": [
+			"raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
+			"raven.ai.tool_cache.invalidate_tool_cache",
+		],
+		"on_update": [
+			"raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
+			"raven.ai.tool_cache.invalidate_tool_cache",
+		],
+		"on_trash": [
+			"raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
+			"raven.ai.tool_cache.invalidate_tool_cache",
+		],
+		"on_cancel": [
+			"raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
+			"raven.ai.tool_cache.invalidate_tool_cache",
+		],
+		"on_submit": [
+			"raven.raven_integrations.doctype.raven_document_notification.raven_document_notification.run_document_notification",
+			"raven.ai.tool_cache.invalidate_tool_cache",
+		],
+		"on_update_after_submit": "raven.ai.tool_cache.invalidate_tool_cache",
+		"after_rename": "raven.ai.tool_cache.invalidate_tool_cache",
 	},
 	"User": {
 		"after_insert": "raven.raven.doctype.raven_user.raven_user.add_user_to_raven",
@@ -156,6 +173,19 @@ doc_events = {
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"cron": {
+		# Write the buffered visits of users to channels to the database
+		"* * * * *": ["raven.utils.flush_channel_visits"],
+	},
+	"hourly": ["raven.unread_counts.reconcile_unread_counts"],
+	"daily": [
+		"raven.raven_messaging.doctype.raven_message_tombstone.raven_message_tombstone.delete_old_tombstones",
+		"raven.ai.file_extraction.delete_old_extractions",
+		"raven.ai.retrieval.delete_old_indexes",
+	],
+}
+
 # scheduler_events = {
 # "all": [
 # "raven.tasks.all"
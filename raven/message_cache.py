@@ -0,0 +1,215 @@
+import json
+
+import frappe
+from frappe.utils import get_datetime
+from redis.exceptions import LockError
+
+# Number of latest messages of a channel that are kept in the cache
+LATEST_MESSAGES_CACHE_SIZE = 50
+
+# Fields of a message that are sent to the client in the chat stream
+MESSAGE_FIELDS = [
+	"name",
+	"owner",
+	"creation",
+	"modified",
+	"text",
+	"file",
+	"message_type",
+	"message_reactions",
+	"is_reply",
+	"linked_message",
+	"_liked_by",
+	"channel_id",
+	"thumbnail_width",
+	"thumbnail_height",
+	"file_thumbnail",
+	"link_doctype",
+	"link_document",
+	"replied_message_details",
+	"content",
+	"is_edited",
+	"is_forwarded",
+	"poll_id",
+	"is_bot_message",
+	"bot",
+	"hide_link_preview",
+	"is_thread",
+	"blurhash",
+]
+
+
+def get_cache_key(channel_id: str) -> str:
+	return f"raven:latest_messages:{channel_id}"
+
+
+def get_version_key(channel_id: str) -> str:
+	# Raw redis commands are used for the version and the lock, hence the keys need to be prefixed with the site name
+	return frappe.cache().make_key(f"raven:latest_messages_version:{channel_id}")
+
+
+def get_lock_key(channel_id: str) -> str:
+	return frappe.cache().make_key(f"raven:latest_messages_lock:{channel_id}")
+
+
+def get_latest_messages(channel_id: str, limit: int):
+	"""
+	Get the latest messages of a channel (newest first) from the cache.
+
+	Returns a tuple of (messages, has_old_messages) or None if the cache cannot serve the request.
+	The caller is responsible for checking permissions on the channel.
+	"""
+	data = frappe.cache().get_value(get_cache_key(channel_id))
+
+	if data is None:
+		return None
+
+	messages = data["messages"]
+
+	if len(messages) > limit:
+		return messages[:limit], True
+
+	# Messages might have been deleted from the cache - only serve the request if there's nothing older
+	if not data["has_old_messages"]:
+		return messages, False
+
+	return None
+
+
+def get_cache_version(channel_id: str):
+	"""
+	Every change to the messages of a channel bumps the version.
+	Used to make sure that we do not populate the cache with stale rows fetched before a change was committed.
+	"""
+	return frappe.cache().get(get_version_key(channel_id))
+
+
+def set_latest_messages(channel_id: str, messages: list, has_old_messages: bool, version):
+	"""
+	Populate the cache with the latest messages (newest first) of a channel.
+
+	The `version` should be fetched via `get_cache_version` before the messages were queried.
+	If the channel was modified in the meantime, the cache is not populated.
+	"""
+	try:
+		with frappe.cache().lock(get_lock_key(channel_id), timeout=5, blocking_timeout=1):
+			if get_cache_version(channel_id) != version:
+				return
+
+			frappe.cache().set_value(
+				get_cache_key(channel_id),
+				{
+					"messages": messages[:LATEST_MESSAGES_CACHE_SIZE],
+					"has_old_messages": has_old_messages or len(messages) > LATEST_MESSAGES_CACHE_SIZE,
+				},
+			)
+	except LockError:
+		pass
+
+
+def clear_latest_messages(channel_id: str):
+	frappe.cache().incr(get_version_key(channel_id))
+	frappe.cache().delete_value(get_cache_key(channel_id))
+
+
+def upsert_message(doc):
+	"""
+	Add/update a message in the cache once the transaction is committed
+	"""
+	message = get_message_dict(doc)
+
+	def update(messages, has_old_messages):
+		is_cached = any(m.name == message.name for m in messages)
+
+		# Message is older than all cached messages (for eg. an old message was edited) - adding it would leave a gap
+		if not is_cached and has_old_messages and messages:
+			if (message.creation, message.name) < (messages[-1].creation, messages[-1].name):
+				return messages
+
+		messages = [m for m in messages if m.name != message.name]
+		messages.append(message)
+		messages.sort(key=lambda m: (m.creation, m.name), reverse=True)
+		return messages
+
+	run_after_commit(doc.channel_id, update)
+
+
+def update_message_fields(channel_id: str, message_id: str, fields: dict):
+	"""
+	Update some fields of a message in the cache (if present) once the transaction is committed
+	"""
+
+	def update(messages, has_old_messages):
+		for m in messages:
+			if m.name == message_id:
+				m.update(fields)
+		return messages
+
+	run_after_commit(channel_id, update)
+
+
+def remove_message(channel_id: str, message_id: str):
+	"""
+	Remove a message from the cache once the transaction is committed
+	"""
+
+	def update(messages, has_old_messages):
+		return [m for m in messages if m.name != message_id]
+
+	run_after_commit(channel_id, update)
+
+
+def run_after_commit(channel_id: str, update):
+	if frappe.flags.in_test or frappe.flags.in_patch or frappe.flags.in_install:
+		# Transactions are rolled back in tests and patches may update messages in bulk
+		clear_latest_messages(channel_id)
+		return
+
+	frappe.db.after_commit.add(lambda: apply_update(channel_id, update))
+
+
+def apply_update(channel_id: str, update):
+	"""
+	Apply an update to the cached list of messages under a lock.
+	If the lock cannot be acquired, the cache is cleared instead so that it is never stale.
+	"""
+	try:
+		with frappe.cache().lock(get_lock_key(channel_id), timeout=5, blocking_timeout=2):
+			frappe.cache().incr(get_version_key(channel_id))
+
+			data = frappe.cache().get_value(get_cache_key(channel_id))
+
+			if data is None:
+				return
+
+			has_old_messages = data["has_old_messages"]
+			messages = update(data["messages"], has_old_messages)
+
+			if len(messages) > LATEST_MESSAGES_CACHE_SIZE:
+				messages = messages[:LATEST_MESSAGES_CACHE_SIZE]
+				has_old_messages = True
+
+			frappe.cache().set_value(
+				get_cache_key(channel_id),
+				{"messages": messages, "has_old_messages": has_old_messages},
+			)
+	except LockError:
+		clear_latest_messages(channel_id)
+
+
+def get_message_dict(doc) -> frappe._dict:
+	"""
+	Serialize a message document in the same shape as the rows returned by the chat stream query
+	"""
+	message = frappe._dict()
+
+	for field in MESSAGE_FIELDS:
+		value = doc.get(field)
+		if isinstance(value, dict | list):
+			value = json.dumps(value)
+		message[field] = value
+
+	message.creation = get_datetime(message.creation)
+	message.modified = get_datetime(message.modified)
+
+	return message
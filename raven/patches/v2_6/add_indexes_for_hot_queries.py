@@ -0,0 +1,24 @@
+import frappe
+
+from raven.raven_channel_management.doctype.raven_channel_member.raven_channel_member import (
+	on_doctype_update as add_channel_member_indexes,
+)
+from raven.raven_messaging.doctype.raven_message.raven_message import (
+	on_doctype_update as add_message_indexes,
+)
+
+# Indexes added by earlier versions of this patch - the primary key (name) is already part of every secondary index
+REDUNDANT_MESSAGE_INDEXES = ("channel_id_creation_name_index", "channel_id_modified_name_index")
+
+
+def execute():
+	# Composite indexes for the chat stream, delta sync, threads, unread counts and timeline queries
+	add_message_indexes()
+	add_channel_member_indexes()
+
+	if frappe.db.db_type != "mariadb":
+		return
+
+	for index_name in REDUNDANT_MESSAGE_INDEXES:
+		if frappe.db.has_index("tabRaven Message", index_name):
+			frappe.db.sql_ddl(f"ALTER TABLE `tabRaven Message` DROP INDEX `{index_name}`")
@@ -96,3 +96,8 @@ class RavenSettings(Document):
 				frappe.throw(_("Please add the Google Service Account JSON Key"))
 			if not self.google_processor_location:
 				frappe.throw(_("Please select the Google Processor Location"))
+
+	def on_update(self):
+		from raven.ai.openai_client import clear_async_openai_clients
+
+		clear_async_openai_clients()
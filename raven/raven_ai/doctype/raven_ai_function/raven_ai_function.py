@@ -510,11 +510,19 @@ class RavenAIFunction(Document):
 		self.function_definition = json.dumps(function_definition, indent=4)
 
 	def on_update(self):
+		from raven.ai.agents_integration import clear_bot_cache
+		from raven.ai.tool_cache import clear_tool_cache
+
+		# Results cached with the previous configuration of the function are no longer valid
+		if self.reference_doctype:
+			clear_tool_cache(self.reference_doctype)
+
 		# Update all the bots that use this function
 
 		bots = frappe.get_all("Raven Bot Functions", filters={"function": self.name}, pluck="parent")
 
 		for bot in bots:
+			clear_bot_cache(bot)
 			bot = frappe.get_doc("Raven Bot", bot)
 			bot.update_openai_assistant()
 
@@ -38,6 +38,7 @@ class RavenBot(Document):
 		enable_file_search: DF.Check
 		file_sources: DF.Table[RavenAIBotFiles]
 		google_document_processor_id: DF.Data | None
+		history_token_budget: DF.Int
 		image: DF.AttachImage | None
 		instruction: DF.LongText | None
 		is_ai_bot: DF.Check
@@ -49,6 +50,7 @@ class RavenBot(Document):
 		openai_vector_store_id: DF.Data | None
 		raven_user: DF.Link | None
 		reasoning_effort: DF.Literal["low", "medium", "high"]
+		stream_response: DF.Check
 		temperature: DF.Float
 		top_p: DF.Float
 		use_google_document_parser: DF.Check
@@ -80,6 +82,10 @@ class RavenBot(Document):
 
 		TODO: Generate JSON files when a Standard Bot is created or updated
 		"""
+		from raven.ai.agents_integration import clear_bot_cache
+
+		clear_bot_cache(self.name)
+
 		if self.raven_user:
 			raven_user = frappe.get_doc("Raven User", self.raven_user)
 			raven_user.type = "Bot"
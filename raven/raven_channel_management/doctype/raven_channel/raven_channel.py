@@ -5,6 +5,7 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 
+from raven.message_cache import clear_latest_messages, update_message_fields
 from raven.utils import delete_channel_members_cache, get_raven_room
 
 
@@ -19,6 +20,8 @@ class RavenChannel(Document):
 
 		from raven.raven.doctype.raven_pinned_messages.raven_pinned_messages import RavenPinnedMessages
 
+		ai_thread_summary: DF.LongText | None
+		ai_thread_summary_until: DF.Datetime | None
 		channel_description: DF.SmallText | None
 		channel_name: DF.Data
 		is_ai_thread: DF.Check
@@ -46,10 +49,14 @@ class RavenChannel(Document):
 
 		# delete all messages when channel is deleted
 		frappe.db.delete("Raven Message", {"channel_id": self.name})
+		clear_latest_messages(self.name)
 
 		# delete all reactions when channel is deleted
 		frappe.db.delete("Raven Message Reaction", {"channel_id": self.name})
 
+		# delete all tombstones of deleted messages when channel is deleted
+		frappe.db.delete("Raven Message Tombstone", {"channel_id": self.name})
+
 		# Delete the pinned channels
 		frappe.db.delete("Raven Pinned Channels", {"channel_id": self.name})
 
@@ -70,6 +77,7 @@ class RavenChannel(Document):
 		if self.is_thread and frappe.db.exists("Raven Message", {"name": self.name}):
 			message_channel_id = frappe.get_cached_value("Raven Message", self.name, "channel_id")
 			frappe.db.set_value("Raven Message", self.name, "is_thread", 0)
+			update_message_fields(message_channel_id, self.name, {"is_thread": 0})
 			# Update the message which used to be a thread
 			frappe.publish_realtime(
 				"message_edited",
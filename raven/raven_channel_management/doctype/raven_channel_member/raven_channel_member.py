@@ -6,6 +6,7 @@ from frappe import _
 from frappe.model.document import Document
 
 from raven.notification import subscribe_user_to_topic, unsubscribe_user_to_topic
+from raven.unread_counts import reset_unread_count
 from raven.utils import delete_channel_members_cache
 
 
@@ -72,6 +73,7 @@ class RavenChannelMember(Document):
 		self.allow_notifications = 1
 
 	def after_delete(self):
+		reset_unread_count(self.channel_id, self.user_id)
 
 		member_name = frappe.get_cached_value("Raven User", self.user_id, "full_name")
 
@@ -272,3 +274,5 @@ def on_doctype_update():
 	"""
 	# Index the selector (channel or message type) first for faster queries (less rows to sort in the next step)
 	frappe.db.add_index("Raven Channel Member", ["channel_id", "user_id"])
+	# Unread counts, threads and "mark all as read" look up all memberships of a user
+	frappe.db.add_index("Raven Channel Member", ["user_id", "channel_id"])
@@ -10,13 +10,18 @@ from frappe.model.document import Document
 from frappe.utils import get_datetime, get_system_timezone
 from pytz import timezone, utc
 
-from raven.ai.ai import handle_ai_thread_message, handle_bot_dm
+from raven.ai.jobs import enqueue_ai_job
 from raven.api.raven_channel import get_peer_user
+from raven.message_cache import remove_message, upsert_message
 from raven.notification import (
 	send_notification_for_message,
 	send_notification_to_topic,
 	send_notification_to_user,
 )
+from raven.raven_messaging.doctype.raven_message_tombstone.raven_message_tombstone import (
+	create_tombstone,
+)
+from raven.unread_counts import clear_unread_counts_for_channel, increment_unread_counts
 from raven.utils import (
 	get_raven_room,
 	is_channel_member,
@@ -195,6 +200,7 @@ class RavenMessage(Document):
 		if self.message_type != "System":
 			last_message_details = self.set_last_message_timestamp()
 			self.publish_unread_count_event(last_message_details)
+			self.update_unread_counts()
 
 		if self.message_type == "Text":
 			self.handle_ai_message()
@@ -212,57 +218,35 @@ class RavenMessage(Document):
 		if not raven_settings.enable_ai_integration:
 			return
 
-		# Check if this channel is an AI Thread channel
-
 		channel_doc = frappe.get_cached_doc("Raven Channel", self.channel_id)
 
-		is_ai_thread = channel_doc.is_ai_thread
+		bot = get_ai_bot_for_channel(channel_doc)
 
-		if is_ai_thread:
-			frappe.enqueue(
-				method=handle_ai_thread_message,
+		if not bot:
+			return
+
+		# Check if this channel is an AI Thread channel
+		if channel_doc.is_ai_thread:
+			enqueue_ai_job(
+				"raven.ai.ai.handle_ai_thread_message",
+				bot=bot,
+				user=self.owner,
+				channel_id=self.channel_id,
+				job_name="handle_ai_thread_message",
 				message=self,
-				timeout=600,
 				channel=channel_doc,
-				at_front=True,
-				job_name="handle_ai_thread_message",
 			)
 
 			return
 
-		# If not a part of a AI Thread, then check if this is a DM to a bot - if yes, then we should create a new thread
-
-		is_dm = channel_doc.is_direct_message
-
-		# Only DMs to bots need to be handled (for now)
-
-		if not is_dm:
-			return
-
-		# Get the bot user
-		peer_user = get_peer_user(self.channel_id, is_dm)
-
-		if not peer_user or peer_user.get("type") != "Bot":
-			return
-
-		# Get the bot user doc
-		peer_user_doc = frappe.get_cached_doc("Raven User", peer_user.get("user_id"))
-
-		if peer_user_doc.type != "Bot" or not peer_user_doc.bot:
-			return
-
-		bot = frappe.get_cached_doc("Raven Bot", peer_user_doc.bot)
-
-		if not bot.is_ai_bot:
-			return
-
-		frappe.enqueue(
-			method=handle_bot_dm,
-			message=self,
+		# If not a part of a AI Thread, then this is a DM to a bot - a new thread is created
+		enqueue_ai_job(
+			"raven.ai.ai.handle_bot_dm",
 			bot=bot,
-			timeout=600,
+			user=self.owner,
+			channel_id=self.channel_id,
 			job_name="handle_bot_dm",
-			at_front=True,
+			message=self,
 		)
 
 	def set_last_message_timestamp(self):
@@ -363,6 +347,20 @@ class RavenMessage(Document):
 				room=get_raven_room(),
 			)
 
+	def update_unread_counts(self, deleted=False):
+		"""
+		Update the cached unread counts of the members of the channel (threads are not counted)
+		"""
+		if frappe.get_cached_value("Raven Channel", self.channel_id, "is_thread"):
+			return
+
+		if deleted:
+			# We don't know who has seen the deleted message, so the counts are recomputed on the next request
+			clear_unread_counts_for_channel(self.channel_id)
+		else:
+			# Bot messages are inserted in the session of the user who triggered them - they are unread for that user too
+			increment_unread_counts(self.channel_id, sender=None if self.is_bot_message else self.owner)
+
 	def add_mentioned_users_to_thread(self):
 		"""
 		Add the mentioned users to the thread if they are members of the parent channel but not in the thread
@@ -505,6 +503,10 @@ class RavenMessage(Document):
 		)
 
 	def after_delete(self):
+		remove_message(self.channel_id, self.name)
+		# Track the deletion so that clients syncing the channel can remove the message
+		create_tombstone(self.channel_id, self.name)
+
 		frappe.publish_realtime(
 			"message_deleted",
 			{
@@ -519,6 +521,7 @@ class RavenMessage(Document):
 
 		if self.message_type != "System":
 			self.publish_unread_count_event()
+			self.update_unread_counts(deleted=True)
 
 		# delete poll if the message is of type poll after deleting the message
 		if self.message_type == "Poll":
@@ -542,6 +545,8 @@ class RavenMessage(Document):
 		)
 
 	def on_update(self):
+		# Keep the cache of the latest messages in the channel up to date (on_update also runs on insert)
+		upsert_message(self)
 
 		# TEMP: this is a temp fix for the Desk interface
 		self.publish_deprecated_event_for_desk()
@@ -679,6 +684,14 @@ def on_doctype_update():
 	frappe.db.add_index("Raven Message", ["channel_id", "creation"])
 	frappe.db.add_index("Raven Message", ["message_type", "creation"])
 
+	# The chat stream paginates over (creation, name) and the delta sync over (modified, name) within a channel.
+	# Secondary indexes end with the primary key (name) in InnoDB, so name is not part of the indexes.
+	frappe.db.add_index("Raven Message", ["channel_id", "modified"])
+	# Thread reply counts and recent files filter on the message type within a channel
+	frappe.db.add_index("Raven Message", ["channel_id", "message_type", "creation"])
+	# Timeline content of a document
+	frappe.db.add_index("Raven Message", ["link_doctype", "link_document"])
+
 
 def get_milliseconds_since_epoch(timestamp: str) -> str:
 	"""
@@ -696,3 +709,35 @@ def get_milliseconds_since_epoch(timestamp: str) -> str:
 	# Get the timestamp in milliseconds since epoch for the UTC datetime
 	seconds_since_epoch = utc_datetime.timestamp()
 	return str(seconds_since_epoch * 1000)
+
+
+def get_ai_bot_for_channel(channel_doc):
+	"""
+	Get the bot which responds to messages in a channel - the bot of an AI thread or the AI bot in a DM.
+	Returns None if no AI bot responds in the channel.
+	"""
+	if channel_doc.is_ai_thread:
+		return frappe.get_cached_doc("Raven Bot", channel_doc.thread_bot)
+
+	# Only DMs to bots need to be handled (for now)
+	if not channel_doc.is_direct_message:
+		return None
+
+	# Get the bot user
+	peer_user = get_peer_user(channel_doc.name, channel_doc.is_direct_message)
+
+	if not peer_user or peer_user.get("type") != "Bot":
+		return None
+
+	# Get the bot user doc
+	peer_user_doc = frappe.get_cached_doc("Raven User", peer_user.get("user_id"))
+
+	if peer_user_doc.type != "Bot" or not peer_user_doc.bot:
+		return None
+
+	bot = frappe.get_cached_doc("Raven Bot", peer_user_doc.bot)
+
+	if not bot.is_ai_bot:
+		return None
+
+	return bot
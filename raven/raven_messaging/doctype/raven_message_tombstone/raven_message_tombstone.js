@@ -0,0 +1,8 @@
+// Copyright (c) 2026, The Commit Company and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Raven Message Tombstone", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,49 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, now_datetime
+
+# Number of days for which deleted messages are tracked for clients to sync
+TOMBSTONE_RETENTION_DAYS = 30
+
+
+class RavenMessageTombstone(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		channel_id: DF.Link
+		message_id: DF.Data
+	# end: auto-generated types
+
+	pass
+
+
+def create_tombstone(channel_id: str, message_id: str):
+	"""
+	Record that a message was deleted so that clients syncing the channel can remove it
+	"""
+	frappe.get_doc(
+		{"doctype": "Raven Message Tombstone", "channel_id": channel_id, "message_id": message_id}
+	).insert(ignore_permissions=True)
+
+
+def delete_old_tombstones():
+	"""
+	Scheduled job to delete tombstones older than the retention period.
+	Clients syncing from before the retention period need to refetch the channel.
+	"""
+	frappe.db.delete(
+		"Raven Message Tombstone",
+		{"creation": ("<", add_days(now_datetime(), -TOMBSTONE_RETENTION_DAYS))},
+	)
+
+
+def on_doctype_update():
+	frappe.db.add_index("Raven Message Tombstone", ["channel_id", "creation"])
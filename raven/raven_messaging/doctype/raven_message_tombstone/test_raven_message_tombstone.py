@@ -0,0 +1,82 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, now_datetime
+
+from raven.raven_messaging.doctype.raven_message_tombstone.raven_message_tombstone import (
+	TOMBSTONE_RETENTION_DAYS,
+	create_tombstone,
+	delete_old_tombstones,
+)
+
+EXTRA_TEST_RECORD_DEPENDENCIES = ["Raven Workspace"]
+
+CHANNEL_ID = "Public Workspace-test-tombstones"
+
+
+class TestRavenMessageTombstone(FrappeTestCase):
+	def setUp(self):
+		channel = frappe.get_doc(
+			{
+				"doctype": "Raven Channel",
+				"channel_name": "Test Tombstones",
+				"type": "Public",
+				"workspace": "Public Workspace",
+			}
+		)
+		channel.flags.do_not_add_member = True
+		channel.insert()
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_deleted_message_creates_tombstone(self):
+		message = frappe.get_doc(
+			{
+				"doctype": "Raven Message",
+				"channel_id": CHANNEL_ID,
+				"text": "Test Message",
+				"message_type": "Text",
+			}
+		).insert()
+
+		frappe.delete_doc("Raven Message", message.name)
+
+		self.assertTrue(
+			frappe.db.exists(
+				"Raven Message Tombstone", {"channel_id": CHANNEL_ID, "message_id": message.name}
+			)
+		)
+
+	def test_delete_old_tombstones(self):
+		"""
+		Tombstones older than the retention period are deleted, newer ones are kept
+		"""
+		create_tombstone(CHANNEL_ID, "old-message")
+		create_tombstone(CHANNEL_ID, "expiring-message")
+		create_tombstone(CHANNEL_ID, "new-message")
+
+		self.set_tombstone_age("old-message", TOMBSTONE_RETENTION_DAYS + 1)
+		self.set_tombstone_age("expiring-message", TOMBSTONE_RETENTION_DAYS - 1)
+
+		delete_old_tombstones()
+
+		self.assertEqual(
+			sorted(
+				frappe.get_all(
+					"Raven Message Tombstone", filters={"channel_id": CHANNEL_ID}, pluck="message_id"
+				)
+			),
+			["expiring-message", "new-message"],
+		)
+
+	def set_tombstone_age(self, message_id: str, days: int):
+		frappe.db.set_value(
+			"Raven Message Tombstone",
+			{"message_id": message_id},
+			"creation",
+			add_days(now_datetime(), -days),
+			update_modified=False,
+		)
@@ -0,0 +1,124 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.api.raven_channel import mark_all_messages_as_read
+from raven.utils import (
+	buffer_channel_visit,
+	flush_channel_visits,
+	get_channel_visits,
+	track_channel_visit,
+	write_channel_visits,
+)
+
+EXTRA_TEST_RECORD_DEPENDENCIES = ["User", "Raven User", "Raven Workspace"]
+
+CHANNEL_ID = "Public Workspace-test-channel-visits"
+USER = "test@example.com"
+
+
+class TestChannelVisits(IntegrationTestCase):
+	def setUp(self):
+		frappe.set_user("Administrator")
+
+		channel = frappe.get_doc(
+			{
+				"doctype": "Raven Channel",
+				"channel_name": "Test Channel Visits",
+				"type": "Public",
+				"workspace": "Public Workspace",
+			}
+		)
+		channel.flags.do_not_add_member = True
+		channel.insert()
+
+		self.member = frappe.get_doc(
+			{"doctype": "Raven Channel Member", "channel_id": CHANNEL_ID, "user_id": USER}
+		).insert()
+
+		# The flush commits - so the test records need to be committed and deleted in tearDown
+		frappe.db.commit()  # nosemgrep
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.delete_doc("Raven Channel", CHANNEL_ID, force=True)
+		frappe.db.commit()  # nosemgrep
+
+	def get_last_visit(self):
+		return frappe.db.get_value("Raven Channel Member", self.member.name, "last_visit")
+
+	def test_visit_is_buffered(self):
+		"""
+		Visits of members are buffered in the cache instead of being written to the database
+		"""
+		last_visit = self.get_last_visit()
+
+		track_channel_visit(CHANNEL_ID, user=USER)
+
+		self.assertIn(CHANNEL_ID, get_channel_visits(USER))
+		self.assertEqual(self.get_last_visit(), last_visit)
+
+	def test_flush_channel_visits(self):
+		"""
+		Buffered visits are written to the database by the scheduled job and removed from the cache
+		"""
+		track_channel_visit(CHANNEL_ID, user=USER)
+		timestamp = get_channel_visits(USER)[CHANNEL_ID]
+
+		flush_channel_visits()
+
+		self.assertNotIn(CHANNEL_ID, get_channel_visits(USER))
+		self.assertEqual(self.get_last_visit(), frappe.utils.get_datetime(timestamp))
+
+	def test_flush_keeps_visits_of_failed_flush(self):
+		"""
+		If writing the visits fails, they are kept and written by the next flush - merged with the newer visits
+		"""
+		buffer_channel_visit(CHANNEL_ID, USER, "2099-01-01 10:00:00.000000")
+
+		with patch("raven.utils.write_channel_visits", side_effect=frappe.QueryTimeoutError):
+			with self.assertRaises(frappe.QueryTimeoutError):
+				flush_channel_visits()
+
+		self.assertTrue(frappe.cache().sismember("raven:channel_visits_users", USER))
+		self.assertEqual(get_channel_visits(USER), {CHANNEL_ID: "2099-01-01 10:00:00.000000"})
+
+		# A newer and an older visit are buffered in the meantime - the newest one is written
+		buffer_channel_visit(CHANNEL_ID, USER, "2099-01-01 11:00:00.000000")
+		flush_channel_visits()
+
+		self.assertEqual(get_channel_visits(USER), {})
+		self.assertEqual(self.get_last_visit(), frappe.utils.get_datetime("2099-01-01 11:00:00"))
+
+		buffer_channel_visit(CHANNEL_ID, USER, "2099-01-01 09:00:00.000000")
+		flush_channel_visits()
+
+		self.assertEqual(self.get_last_visit(), frappe.utils.get_datetime("2099-01-01 11:00:00"))
+
+	def test_mark_all_messages_as_read_during_flush(self):
+		"""
+		Visits buffered before all messages were marked as read should not overwrite the newer last visit -
+		even if they were being flushed at the time
+		"""
+		older_visit = frappe.utils.now()
+		buffer_channel_visit(CHANNEL_ID, USER, older_visit)
+
+		# A flush is in progress - the visits were moved to the flushing hash
+		cache = frappe.cache()
+		cache.rename(
+			cache.make_key(f"raven:channel_visits:{USER}"),
+			cache.make_key(f"raven:channel_visits_flushing:{USER}"),
+		)
+
+		frappe.set_user(USER)
+		mark_all_messages_as_read([CHANNEL_ID])
+		last_visit = self.get_last_visit()
+
+		self.assertNotIn(CHANNEL_ID, get_channel_visits(USER))
+
+		# The flush had already read the older visit before it was cleared - and writes it now
+		write_channel_visits({self.member.name: older_visit})
+
+		self.assertEqual(self.get_last_visit(), last_visit)
+		cache.delete(cache.make_key(f"raven:channel_visits_flushing:{USER}"))
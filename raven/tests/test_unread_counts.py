@@ -0,0 +1,105 @@
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from raven.unread_counts import (
+	get_unread_counts,
+	get_unread_counts_from_db,
+	get_unread_counts_key,
+	reconcile_unread_counts,
+)
+
+EXTRA_TEST_RECORD_DEPENDENCIES = ["User", "Raven User", "Raven Workspace"]
+
+CHANNEL_ID = "Public Workspace-test-unread-counts"
+
+
+class TestUnreadCounts(IntegrationTestCase):
+	def setUp(self):
+		frappe.set_user("Administrator")
+
+		channel = frappe.get_doc(
+			{
+				"doctype": "Raven Channel",
+				"channel_name": "Test Unread Counts",
+				"type": "Public",
+				"workspace": "Public Workspace",
+			}
+		)
+		channel.flags.do_not_add_member = True
+		channel.insert()
+
+		for user in ["test@example.com", "test1@example.com"]:
+			frappe.get_doc(
+				{"doctype": "Raven Channel Member", "channel_id": CHANNEL_ID, "user_id": user}
+			).insert()
+
+		self.bot = frappe.get_doc({"doctype": "Raven Bot", "bot_name": "Test Unread Counts Bot"}).insert()
+		self.bot.reload()
+
+		# Populate the cached counts of both users
+		for user in ["test@example.com", "test1@example.com"]:
+			get_unread_counts(user)
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.db.rollback()
+
+	def send_message(self, text: str, is_bot_message: bool = False):
+		return frappe.get_doc(
+			{
+				"doctype": "Raven Message",
+				"channel_id": CHANNEL_ID,
+				"text": text,
+				"message_type": "Text",
+				"is_bot_message": 1 if is_bot_message else 0,
+				"bot": self.bot.raven_user if is_bot_message else None,
+			}
+		).insert(ignore_permissions=True)
+
+	def test_message_increments_counts_of_other_members(self):
+		"""
+		A message increments the unread count of the other members, but not of the sender
+		"""
+		frappe.set_user("test@example.com")
+		self.send_message("Hello")
+
+		self.assertEqual(get_unread_counts("test1@example.com").get(CHANNEL_ID), 1)
+		self.assertIsNone(get_unread_counts("test@example.com").get(CHANNEL_ID))
+
+	def test_bot_message_increments_count_of_session_user(self):
+		"""
+		Bot messages are inserted in the session of the user who triggered the bot - the message is unread for them as well
+		"""
+		frappe.set_user("test@example.com")
+		self.send_message("Hello from the bot", is_bot_message=True)
+
+		self.assertEqual(get_unread_counts("test@example.com").get(CHANNEL_ID), 1)
+		self.assertEqual(get_unread_counts("test1@example.com").get(CHANNEL_ID), 1)
+
+		# The cached counts should match the database
+		self.assertEqual(get_unread_counts_from_db("test@example.com").get(CHANNEL_ID), 1)
+
+	def test_deleted_message_recomputes_counts(self):
+		"""
+		Deleting a message drops the cached counts, which are then recomputed from the database
+		"""
+		frappe.set_user("test@example.com")
+		message = self.send_message("Hello")
+
+		frappe.set_user("Administrator")
+		frappe.delete_doc("Raven Message", message.name, ignore_permissions=True)
+
+		self.assertIsNone(get_unread_counts("test1@example.com").get(CHANNEL_ID))
+
+	def test_reconcile_unread_counts(self):
+		"""
+		Counts that drifted from the database are corrected by the scheduled job
+		"""
+		pipe = frappe.cache().pipeline()
+		pipe.hset(get_unread_counts_key("test1@example.com"), CHANNEL_ID, 42)
+		pipe.execute()
+		self.assertEqual(get_unread_counts("test1@example.com").get(CHANNEL_ID), 42)
+
+		reconcile_unread_counts()
+
+		self.assertIsNone(get_unread_counts("test1@example.com").get(CHANNEL_ID))
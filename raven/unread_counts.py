@@ -0,0 +1,169 @@
+import frappe
+from frappe.query_builder.functions import Coalesce, Count
+
+from raven.utils import get_channel_members, get_channel_visit_condition
+
+# Marker field in the hash of unread counts of a user.
+# Counts are only incremented for users whose hash is complete (i.e. was populated from the database)
+COMPLETE_MARKER = "__complete__"
+
+INCREMENT_IF_COMPLETE = """
+if redis.call('hexists', KEYS[1], ARGV[1]) == 1 then
+	return redis.call('hincrby', KEYS[1], ARGV[2], 1)
+end
+return nil
+"""
+
+
+def get_unread_counts_key(user: str) -> str:
+	# Raw redis commands are used for the counters (pickled values cannot be incremented), hence the key is prefixed with the site name
+	return frappe.cache().make_key(f"raven:unread_counts:{user}")
+
+
+def get_unread_counts(user: str = None) -> dict:
+	"""
+	Get the unread counts of all channels of a user as a map of channel ID -> unread count.
+
+	The counts are kept in a Redis hash per user and populated from the database on a cache miss.
+	"""
+	if not user:
+		user = frappe.session.user
+
+	pipe = frappe.cache().pipeline()
+	pipe.hgetall(get_unread_counts_key(user))
+	data = pipe.execute()[0]
+
+	if data and COMPLETE_MARKER.encode() in data:
+		return {
+			key.decode(): int(value)
+			for key, value in data.items()
+			if key.decode() != COMPLETE_MARKER and int(value) > 0
+		}
+
+	return populate_unread_counts(user)
+
+
+def populate_unread_counts(user: str) -> dict:
+	"""
+	Count the unread messages of a user in all channels from the database and store them in the cache
+	"""
+	counts = get_unread_counts_from_db(user)
+
+	key = get_unread_counts_key(user)
+
+	pipe = frappe.cache().pipeline()
+	pipe.delete(key)
+	pipe.hset(key, mapping={COMPLETE_MARKER: 1, **counts})
+	pipe.execute()
+
+	return counts
+
+
+def get_unread_counts_from_db(user: str) -> dict:
+	"""
+	Count the messages sent after the last visit of the user in every channel they are a member of
+	"""
+	channel_member = frappe.qb.DocType("Raven Channel Member")
+	message = frappe.qb.DocType("Raven Message")
+
+	query = (
+		frappe.qb.from_(channel_member)
+		.join(message)
+		.on(channel_member.channel_id == message.channel_id)
+		.where(channel_member.user_id == user)
+		.where(message.message_type != "System")
+		.where(
+			message.creation > Coalesce(channel_member.last_visit, "2000-11-11")
+		)  # Only count messages after the last visit for performance
+		.select(channel_member.channel_id, Count(message.name).as_("unread_count"))
+		.groupby(channel_member.channel_id)
+	)
+
+	# Visits to channels which are not yet written to the database
+	visit_condition = get_channel_visit_condition(message.channel_id, message.creation, user)
+	if visit_condition is not None:
+		query = query.where(visit_condition)
+
+	return {row.channel_id: row.unread_count for row in query.run(as_dict=True)}
+
+
+def increment_unread_counts(channel_id: str, sender: str = None):
+	"""
+	Increment the unread count of the channel for all members (except the sender) once the transaction is committed
+	"""
+	users = [
+		member.user_id
+		for member in get_channel_members(channel_id).values()
+		if member.user_id != sender and member.type != "Bot"
+	]
+
+	if not users:
+		return
+
+	def increment():
+		pipe = frappe.cache().pipeline()
+		for user in users:
+			pipe.eval(INCREMENT_IF_COMPLETE, 1, get_unread_counts_key(user), COMPLETE_MARKER, channel_id)
+		pipe.execute()
+
+	run_after_commit(users, increment)
+
+
+def reset_unread_count(channel_id: str, user: str):
+	"""
+	Reset the unread count of a channel for a user - for eg. when the user visits the channel or leaves it
+	"""
+	pipe = frappe.cache().pipeline()
+	pipe.hdel(get_unread_counts_key(user), channel_id)
+	pipe.execute()
+
+
+def reset_unread_counts(channel_ids: list, user: str):
+	"""
+	Reset the unread counts of multiple channels for a user - for eg. when all messages are marked as read
+	"""
+	pipe = frappe.cache().pipeline()
+	pipe.hdel(get_unread_counts_key(user), *channel_ids)
+	pipe.execute()
+
+
+def clear_unread_counts_for_channel(channel_id: str):
+	"""
+	Drop the cached unread counts of all members of a channel - for eg. when a message is deleted.
+	The counts are populated from the database again on the next request.
+	"""
+	users = [member.user_id for member in get_channel_members(channel_id).values()]
+
+	if not users:
+		return
+
+	run_after_commit(users, lambda: clear_unread_counts(users))
+
+
+def clear_unread_counts(users: list):
+	pipe = frappe.cache().pipeline()
+	for user in users:
+		pipe.delete(get_unread_counts_key(user))
+	pipe.execute()
+
+
+def run_after_commit(users: list, callback):
+	if frappe.flags.in_test:
+		# Transactions are not committed in tests - update the counts right away and drop them if the transaction is rolled back
+		callback()
+		frappe.db.after_rollback.add(lambda: clear_unread_counts(users))
+		return
+
+	frappe.db.after_commit.add(callback)
+
+
+def reconcile_unread_counts():
+	"""
+	Scheduled job to correct the cached unread counts against the database.
+
+	Counts can drift if a request is interrupted between committing a message and updating the counters.
+	"""
+	for key in frappe.cache().get_keys("raven:unread_counts:"):
+		user = key.decode().split("raven:unread_counts:", 1)[1]
+		populate_unread_counts(user)
+
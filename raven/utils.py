@@ -1,4 +1,13 @@
+import base64
+import hashlib
+import hmac
+import json
+
 import frappe
+import redis
+from frappe import _
+from frappe.utils.password import get_encryption_key
+from pypika.terms import Case
 
 
 def get_raven_room():
@@ -15,6 +24,9 @@ def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_u
 	"""
 	Track the last visit of the user to the channel.
 	If the user is not a member of the channel, create a new member record
+
+	For existing members, the last visit is buffered in the cache and written to the database in batches
+	by `flush_channel_visits` - so that read requests do not need to write to the database.
 	"""
 
 	if not user:
@@ -27,7 +39,7 @@ def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_u
 
 	if channel_member:
 		# Update the last visit
-		frappe.db.set_value("Raven Channel Member", channel_member["name"], "last_visit", now)
+		buffer_channel_visit(channel_id, user, now)
 
 	# Else if the user is not a member of the channel and the channel is open, create a new member record
 	elif frappe.get_cached_value("Raven Channel", channel_id, "type") == "Open":
@@ -40,9 +52,14 @@ def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_u
 			}
 		).insert()
 
-	# Need to commit the changes to the database if the request is a GET request
-	if commit:
-		frappe.db.commit()  # nosempgrep
+		# Need to commit the changes to the database if the request is a GET request
+		if commit:
+			frappe.db.commit()  # nosempgrep
+
+	# The user has seen all messages in the channel
+	from raven.unread_counts import reset_unread_count
+
+	reset_unread_count(channel_id, user)
 
 	if publish_event_for_user:
 		frappe.publish_realtime(
@@ -52,6 +69,256 @@ def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_u
 		)
 
 
+def buffer_channel_visit(channel_id: str, user: str, timestamp: str):
+	"""
+	Record the last visit of a user to a channel in the cache
+	"""
+	frappe.cache().hset(f"raven:channel_visits:{user}", channel_id, timestamp)
+	frappe.cache().sadd("raven:channel_visits_users", user)
+
+
+def clear_channel_visits(channel_ids: list, user: str):
+	"""
+	Remove buffered visits of a user to channels - for eg. when the last visit was written to the database directly
+	"""
+	pipe = frappe.cache().pipeline()
+	pipe.hdel(frappe.cache().make_key(f"raven:channel_visits:{user}"), *channel_ids)
+	# Visits which are being flushed as well - `flush_channel_visits` also never moves the last visit back in time
+	pipe.hdel(frappe.cache().make_key(f"raven:channel_visits_flushing:{user}"), *channel_ids)
+	pipe.execute()
+
+
+def get_channel_visits(user: str = None) -> dict:
+	"""
+	Get the visits of a user which are buffered and not yet written to the database as a map of channel ID -> timestamp
+	"""
+	if not user:
+		user = frappe.session.user
+
+	# Visits which are being flushed are also included since they might not be committed yet
+	visits = frappe.cache().hgetall(f"raven:channel_visits_flushing:{user}") or {}
+
+	for channel_id, timestamp in (frappe.cache().hgetall(f"raven:channel_visits:{user}") or {}).items():
+		visits[channel_id] = max(timestamp, visits.get(channel_id, timestamp))
+
+	return {
+		channel_id.decode() if isinstance(channel_id, bytes) else channel_id: timestamp
+		for channel_id, timestamp in visits.items()
+	}
+
+
+def get_channel_visit_condition(channel_field, timestamp_field, user: str = None):
+	"""
+	Queries that compare timestamps with the `last_visit` of a channel member in the database need to take
+	the buffered visits into account as well.
+
+	Returns a condition that excludes rows of a channel with a timestamp before the buffered visit of the user to that channel,
+	or None if there are no buffered visits.
+	"""
+	condition = None
+
+	for channel_id, timestamp in get_channel_visits(user).items():
+		channel_condition = (channel_field != channel_id) | (timestamp_field > timestamp)
+		condition = channel_condition if condition is None else condition & channel_condition
+
+	return condition
+
+
+def flush_channel_visits():
+	"""
+	Scheduled job to write the buffered visits of users to channels to the database in a single batch
+	"""
+	cache = frappe.cache()
+
+	try:
+		# Flushes should not overlap - one flush could delete the visits that the other one has not written yet
+		with cache.lock(cache.make_key("raven:channel_visits_flush_lock"), timeout=600, blocking_timeout=0):
+			_flush_channel_visits()
+	except redis.exceptions.LockError:
+		pass
+
+
+def _flush_channel_visits():
+	cache = frappe.cache()
+	updates = {}
+	users = []
+
+	while user := cache.spop("raven:channel_visits_users"):
+		user = user.decode() if isinstance(user, bytes) else user
+		users.append(user)
+
+		# Move the visits to another key so that new visits are buffered while we are writing these
+		move_channel_visits_to_flushing(user)
+
+		visits = cache.hgetall(f"raven:channel_visits_flushing:{user}") or {}
+
+		for channel_id, timestamp in visits.items():
+			channel_id = channel_id.decode() if isinstance(channel_id, bytes) else channel_id
+			channel_member = get_channel_member(channel_id, user)
+			if channel_member:
+				updates[channel_member["name"]] = timestamp
+
+	try:
+		if updates:
+			write_channel_visits(updates)
+			frappe.db.commit()  # nosemgrep
+	except Exception:
+		# The visits are still in the flushing keys - they are retried by the next flush
+		frappe.db.rollback()
+		if users:
+			cache.sadd("raven:channel_visits_users", *users)
+		raise
+
+	# Delete the flushed visits only once they are committed
+	if users:
+		cache.delete(*(cache.make_key(f"raven:channel_visits_flushing:{user}") for user in users))
+
+
+def move_channel_visits_to_flushing(user: str):
+	"""
+	Move the buffered visits of a user to the flushing key.
+
+	Visits left in the flushing key by a flush which failed are kept - the buffered visits are merged into them.
+	"""
+	cache = frappe.cache()
+	buffered_key = cache.make_key(f"raven:channel_visits:{user}")
+	flushing_key = cache.make_key(f"raven:channel_visits_flushing:{user}")
+
+	try:
+		if cache.renamenx(buffered_key, flushing_key):
+			return
+
+		# Move the buffered visits out of the way first, so that new visits are not lost while merging
+		cache.rename(buffered_key, cache.make_key(f"raven:channel_visits_merging:{user}"))
+	except redis.exceptions.ResponseError:
+		# No visits were buffered for the user
+		return
+
+	flushing = {
+		channel_id.decode() if isinstance(channel_id, bytes) else channel_id: timestamp
+		for channel_id, timestamp in (cache.hgetall(f"raven:channel_visits_flushing:{user}") or {}).items()
+	}
+
+	for channel_id, timestamp in (cache.hgetall(f"raven:channel_visits_merging:{user}") or {}).items():
+		channel_id = channel_id.decode() if isinstance(channel_id, bytes) else channel_id
+		cache.hset(
+			f"raven:channel_visits_flushing:{user}",
+			channel_id,
+			max(timestamp, flushing.get(channel_id, timestamp)),
+		)
+
+	cache.delete(cache.make_key(f"raven:channel_visits_merging:{user}"))
+
+
+def write_channel_visits(visits: dict):
+	"""
+	Write the last visits (channel member -> timestamp) to the database in a single statement.
+
+	A last visit is only moved forward - the member might have been marked as read (with a newer timestamp)
+	after the visit was buffered.
+	"""
+	channel_member = frappe.qb.DocType("Raven Channel Member")
+
+	last_visit = Case()
+	condition = None
+
+	for member, timestamp in visits.items():
+		last_visit = last_visit.when(channel_member.name == member, timestamp)
+
+		member_condition = (channel_member.name == member) & (
+			channel_member.last_visit.isnull() | (channel_member.last_visit < timestamp)
+		)
+		condition = member_condition if condition is None else condition | member_condition
+
+	frappe.qb.update(channel_member).set(channel_member.last_visit, last_visit).where(condition).run()
+
+
+def get_paginated_results(query, limit: int):
+	"""
+	Run a paginated query and check whether more rows are available after this page.
+
+	The query is run with a limit of `limit + 1` - if the extra row comes back, we know that there are more rows
+	without having to fire a second query. The extra row is dropped from the results.
+
+	Returns a tuple of (rows, has_more)
+	"""
+	limit = frappe.utils.cint(limit)
+	rows = query.limit(limit + 1).run(as_dict=True)
+
+	has_more = len(rows) > limit
+
+	return rows[:limit], has_more
+
+
+def get_keyset_condition(
+	table,
+	from_timestamp,
+	from_name: str,
+	older: bool = True,
+	inclusive=False,
+	timestamp_field: str = "creation",
+):
+	"""
+	Condition for keyset pagination over (creation, name) of a table.
+
+	If `older` is set, rows before the cursor are matched, else rows after the cursor.
+	If `inclusive` is set, the row at the cursor is matched as well.
+	`timestamp_field` can be set to paginate over another timestamp - for eg. (modified, name)
+
+	The query using this condition should be ordered by the timestamp and name in the same direction.
+	"""
+	timestamp = table.field(timestamp_field)
+
+	if older:
+		name_condition = table.name <= from_name if inclusive else table.name < from_name
+		return (timestamp < from_timestamp) | ((timestamp == from_timestamp) & name_condition)
+
+	name_condition = table.name >= from_name if inclusive else table.name > from_name
+	return (timestamp > from_timestamp) | ((timestamp == from_timestamp) & name_condition)
+
+
+def encode_cursor(creation, name: str) -> str:
+	"""
+	Encode the (creation, name) of a row into an opaque, signed cursor for keyset pagination.
+
+	The client does not need to know what is inside the cursor - it just passes it back to fetch the next page.
+	"""
+	payload = json.dumps([str(creation), name], separators=(",", ":"))
+	payload = base64.urlsafe_b64encode(payload.encode()).decode()
+
+	return f"{payload}.{_get_cursor_signature(payload)}"
+
+
+def decode_cursor(cursor: str):
+	"""
+	Decode a cursor created by `encode_cursor` and return the (creation, name) tuple.
+
+	Throws a validation error if the cursor was tampered with or is malformed.
+	"""
+	try:
+		payload, signature = cursor.rsplit(".", 1)
+	except (AttributeError, ValueError):
+		frappe.throw(_("Invalid cursor"), frappe.ValidationError)
+
+	# Compared as bytes - compare_digest does not accept strings with non ASCII characters
+	if not hmac.compare_digest(
+		signature.encode("utf-8", "replace"), _get_cursor_signature(payload).encode()
+	):
+		frappe.throw(_("Invalid cursor"), frappe.ValidationError)
+
+	try:
+		creation, name = json.loads(base64.urlsafe_b64decode(payload.encode()))
+	except (TypeError, ValueError):
+		frappe.throw(_("Invalid cursor"), frappe.ValidationError)
+
+	return frappe.utils.get_datetime(creation), name
+
+
+def _get_cursor_signature(payload: str) -> str:
+	key = get_encryption_key().encode()
+	return hmac.new(key, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
 # Workspace Members
 def get_workspace_members(workspace_id: str):
 	"""